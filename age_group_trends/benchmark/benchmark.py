@@ -0,0 +1,361 @@
+# standard
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+# external
+import polars as pl
+import plotly
+from polars import col
+from polars.testing import assert_frame_equal
+# local
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+import clean_data
+import dimensions
+import main
+import pipeline
+import plot_data
+import prepare_data
+import render
+from generate_data import generate_data
+
+
+#########################
+# Functions and classes #
+#########################
+
+DEFAULT_BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+DEFAULT_REGRESSION_THRESHOLD = 1.25
+# ^ A benchmark is a regression if its median time is over threshold * baseline median time
+STARTUP_SCRIPT = """
+import sys
+sys.path.insert(0, {src_dir!r})
+import main
+import pipeline
+pipeline.run_pipeline({{**main.PIPELINE_CONFIG, **{config!r}}})
+"""
+# ^ Runs the pipeline in a new interpreter, so that startup (imports) is included in the time
+
+
+def time_function(function: Callable, repeats: int) -> dict:
+    """
+    Run function repeats times (after one warm-up run) and return timing statistics in seconds.
+    """
+    function()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times += [time.perf_counter() - start]
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "max": max(times),
+        "repeats": repeats
+    }
+
+
+def run_startup(config: dict) -> None:
+    """
+    Run the pipeline with config (merged over main.PIPELINE_CONFIG) in a new Python process.
+    """
+    script = STARTUP_SCRIPT.format(src_dir=SRC_DIR, config=config)
+    subprocess.run([sys.executable, "-c", script], check=True, capture_output=True)
+
+
+def get_benchmarks(raw_dir: str, output_dir: str) -> dict[str, Callable]:
+    """
+    Get benchmark functions for each public function of clean_data, prepare_data and plot_data and the full pipeline.
+    Inputs of each function are prepared from the raw data in raw_dir beforehand, so that only the function itself is timed.
+    Lazy functions are timed including collect.
+    Startup benchmarks run the pipeline in a new process in data-only mode and with plot figures (without rendering).
+    """
+    age_group_raw_paths = os.path.join(raw_dir, "1.11.X Vanuseklassid + uuend_data_*.csv")
+    regeneration_cutting_raw_path = os.path.join(raw_dir, "3.2.2.X Raiete ajalugu.csv")
+    translations = main.TRANSLATION_MAP
+    aggregation_map = main.AGE_GROUP_AGGREGATION_MAP
+    threshold = main.REGENERATION_CUTTING_AGE_THRESHOLD
+    age_group_dtype = dimensions.get_age_group_enum(aggregation_map)
+    age_group_dimension = dimensions.get_age_group_dimension(aggregation_map)
+    settings = {
+        **main.PIPELINE_CONFIG,
+        "root_dir": output_dir,
+        "cache_dir": None,
+        "storage_formats": ["parquet"]
+    }
+
+    # Prepare function inputs
+    age_group_raw = clean_data.scan_raw_data(age_group_raw_paths).collect().lazy()
+    regeneration_cutting_raw = clean_data.scan_raw_data(regeneration_cutting_raw_path).collect().lazy()
+    age_group_cleaned = clean_data.clean_age_group_data(age_group_raw, translations, age_group_dtype, dimensions.SPECIES_DTYPE, dimensions.OWNER_DTYPE).collect().lazy()
+    clean = pipeline.clean_raw_data(age_group_raw_paths, regeneration_cutting_raw_path, translations, aggregation_map)
+    age_group_clean = clean["age_group"]
+    regeneration_cutting_clean = clean["regeneration_cutting"]
+    year_min = age_group_clean["YEAR"].min()
+    year_max = age_group_clean["YEAR"].max()
+
+    regeneration_cutting_plot = pipeline.prepare_regeneration_cutting_plot_data(regeneration_cutting_clean, year_min, year_max)
+    regeneration_cutting_all = pl.concat([regeneration_cutting_plot["protected"], regeneration_cutting_plot["production"]])
+    age_group_species = age_group_clean.filter(col("DOMINANT_SPECIES") == "all")
+    age_group_known = age_group_species.filter(col("AGE_GROUP") != "unknown")
+    age_group_unknown = age_group_species.filter(col("AGE_GROUP") == "unknown")
+    age_group_unknown_added = prepare_data.add_unknown_data(age_group_known, age_group_unknown)
+    age_group_aggregated = prepare_data.aggregate_age_groups(age_group_unknown_added, aggregation_map)
+    age_group_adjusted = prepare_data.subtract_regeneration_cutting(age_group_aggregated, regeneration_cutting_all, threshold, age_group_dimension)
+    production_age_group = age_group_adjusted.filter(col("TYPE") == "production")
+    sweep_aggregation_maps = [aggregation_map, {key: "0..." if value == "0...20" else value for key, value in aggregation_map.items()}]
+    sweep_age_group_dtype = dimensions.get_age_group_enum(*sweep_aggregation_maps)
+    sweep_age_group_dimension = dimensions.get_age_group_dimension(aggregation_map, sweep_age_group_dtype)
+    sweep_age_group_unknown_added = age_group_unknown_added.with_columns(col("AGE_GROUP").cast(pl.String).cast(sweep_age_group_dtype))
+    sweep_thresholds = list(range(10, 135, 5))
+    sweep_age_group_aggregated = prepare_data.aggregate_age_groups_sweep(sweep_age_group_unknown_added, sweep_aggregation_maps)
+
+    areas_plot = pipeline.prepare_areas_plot_data(age_group_clean, "all", aggregation_map, regeneration_cutting_plot, threshold)
+    areas_data = pipeline.prepare_areas_data(age_group_clean, aggregation_map, regeneration_cutting_plot, threshold)
+    production_areas = areas_plot["production"].to_dict(as_series=False)
+    production_areas_by_age_group = {
+        key: value for key, value in production_areas.items()
+        if key not in pipeline.NON_AGE_GROUP_FIELDS
+    }
+    colours = plot_data.get_colours(len(production_areas_by_age_group), "algae")
+    colours_by_age_group = dict(zip(production_areas_by_age_group.keys(), colours))
+    traces = pipeline.get_traces(areas_plot, regeneration_cutting_plot, settings["plot_parameters"], "algae")
+    layout = pipeline.get_plot_layout(settings["plot_titles"]["all"], settings["plot_parameters"], "algae")
+    figure = plot_data.get_figure(traces, layout)
+    figure_dict = plot_data.get_figure_dict(traces, layout)
+    plot_path = os.path.join(output_dir, "plot.png")
+    render_cache_dir = os.path.join(output_dir, "render_cache")
+    os.makedirs(output_dir, exist_ok=True)
+    render.start_kaleido()
+
+    startup_config = {
+        "root_dir": output_dir,
+        "age_group_raw_paths": age_group_raw_paths,
+        "regeneration_cutting_raw_path": regeneration_cutting_raw_path,
+        "tree_species": ["all"],
+        "process_count": 1,
+        "cache_dir": None,
+        "storage_formats": ["csv"],
+        "render": False
+    }
+
+    def run_pipeline() -> None:
+        clean = pipeline.clean_raw_data(age_group_raw_paths, regeneration_cutting_raw_path, translations, aggregation_map)
+        areas, regeneration_cutting = pipeline.prepare_stage(clean, settings)
+        for tree_species in clean["age_group"]["DOMINANT_SPECIES"].unique().sort():
+            if tree_species not in settings["plot_save_paths"]:
+                continue
+            out = pipeline.process_species(tree_species, areas, regeneration_cutting, settings)
+            render.render_figure(out["figure"], os.path.join(output_dir, os.path.basename(out["plot_save_path"])))
+
+    benchmarks = {
+        # clean_data
+        "clean_data.scan_raw_data": lambda: clean_data.scan_raw_data(age_group_raw_paths).collect(),
+        "clean_data.clean_age_group_data": lambda: clean_data.clean_age_group_data(age_group_raw, translations, age_group_dtype, dimensions.SPECIES_DTYPE, dimensions.OWNER_DTYPE).collect(),
+        "clean_data.combine_all_and_production_data": lambda: clean_data.combine_all_and_production_data(age_group_cleaned).collect(),
+        "clean_data.clean_regeneration_cutting_data": lambda: clean_data.clean_regeneration_cutting_data(regeneration_cutting_raw).collect(),
+        # prepare_data
+        "prepare_data.align_regeneration_cutting_data": lambda: prepare_data.align_regeneration_cutting_data(regeneration_cutting_clean, year_min, year_max, "production"),
+        "prepare_data.add_unknown_data": lambda: prepare_data.add_unknown_data(age_group_known, age_group_unknown),
+        "prepare_data.aggregate_age_groups": lambda: prepare_data.aggregate_age_groups(age_group_unknown_added, aggregation_map),
+        "prepare_data.subtract_regeneration_cutting": lambda: prepare_data.subtract_regeneration_cutting(age_group_aggregated, regeneration_cutting_all, threshold, age_group_dimension),
+        "prepare_data.get_areas": lambda: prepare_data.get_areas(production_age_group),
+        "prepare_data.prepare_areas": lambda: prepare_data.prepare_areas(age_group_species.lazy(), aggregation_map, age_group_dimension, regeneration_cutting_all.lazy(), threshold).collect(),
+        "prepare_data.aggregate_age_groups_sweep": lambda: prepare_data.aggregate_age_groups_sweep(sweep_age_group_unknown_added, sweep_aggregation_maps),
+        "prepare_data.subtract_regeneration_cutting_sweep": lambda: prepare_data.subtract_regeneration_cutting_sweep(sweep_age_group_aggregated, regeneration_cutting_all, sweep_thresholds, sweep_age_group_dimension),
+        # plot_data
+        "plot_data.rgb_to_hex": lambda: plot_data.rgb_to_hex("rgb(10, 20, 30)"),
+        "plot_data.get_colorscale_positions": lambda: plot_data.get_colorscale_positions(10),
+        "plot_data.get_colours": lambda: plot_data.get_colours(10, "algae"),
+        "plot_data.get_legend_traces": lambda: plot_data.get_legend_traces(list(production_areas_by_age_group.keys()), colours),
+        "plot_data.get_area_traces": lambda: plot_data.get_area_traces("production", production_areas["YEAR"], production_areas_by_age_group, colours_by_age_group),
+        "plot_data.get_legend_trace_dicts": lambda: plot_data.get_legend_trace_dicts(list(production_areas_by_age_group.keys()), colours),
+        "plot_data.get_area_trace_dicts": lambda: plot_data.get_area_trace_dicts("production", areas_plot["production"]["YEAR"], areas_plot["production"].select(production_areas_by_age_group.keys()), colours_by_age_group),
+        "plot_data.get_layout": lambda: plot_data.get_layout("title", "x", "y", "legend", "source"),
+        "plot_data.apply_colour_to_substring": lambda: plot_data.apply_colour_to_substring(main.PLOT_TITLES["all"]["text"], "majandatava", "#000000"),
+        "plot_data.get_figure": lambda: plot_data.get_figure(traces, layout),
+        "plot_data.get_figure_dict": lambda: plot_data.get_figure_dict(traces, layout),
+        "plot_data.get_figure_dict_validated": lambda: plot_data.get_figure_dict(traces, layout, validate=True),
+        "plot_data.save_plot": lambda: plot_data.save_plot(figure, plot_path),
+        "render.get_figure_key": lambda: render.get_figure_key(figure_dict, "png"),
+        "render.render_figure_cached": lambda: render.render_figure_cached(figure_dict, plot_path, "png", render_cache_dir),
+        "pipeline.prepare_areas_data": lambda: pipeline.prepare_areas_data(age_group_clean, aggregation_map, regeneration_cutting_plot, threshold),
+        "pipeline.get_areas_all_slices": lambda: prepare_data.get_areas(areas_data),
+        "pipeline.get_traces": lambda: pipeline.get_traces(areas_plot, regeneration_cutting_plot, settings["plot_parameters"], "algae"),
+        # full pipeline
+        "pipeline.prepare_areas_sweep_data": lambda: pipeline.prepare_areas_sweep_data(age_group_clean, "all", sweep_aggregation_maps, regeneration_cutting_plot, sweep_thresholds),
+        "pipeline.full": run_pipeline,
+        # startup (new process)
+        "startup.data_only": lambda: run_startup({**startup_config, "plot": False}),
+        "startup.plot": lambda: run_startup({**startup_config, "plot": True})
+    }
+    return benchmarks
+
+
+def check_correctness(raw_dir: str) -> list[str]:
+    """
+    Check that optimized implementations give the same result as the reference step functions on the raw data in raw_dir:
+    the fused prepare query (prepare_data.prepare_areas) against add_unknown_data, aggregate_age_groups
+    and subtract_regeneration_cutting in sequence, and the figure fast path (plot_data.get_figure_dict)
+    against the figure validated by plotly.
+    Return names of failed checks.
+    """
+    aggregation_map = main.AGE_GROUP_AGGREGATION_MAP
+    threshold = main.REGENERATION_CUTTING_AGE_THRESHOLD
+    clean = pipeline.clean_raw_data(
+        os.path.join(raw_dir, "1.11.X Vanuseklassid + uuend_data_*.csv"),
+        os.path.join(raw_dir, "3.2.2.X Raiete ajalugu.csv"),
+        main.TRANSLATION_MAP,
+        aggregation_map
+    )
+    age_group_clean = clean["age_group"]
+    regeneration_cutting_plot = pipeline.prepare_regeneration_cutting_plot_data(
+        clean["regeneration_cutting"],
+        age_group_clean["YEAR"].min(),
+        age_group_clean["YEAR"].max()
+    )
+    age_group_known = age_group_clean.filter(col("AGE_GROUP") != dimensions.UNKNOWN_AGE_GROUP)
+    age_group_unknown = age_group_clean.filter(col("AGE_GROUP") == dimensions.UNKNOWN_AGE_GROUP)
+    slice_filter = pipeline.get_slice_filter(pipeline.REGENERATION_CUTTING_SLICE)
+    sort_fields = ["DOMINANT_SPECIES", "OWNER", "TYPE", "YEAR", "AGE_GROUP"]
+    plot_parameters = main.PLOT_PARAMETERS
+    areas_plot = pipeline.prepare_areas_plot_data(age_group_clean, "all", aggregation_map, regeneration_cutting_plot, threshold)
+    traces = pipeline.get_traces(areas_plot, regeneration_cutting_plot, plot_parameters, "algae")
+    layout = pipeline.get_plot_layout(main.PLOT_TITLES["all"], plot_parameters, "algae")
+
+    checks = {
+        "prepare_data.prepare_areas": (
+            lambda: (
+                prepare_data.add_unknown_data(age_group_known, age_group_unknown)
+                .pipe(prepare_data.aggregate_age_groups, aggregation_map)
+                .pipe(
+                    prepare_data.subtract_regeneration_cutting,
+                    pl.concat([regeneration_cutting_plot["protected"], regeneration_cutting_plot["production"]]),
+                    threshold,
+                    dimensions.get_age_group_dimension(aggregation_map),
+                    slice_filter
+                )
+                .sort(sort_fields)
+            ),
+            lambda: pipeline.prepare_areas_data(age_group_clean, aggregation_map, regeneration_cutting_plot, threshold)
+        ),
+        "plot_data.get_figure_dict": (
+            lambda: plot_data.get_figure_dict(traces, layout, validate=True),
+            lambda: plot_data.get_figure_dict(traces, layout)
+        )
+    }
+    failed = []
+    for name, (reference, optimized) in checks.items():
+        try:
+            optimized_result, reference_result = optimized(), reference()
+            if isinstance(reference_result, pl.DataFrame):
+                assert_frame_equal(optimized_result, reference_result, check_exact=True)
+            else:
+                # Figures are compared in their json serialization (e.g. arrays are lists or typed arrays in both)
+                optimized_json = json.loads(plotly.io.to_json(optimized_result, validate=False))
+                reference_json = json.loads(plotly.io.to_json(reference_result, validate=False))
+                assert optimized_json == reference_json, "figures are not equal"
+        except AssertionError as error:
+            print(f"INCORRECT {name}: {error}")
+            failed += [name]
+    return failed
+
+
+def get_environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "polars": pl.__version__,
+        "plotly": plotly.__version__
+    }
+
+
+def run_benchmarks(scale: dict, repeats: int, pattern: str | None = None) -> dict:
+    """
+    Generate synthetic raw data at input scale, check correctness of optimized implementations
+    and time all benchmarks (optionally only names containing pattern).
+    Return results with environment and scale info and names of failed correctness checks.
+    """
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        raw_dir = os.path.join(temporary_dir, "raw")
+        output_dir = os.path.join(temporary_dir, "output")
+        generate_data(raw_dir, **scale)
+        failed_checks = check_correctness(raw_dir)
+        benchmarks = get_benchmarks(raw_dir, output_dir)
+        results = {}
+        for name, function in benchmarks.items():
+            if pattern is not None and pattern not in name:
+                continue
+            results[name] = time_function(function, repeats)
+            print(f"{name:<50} median {results[name]['median'] * 1000:10.3f} ms")
+    return {"environment": get_environment(), "scale": scale, "results": results, "failed_checks": failed_checks}
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Get names of benchmarks whose median time is over threshold * baseline median time.
+    """
+    regressions = []
+    for name, result in results["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None:
+            continue
+        ratio = result["median"] / baseline_result["median"]
+        if ratio > threshold:
+            regressions += [name]
+            print(f"REGRESSION {name}: {ratio:.2f}x baseline median")
+    return regressions
+
+
+def get_baseline_path(baseline_dir: str, scale: dict) -> str:
+    scale_name = "_".join(f"{key}{value}" for key, value in scale.items())
+    return os.path.join(baseline_dir, f"baseline_{scale_name}.json")
+
+
+##########
+# Script #
+##########
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic data.")
+    parser.add_argument("--years", type=int, default=25)
+    parser.add_argument("--species", type=int, default=8)
+    parser.add_argument("--owners", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--filter", default=None, help="Only run benchmarks with names containing this string")
+    parser.add_argument("--baseline-dir", default=DEFAULT_BASELINE_DIR)
+    parser.add_argument("--save-baseline", action="store_true", help="Save results as the baseline for this scale")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    arguments = parser.parse_args()
+
+    scale = {
+        "years": arguments.years,
+        "species": arguments.species,
+        "owners": arguments.owners
+    }
+    results = run_benchmarks(scale, arguments.repeats, arguments.filter)
+    if results["failed_checks"]:
+        sys.exit(1)
+    baseline_path = get_baseline_path(arguments.baseline_dir, scale)
+
+    if arguments.save_baseline:
+        os.makedirs(arguments.baseline_dir, exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved baseline to {baseline_path}")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare_to_baseline(results, baseline, arguments.threshold):
+            sys.exit(1)
+        print(f"No regressions compared to {baseline_path}")
+    else:
+        print(f"No baseline for this scale ({baseline_path}). Save one with --save-baseline")
@@ -0,0 +1,168 @@
+# standard
+import argparse
+import os
+import random
+
+
+#########################
+# Functions and classes #
+#########################
+
+AGE_GROUP_FILE_NAME = "1.11.X Vanuseklassid + uuend_data_{species}_{type}.csv"
+REGENERATION_CUTTING_FILE_NAME = "3.2.2.X Raiete ajalugu.csv"
+AGE_GROUP_FIELDS = [
+    "Aasta", "Majanduskategooria", "Omand", "Meetrik", "Enamuspuuliik",
+    "Kaitsepõhjus", "Laadimise ajatempel aruandele", "Meetriku väärtus"
+]
+REGENERATION_CUTTING_FIELDS = [
+    "Omand", "Raie aasta", "Meetrik", "Tüübi grupp",
+    "Kaitsepõhjus", "Laadimise ajatempel aruandele", "Meetriku väärtus"
+]
+LOAD_TIMESTAMP = "27.02.2025 13:21:59"
+MANAGEMENT_CATEGORIES = {
+    "all":          "Kogu metsamaa",
+    "production":   "Majandatav metsamaa"
+}
+SPECIES = {
+    "all":          "Kokku",
+    "aspen":        "Haab",
+    "birch":        "Kask",
+    "black_alder":  "Sanglepp",
+    "grey_alder":   "Hall lepp",
+    "other":        "Teised",
+    "pine":         "Mänd",
+    "spruce":       "Kuusk"
+}
+OWNERS = ["Kokku", "Riik", "Eraisik", "Juriidiline isik", "Avalik-õiguslik isik"]
+AGE_GROUPS = [
+    "Kokku ", "Selguseta ala", "Lage ala", "...10", "11...20", "21...30", "31...40", "41...50", "51...60",
+    "61...70", "71...80", "81...90", "91...100", "101...110", "111...120", "121...130", "131...140", "141..."
+]
+REGENERATION_CUTTING_TYPES = ["Uuendusraie kokku", "Lageraie", "Turberaie"]
+REGENERATION_CUTTING_METRICS = {
+    "Pindala (tuhat ha)":               (20, 45),
+    "Raiutud tagavara tuh m³":          (5000, 11000),
+    "Sh raiutud surnud puitu tuh m³":   (200, 700),
+    "Väljaraie m³/ha":                  (150, 300)
+}
+
+
+def format_number(value: float) -> str:
+    """
+    Format number like the Tableau exports: space as thousands separator, comma as decimal separator.
+    """
+    return f"{value:,.1f}".replace(",", " ").replace(".", ",")
+
+
+def get_species(n: int) -> dict[str, str]:
+    """
+    Get n tree species (file name part: Enamuspuuliik value). Real species are used first.
+    """
+    species = dict(list(SPECIES.items())[:n])
+    species.update({f"species_{i}": f"Liik {i}" for i in range(len(species), n)})
+    return species
+
+
+def get_owners(n: int) -> list[str]:
+    """
+    Get n ownership (Omand) values. Real values are used first.
+    """
+    return (OWNERS + [f"Omanik {i}" for i in range(len(OWNERS), n)])[:n]
+
+
+def write_csv(path: str, fields: list[str], rows: list[list[str]]) -> None:
+    """
+    Write semicolon separated csv with a byte order mark, like the Tableau exports.
+    """
+    with open(path, "w", encoding="utf-8-sig", newline="") as file:
+        file.write(";".join(fields) + "\n")
+        file.writelines(";".join(row) + "\n" for row in rows)
+
+
+def generate_age_group_data(
+        output_dir: str,
+        years: int = 25,
+        species: int = 8,
+        owners: int = 1,
+        first_year: int = 1999,
+        seed: int = 0) -> list[str]:
+    """
+    Generate synthetic age group exports: one file per tree species and management category (all/production).
+    Areas of production forest land are a random share of all forest land.
+    Return paths of written files.
+    """
+    randomizer = random.Random(seed)
+
+    paths = []
+    for species_name, species_value in get_species(species).items():
+        rows_by_type = {"all": [], "production": []}
+        for year in range(first_year, first_year + years):
+            for owner in get_owners(owners):
+                areas = {age_group: randomizer.uniform(0, 150) for age_group in AGE_GROUPS[1:]}
+                areas[AGE_GROUPS[0]] = sum(areas.values())
+                production_share = randomizer.uniform(0.6, 0.9)
+                for type_name, share in [("all", 1.0), ("production", production_share)]:
+                    rows_by_type[type_name] += [
+                        [
+                            str(year), MANAGEMENT_CATEGORIES[type_name], owner, "Pindala (tuhat ha)",
+                            species_value, age_group, LOAD_TIMESTAMP, format_number(area * share)
+                        ]
+                        for age_group, area in areas.items()
+                    ]
+
+        for type_name, rows in rows_by_type.items():
+            path = os.path.join(output_dir, AGE_GROUP_FILE_NAME.format(species=species_name, type=type_name))
+            write_csv(path, AGE_GROUP_FIELDS, rows)
+            paths += [path]
+    return paths
+
+
+def generate_regeneration_cutting_data(output_dir: str, years: int = 9, first_year: int = 2014, seed: int = 0) -> str:
+    """
+    Generate synthetic regeneration cutting export with all metrics and cutting types.
+    Return path of written file.
+    """
+    randomizer = random.Random(seed)
+    rows = [
+        ["Kokku", str(year), metric, "Uuendusraie", cutting_type, LOAD_TIMESTAMP, format_number(randomizer.uniform(*value_range))]
+        for year in range(first_year + years - 1, first_year - 1, -1)
+        for cutting_type in REGENERATION_CUTTING_TYPES
+        for metric, value_range in REGENERATION_CUTTING_METRICS.items()
+    ]
+    path = os.path.join(output_dir, REGENERATION_CUTTING_FILE_NAME)
+    write_csv(path, REGENERATION_CUTTING_FIELDS, rows)
+    return path
+
+
+def generate_data(output_dir: str, years: int = 25, species: int = 8, owners: int = 1, seed: int = 0) -> list[str]:
+    """
+    Generate synthetic raw age group and regeneration cutting exports to output_dir.
+    Return paths of written files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = generate_age_group_data(output_dir, years, species, owners, seed=seed)
+    paths += [generate_regeneration_cutting_data(output_dir, seed=seed)]
+    return paths
+
+
+##########
+# Script #
+##########
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic raw data in the Tableau export schema.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--years", type=int, default=25)
+    parser.add_argument("--species", type=int, default=8, help="Number of tree species (including the all species total)")
+    parser.add_argument("--owners", type=int, default=1, help="Number of ownership (Omand) values")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    written = generate_data(
+        arguments.output_dir,
+        years=arguments.years,
+        species=arguments.species,
+        owners=arguments.owners,
+        seed=arguments.seed
+    )
+    print(f"Wrote {len(written)} files to {arguments.output_dir}")
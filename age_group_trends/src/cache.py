@@ -0,0 +1,220 @@
+# standard
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Callable
+# external
+import polars as pl
+# local
+import storage
+
+
+#########################
+# Functions and classes #
+#########################
+
+DEFAULT_CACHE_DIR = "age_group_trends/data/cache"
+DEFAULT_MAX_SIZE = 200 * 1024 ** 2     # bytes
+STORAGE_FORMAT = "parquet"
+FILE_EXTENSION = storage.FILE_EXTENSIONS[STORAGE_FORMAT]
+LOCK = threading.Lock()
+# ^ Serializes saving and eviction between threads of a process (e.g. concurrent DAG nodes)
+FILE_HASHES: dict[tuple[str, int, int], str] = {}
+# ^ File hashes by path, modification time and size, so that unchanged files are not read again in a process (e.g. watch mode)
+
+
+def get_file_hash(path: str) -> str:
+    """
+    Get sha256 hash of file contents (memoized by modification time and size).
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if memo_key not in FILE_HASHES:
+        file_hash = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 ** 2), b""):
+                file_hash.update(chunk)
+        FILE_HASHES[memo_key] = file_hash.hexdigest()
+    return FILE_HASHES[memo_key]
+
+
+def get_files_hash(pattern: str | list[str]) -> str:
+    """
+    Get combined sha256 hash of file names and contents of all files matching input glob pattern(s).
+    """
+    patterns = [pattern] if isinstance(pattern, str) else pattern
+    paths = sorted(path for pattern in patterns for path in glob.glob(pattern))
+    return get_key(*[[os.path.basename(path), get_file_hash(path)] for path in paths])
+
+
+def get_key(*parts) -> str:
+    """
+    Get cache key (sha256 hash) from json serializable input parts.
+    """
+    serialized = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def get_entry_dir(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, key)
+
+
+def get_size(cache_dir: str) -> int:
+    """
+    Get total size of cached files in bytes.
+    """
+    size = 0
+    for dir_path, _, file_names in os.walk(cache_dir):
+        size += sum(os.path.getsize(os.path.join(dir_path, name)) for name in file_names)
+    return size
+
+
+def get_entry_size(cache_dir: str, key: str) -> int | None:
+    """
+    Get size of a cache entry in bytes. Return None if key is not cached.
+    """
+    entry_dir = get_entry_dir(cache_dir, key)
+    return get_size(entry_dir) if os.path.isdir(entry_dir) else None
+
+
+def load(cache_dir: str, key: str) -> dict[str, pl.DataFrame] | None:
+    """
+    Load cached data frames by key. Return None if key is not cached.
+    Update entry modification time to mark it as recently used.
+    """
+    entry_dir = get_entry_dir(cache_dir, key)
+    if not os.path.isdir(entry_dir):
+        return None
+    out = {
+        name.removesuffix(FILE_EXTENSION): storage.read_data(os.path.join(entry_dir, name))
+        for name in sorted(os.listdir(entry_dir))
+        if name.endswith(FILE_EXTENSION)
+    }
+    os.utime(entry_dir)
+    return out
+
+
+def save(cache_dir: str, key: str, data: dict[str, pl.DataFrame], max_size: int = DEFAULT_MAX_SIZE) -> None:
+    """
+    Save data frames to cache under input key and evict least recently used entries if cache is over max_size.
+    Entry is written to a temporary directory first, so that incomplete entries are never loaded.
+    """
+    entry_dir = get_entry_dir(cache_dir, key)
+    temporary_dir = f"{entry_dir}.tmp{os.getpid()}"
+    with LOCK:
+        os.makedirs(temporary_dir, exist_ok=True)
+        for name, frame in data.items():
+            storage.write_data(frame, os.path.join(temporary_dir, name), STORAGE_FORMAT)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(temporary_dir, entry_dir)
+        evict(cache_dir, max_size)
+
+
+def load_file(cache_dir: str, key: str, name: str) -> str | None:
+    """
+    Get path of a cached file by key and file name. Return None if it is not cached.
+    Update entry modification time to mark it as recently used.
+    """
+    entry_dir = get_entry_dir(cache_dir, key)
+    path = os.path.join(entry_dir, name)
+    if not os.path.isfile(path):
+        return None
+    os.utime(entry_dir)
+    return path
+
+
+def save_files(cache_dir: str, key: str, paths: dict[str, str], max_size: int = DEFAULT_MAX_SIZE) -> None:
+    """
+    Copy files (dict of file name in cache: source path) to cache under input key
+    and evict least recently used entries if cache is over max_size. See save.
+    """
+    entry_dir = get_entry_dir(cache_dir, key)
+    temporary_dir = f"{entry_dir}.tmp{os.getpid()}"
+    with LOCK:
+        os.makedirs(temporary_dir, exist_ok=True)
+        for name, path in paths.items():
+            shutil.copyfile(path, os.path.join(temporary_dir, name))
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(temporary_dir, entry_dir)
+        evict(cache_dir, max_size)
+
+
+def evict(cache_dir: str, max_size: int) -> list[str]:
+    """
+    Delete least recently used cache entries until total cache size is at most max_size bytes.
+    Return keys of deleted entries.
+    """
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = [
+        (os.path.getmtime(path), get_size(path), name)
+        for name in os.listdir(cache_dir)
+        if os.path.isdir(path := os.path.join(cache_dir, name))
+    ]
+    size = sum(entry_size for _, entry_size, _ in entries)
+    evicted = []
+    for _, entry_size, name in sorted(entries):
+        if size <= max_size:
+            break
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        size -= entry_size
+        evicted += [name]
+    return evicted
+
+
+def clear(cache_dir: str) -> int:
+    """
+    Delete all cache entries. Return number of deleted entries.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    names = os.listdir(cache_dir)
+    for name in names:
+        path = os.path.join(cache_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+    return len(names)
+
+
+def cached(
+        cache_dir: str | None,
+        key: str | None,
+        compute: Callable[[], dict[str, pl.DataFrame]],
+        max_size: int = DEFAULT_MAX_SIZE) -> dict[str, pl.DataFrame]:
+    """
+    Load data frames from cache by key or compute and cache them if key is not cached.
+    Caching is disabled if cache_dir is None.
+    """
+    if cache_dir is None:
+        return compute()
+    out = load(cache_dir, key)
+    if out is None:
+        out = compute()
+        save(cache_dir, key, out, max_size)
+    return out
+
+
+##########
+# Script #
+##########
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage cache of cleaned and prepared data and rendered plots.")
+    parser.add_argument("command", choices=["clear", "evict", "info"])
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--max-size", type=int, default=DEFAULT_MAX_SIZE, help="Max cache size in bytes (for evict)")
+    arguments = parser.parse_args()
+
+    if arguments.command == "clear":
+        print(f"Deleted {clear(arguments.cache_dir)} cache entries from {arguments.cache_dir}")
+    elif arguments.command == "evict":
+        print(f"Evicted {len(evict(arguments.cache_dir, arguments.max_size))} cache entries from {arguments.cache_dir}")
+    else:
+        entry_count = len(os.listdir(arguments.cache_dir)) if os.path.isdir(arguments.cache_dir) else 0
+        print(f"{arguments.cache_dir}: {entry_count} entries, {get_size(arguments.cache_dir)} bytes")
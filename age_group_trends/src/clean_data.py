@@ -3,13 +3,89 @@ import polars as pl
 from polars import col
 
 
-def clean_age_group_data(data: pl.DataFrame, type_name: str, translations: dict) -> pl.DataFrame:
+NUMBER_FORMAT_REPLACEMENTS = {
+    " ":        "",     # thousands separator
+    "\u00a0":   "",     # non-breaking space as thousands separator
+    "\u202f":   "",     # narrow non-breaking space as thousands separator
+    ",":        "."     # decimal comma
+}
+VALUE_FIELD = "Meetriku väärtus"
+REGENERATION_CUTTING_METRICS = {
+    "Pindala (tuhat ha)":               {"name": "AREA",                "unit": "kha"},
+    "Raiutud tagavara tuh m³":          {"name": "VOLUME",              "unit": "thousand m³"},
+    "Sh raiutud surnud puitu tuh m³":   {"name": "DEAD_WOOD_VOLUME",    "unit": "thousand m³"},
+    "Väljaraie m³/ha":                  {"name": "VOLUME_PER_HA",       "unit": "m³/ha"}
+}
+# ^ Meetrik values of regeneration cutting raw data: METRIC name and UNIT of cleaned data
+REGENERATION_CUTTING_TYPES = {
+    "Uuendusraie kokku":    "total",
+    "Lageraie":             "clear",
+    "Turberaie":            "shelterwood"
+}
+# ^ Kaitsepõhjus values of regeneration cutting raw data: CUTTING_TYPE of cleaned data (total = clear + shelterwood)
+REGENERATION_CUTTING_METRIC_DTYPE = pl.Enum([metric["name"] for metric in REGENERATION_CUTTING_METRICS.values()])
+REGENERATION_CUTTING_TYPE_DTYPE = pl.Enum(list(REGENERATION_CUTTING_TYPES.values()))
+
+
+def parse_number(expression: pl.Expr) -> pl.Expr:
+    """
+    Parse numbers in Estonian format (e.g. "2 192,7") to float.
+    Thousands separators and the decimal comma are replaced in a single pass over the strings.
+    Values that can't be parsed are set to null.
+    """
+    out = (
+        expression
+        .str.replace_many(
+            list(NUMBER_FORMAT_REPLACEMENTS.keys()),
+            list(NUMBER_FORMAT_REPLACEMENTS.values())
+        )
+        .cast(pl.Float64, strict=False)
+    )
+    return out
+
+
+def get_unparseable_numbers(data: pl.LazyFrame, field: str = VALUE_FIELD) -> pl.LazyFrame:
+    """
+    Get records where the value field is not empty, but can't be parsed as a number.
+    """
+    out = (
+        data
+        .filter(
+            col(field).str.strip_chars() != "",
+            parse_number(col(field)).is_null()
+        )
+    )
+    return out
+
+
+def scan_raw_data(source: str | list[str]) -> pl.LazyFrame:
+    """
+    Lazily scan semicolon separated Tableau export(s) from a path, glob pattern or list of paths.
+    Read Meetriku väärtus as string regardless of the inferred type (values use Estonian number format).
+    """
+    out = pl.scan_csv(
+        source,
+        separator=";",
+        encoding="utf8",
+        schema_overrides={VALUE_FIELD: pl.String}
+    )
+    return out
+
+
+def clean_age_group_data(
+        data: pl.LazyFrame,
+        translations: dict,
+        age_group_dtype: pl.DataType = pl.String,
+        species_dtype: pl.DataType = pl.String,
+        owner_dtype: pl.DataType = pl.String) -> pl.LazyFrame:
     """
     Discard age group totals (Kaitsepõhjus: Kokku).
-    Convert Meetriku väärtus to float and rename to AREA.
+    Convert Meetriku väärtus to float (missing values to 0) and rename to AREA.
     Set UNIT value to kha.
-    Map translations to Kaitsepõhjus and rename to AGE_GROUP.
-    Set TYPE to type_name.
+    Map translations to Kaitsepõhjus, cast to age_group_dtype and rename to AGE_GROUP.
+    Map translations to Enamuspuuliik, cast to species_dtype and rename to DOMINANT_SPECIES.
+    Map translations to Omand, cast to owner_dtype and rename to OWNER.
+    Map translations to Majanduskategooria and rename to TYPE (all/production).
     """
     out = (
         data
@@ -17,12 +93,9 @@ def clean_age_group_data(data: pl.DataFrame, type_name: str, translations: dict)
             col("Kaitsepõhjus").str.strip_chars() != pl.lit("Kokku")
         )
         .with_columns(
-            AREA = (
-                col("Meetriku väärtus")
-                .str.replace(r"\s", "")
-                .str.replace(",", ".")
-                .fill_null(0)
-                .cast(pl.Float64)
+            AREA = parse_number(
+                col(VALUE_FIELD)
+                .fill_null("0")
             ),
             UNIT = (
                 pl.when(col("Meetrik") == "Pindala (tuhat ha)")
@@ -32,18 +105,31 @@ def clean_age_group_data(data: pl.DataFrame, type_name: str, translations: dict)
                 col("Enamuspuuliik")
                 .str.strip_chars()
                 .replace(translations)
+                .cast(species_dtype)
+            ),
+            OWNER = (
+                col("Omand")
+                .str.strip_chars()
+                .replace(translations)
+                .cast(owner_dtype)
             ),
             AGE_GROUP = (
                 col("Kaitsepõhjus")
                 .str.strip_chars()
                 .replace(translations)
+                .cast(age_group_dtype)
             ),
-            TYPE = pl.lit(type_name)
+            TYPE = (
+                col("Majanduskategooria")
+                .str.strip_chars()
+                .replace(translations)
+            )
         )
         .select(
             col("Aasta").alias("YEAR"),
             col("TYPE"),
             col("DOMINANT_SPECIES"),
+            col("OWNER"),
             col("AGE_GROUP"),
             col("AREA"),
             col("UNIT")
@@ -52,26 +138,45 @@ def clean_age_group_data(data: pl.DataFrame, type_name: str, translations: dict)
     return out
 
 
-def combine_all_and_production_data(all_data: pl.DataFrame, production_data: pl.DataFrame) -> pl.DataFrame:
+def check_single_type_rows(data: pl.DataFrame) -> pl.DataFrame:
+    """
+    Check that grouped data has at most one "all" and one "production" row per group (ROWS_ALL and ROWS_PRODUCTION fields).
+    Raise ValueError listing the duplicated groups otherwise.
+    """
+    duplicates = data.filter((col("ROWS_ALL") > 1) | (col("ROWS_PRODUCTION") > 1))
+    if not duplicates.is_empty():
+        groups = duplicates.select("YEAR", "DOMINANT_SPECIES", "OWNER", "AGE_GROUP").head(10).rows()
+        raise ValueError(f"Duplicate all or production rows for {duplicates.height} groups (year, species, owner, age group), e.g. {groups}")
+    return data
+
+
+def combine_all_and_production_data(data: pl.LazyFrame) -> pl.LazyFrame:
     """
     Get protected areas by subtracting production areas from all economic areas.
+    Input has TYPE values "all" and "production". Both are combined in a single grouped pass
+    (for each year, tree species, owner and age group). Raise ValueError on collect if a group
+    has more than one row of either type.
     Round areas to 2 decimals.
     Return data frame with TYPE values "production" and "protected".
     """
     out = (
-        all_data
-        .rename({"AREA": "AREA_ALL"})
-        .drop("TYPE")
-        .join(
-            production_data.rename({"AREA": "AREA_PRODUCTION"}).drop("TYPE"),
-            on=["YEAR", "DOMINANT_SPECIES", "AGE_GROUP", "UNIT"],
-            how="left"
+        data
+        .group_by(["YEAR", "DOMINANT_SPECIES", "OWNER", "AGE_GROUP", "UNIT"])
+        .agg(
+            AREA_ALL = col("AREA").filter(col("TYPE") == "all").first(),
+            AREA_PRODUCTION = col("AREA").filter(col("TYPE") == "production").first(),
+            ROWS_ALL = (col("TYPE") == "all").sum(),
+            ROWS_PRODUCTION = (col("TYPE") == "production").sum()
+        )
+        .map_batches(check_single_type_rows, projection_pushdown=False)
+        .filter(
+            col("AREA_ALL").is_not_null()
         )
         .with_columns(
             AREA_PROTECTED = col("AREA_ALL") - col("AREA_PRODUCTION")
         )
         .unpivot(
-            index=["YEAR", "DOMINANT_SPECIES", "AGE_GROUP", "UNIT"],
+            index=["YEAR", "DOMINANT_SPECIES", "OWNER", "AGE_GROUP", "UNIT"],
             on=["AREA_PRODUCTION", "AREA_PROTECTED"],
             value_name="AREA",
             variable_name="TYPE"
@@ -87,42 +192,75 @@ def combine_all_and_production_data(all_data: pl.DataFrame, production_data: pl.
         .select(
             col("YEAR"),
             col("DOMINANT_SPECIES"),
+            col("OWNER"),
             col("AGE_GROUP"),
             col("TYPE"),
             col("AREA"),
             col("UNIT")
         )
-        .sort(col("YEAR"), col("DOMINANT_SPECIES"), col("TYPE"), col("AGE_GROUP"))
+        .sort(col("YEAR"), col("DOMINANT_SPECIES"), col("OWNER"), col("TYPE"), col("AGE_GROUP"))
     )
     return out
 
 
-def clean_regeneration_cutting_data(data: pl.DataFrame) -> pl.DataFrame:
+def clean_regeneration_cutting_data(data: pl.LazyFrame) -> pl.LazyFrame:
     """
-    Filter records of annual regeneration cutting total areas.
-    Convert Meetriku väärtus to float and rename to AREA. Round to 2 decimals.
-    Set UNIT value to kha.
+    Get all regeneration cutting metrics of all cutting types in a single pass (long data).
+    Map Meetrik to METRIC (see REGENERATION_CUTTING_METRICS) and Kaitsepõhjus to CUTTING_TYPE
+    (see REGENERATION_CUTTING_TYPES), both enums. Records of other metrics and cutting types are discarded.
+    Convert Meetriku väärtus to float and rename to VALUE. Round to 2 decimals.
+    Set UNIT by metric.
     Rename Raie aasta to YEAR.
     """
+    metric_names = {raw_name: metric["name"] for raw_name, metric in REGENERATION_CUTTING_METRICS.items()}
+    metric_units = {metric["name"]: metric["unit"] for metric in REGENERATION_CUTTING_METRICS.values()}
     out = (
         data
         .filter(
-            col("Meetrik") == pl.lit("Pindala (tuhat ha)"),
-            col("Kaitsepõhjus") == pl.lit("Uuendusraie kokku")
+            col("Meetrik").is_in(list(REGENERATION_CUTTING_METRICS)),
+            col("Kaitsepõhjus").is_in(list(REGENERATION_CUTTING_TYPES))
         )
         .with_columns(
-            AREA = (
-                col("Meetriku väärtus")
-                .str.replace(r"\s", "")
-                .str.replace(",", ".")
-                .cast(pl.Float64)
+            METRIC = col("Meetrik").replace_strict(metric_names, return_dtype=REGENERATION_CUTTING_METRIC_DTYPE),
+            CUTTING_TYPE = col("Kaitsepõhjus").replace_strict(REGENERATION_CUTTING_TYPES, return_dtype=REGENERATION_CUTTING_TYPE_DTYPE),
+            VALUE = (
+                parse_number(col(VALUE_FIELD))
                 .round(2)
-            ),
-            UNIT = pl.when(col("Meetrik") == "Pindala (tuhat ha)").then(pl.lit("kha"))
+            )
         )
         .select(
             col("Raie aasta").alias("YEAR"),
-            col("AREA"),
+            col("CUTTING_TYPE"),
+            col("METRIC"),
+            col("VALUE"),
+            col("METRIC").cast(pl.String).replace_strict(metric_units).alias("UNIT")
+        )
+        .sort(col("YEAR"), col("CUTTING_TYPE"), col("METRIC"))
+    )
+    return out
+
+
+def get_regeneration_cutting_metric(
+        data: pl.DataFrame | pl.LazyFrame,
+        metric: str = "AREA",
+        cutting_type: str = "total") -> pl.DataFrame | pl.LazyFrame:
+    """
+    Get a single metric of a cutting type from cleaned regeneration cutting data (see clean_regeneration_cutting_data).
+    Return data with YEAR, the metric as a field named by the metric (e.g. AREA) and UNIT.
+    """
+    if metric not in REGENERATION_CUTTING_METRIC_DTYPE.categories:
+        raise ValueError(f"Unknown regeneration cutting metric: {metric}. Available metrics: {REGENERATION_CUTTING_METRIC_DTYPE.categories.to_list()}")
+    if cutting_type not in REGENERATION_CUTTING_TYPE_DTYPE.categories:
+        raise ValueError(f"Unknown regeneration cutting type: {cutting_type}. Available types: {REGENERATION_CUTTING_TYPE_DTYPE.categories.to_list()}")
+    out = (
+        data
+        .filter(
+            col("METRIC") == metric,
+            col("CUTTING_TYPE") == cutting_type
+        )
+        .select(
+            col("YEAR"),
+            col("VALUE").alias(metric),
             col("UNIT")
         )
         .sort(col("YEAR"))
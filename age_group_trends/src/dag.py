@@ -0,0 +1,246 @@
+# standard
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+import json
+import os
+import threading
+import time
+from typing import Any, Callable
+# external
+import polars as pl
+# local
+import cache
+import profiling
+
+
+#########################
+# Functions and classes #
+#########################
+
+RUN = "run"
+LOAD = "load"
+SKIP = "skip"
+# ^ Plan actions: run the node, load its value from cache (up to date, but needed by a node that runs) or skip it
+
+
+@dataclass
+class Node:
+    name: str
+    function: Callable[[dict[str, Any]], dict[str, pl.DataFrame] | None]
+    # ^ Called with the values of input nodes (dict of node name: value).
+    # Returns a dict of data frames (if cached) or None (if the node only writes outputs).
+    inputs: list[str] = field(default_factory=list)
+    # ^ Names of nodes that this node depends on
+    parameters: Any = None
+    # ^ Json serializable parameters of the node (part of the fingerprint)
+    files: list[str] = field(default_factory=list)
+    # ^ Glob patterns of input files (names and contents are part of the fingerprint)
+    code: list[str] = field(default_factory=list)
+    # ^ Source files of the node function (contents are part of the fingerprint)
+    outputs: list[str] = field(default_factory=list)
+    # ^ Files written by the node. The node is stale if any of them is missing.
+    cached: bool = True
+    # ^ Value is saved to cache. Up to date if its fingerprint is cached.
+    # Otherwise up to date if its fingerprint is the same as in the last run (see Runner.state_path) and outputs exist.
+
+
+@dataclass
+class PlanStep:
+    node: str
+    action: str
+    # ^ RUN, LOAD or SKIP
+    reason: str
+    fingerprint: str
+
+
+class Runner:
+    """
+    Make-style runner of a DAG of nodes. Each node has a fingerprint from its parameters, input file contents, code
+    and the fingerprints of its input nodes. Only stale nodes are run (see Node.cached) and up to date nodes
+    are loaded from cache only if a stale node needs their value. Nodes whose inputs are ready run concurrently in threads
+    (polars and Kaleido release the GIL).
+    Caching and run state are disabled if cache_dir is None (all nodes are run).
+    """
+    def __init__(
+            self,
+            nodes: list[Node],
+            cache_dir: str | None = None,
+            max_size: int = cache.DEFAULT_MAX_SIZE,
+            thread_count: int = os.cpu_count() or 1,
+            profiler: profiling.Profiler | None = None):
+        self.nodes = {node.name: node for node in nodes}
+        if len(self.nodes) != len(nodes):
+            raise ValueError("Node names must be unique")
+        self.order = get_topological_order(self.nodes)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.thread_count = max(thread_count, 1)
+        self.profiler = profiler
+        self.state_path = os.path.join(cache_dir, "dag_state.json") if cache_dir is not None else None
+        # ^ Fingerprints of the last successful run of uncached nodes
+        self.lock = threading.Lock()
+
+    def load_state(self) -> dict[str, str]:
+        if self.state_path is None or not os.path.isfile(self.state_path):
+            return {}
+        with open(self.state_path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def save_state(self, state: dict[str, str]) -> None:
+        if self.state_path is None:
+            return
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(self.state_path, "w", encoding="utf-8") as file:
+            json.dump(state, file, indent=2, ensure_ascii=False)
+
+    def get_fingerprints(self) -> dict[str, str]:
+        """
+        Get fingerprint (sha256 hash) of each node in topological order.
+        """
+        fingerprints = {}
+        for name in self.order:
+            node = self.nodes[name]
+            fingerprints[name] = cache.get_key(
+                name,
+                node.parameters,
+                cache.get_files_hash(node.files) if node.files else None,
+                [cache.get_file_hash(path) for path in node.code],
+                [fingerprints[input_name] for input_name in node.inputs]
+            )
+        return fingerprints
+
+    def get_staleness(self, name: str, fingerprint: str, state: dict[str, str]) -> str | None:
+        """
+        Get reason why a node is stale (None if it is up to date).
+        """
+        node = self.nodes[name]
+        if self.cache_dir is None:
+            return "caching disabled"
+        missing = [path for path in node.outputs if not os.path.exists(path)]
+        if missing:
+            return f"missing output {missing[0]}" + (f" (+{len(missing) - 1})" if len(missing) > 1 else "")
+        if node.cached:
+            return None if os.path.isdir(cache.get_entry_dir(self.cache_dir, fingerprint)) else "not cached"
+        if name not in state:
+            return "not run before"
+        return None if state[name] == fingerprint else "inputs changed"
+
+    def get_plan(self) -> list[PlanStep]:
+        """
+        Get plan of the next run: an action for each node in topological order.
+        """
+        fingerprints = self.get_fingerprints()
+        state = self.load_state()
+        stale = {name: self.get_staleness(name, fingerprints[name], state) for name in self.order}
+        needed = {
+            input_name
+            for name, reason in stale.items() if reason is not None
+            for input_name in self.nodes[name].inputs
+        }
+        plan = []
+        for name in self.order:
+            if stale[name] is not None:
+                plan += [PlanStep(name, RUN, stale[name], fingerprints[name])]
+            elif name in needed and self.nodes[name].cached:
+                plan += [PlanStep(name, LOAD, "up to date, input of a stale node", fingerprints[name])]
+            else:
+                plan += [PlanStep(name, SKIP, "up to date", fingerprints[name])]
+        return plan
+
+    def print_plan(self, plan: list[PlanStep] | None = None) -> None:
+        plan = self.get_plan() if plan is None else plan
+        print(f"{'node':<40} {'action':<6} reason")
+        for step in plan:
+            print(f"{step.node:<40} {step.action:<6} {step.reason}")
+
+    def execute(self, step: PlanStep, values: dict[str, Any], state: dict[str, str]) -> Any:
+        """
+        Run or load a node. Inputs of nodes that are run must be in values.
+        """
+        node = self.nodes[step.node]
+        start = time.perf_counter()
+        bytes_read = 0
+        if step.action == LOAD:
+            bytes_read = cache.get_entry_size(self.cache_dir, step.fingerprint) or 0
+            value = cache.load(self.cache_dir, step.fingerprint)
+            if value is None:
+                raise RuntimeError(f"Cache entry of node {step.node} was evicted during the run. Run again.")
+        else:
+            value = node.function({input_name: values.get(input_name) for input_name in node.inputs})
+            if node.cached and self.cache_dir is not None:
+                cache.save(self.cache_dir, step.fingerprint, value, self.max_size)
+            elif not node.cached:
+                with self.lock:
+                    state[step.node] = step.fingerprint
+        if self.profiler is not None:
+            self.profiler.extend([
+                profiling.StageRecord(
+                    name=f"DAG {step.action}",
+                    wall_seconds=time.perf_counter() - start,
+                    cpu_seconds=None,
+                    peak_rss_bytes=profiling.get_peak_rss(),
+                    rows_out=profiling.get_rows(value) if isinstance(value, dict) else None,
+                    bytes_written=profiling.get_file_sizes(node.outputs) if step.action == RUN else 0,
+                    cached=step.action == LOAD,
+                    bytes_read=bytes_read,
+                    label=step.node
+                )
+            ])
+            # ^ CPU time is not recorded, because nodes run concurrently in threads
+        return value
+
+    def run(self, plan: list[PlanStep] | None = None) -> dict[str, Any]:
+        """
+        Execute plan (default: current plan, see get_plan). Nodes are started as soon as their inputs are ready.
+        Run state is saved also if a node fails, so that completed nodes are not run again.
+        Return values of nodes that were run or loaded.
+        """
+        plan = self.get_plan() if plan is None else plan
+        state = self.load_state()
+        pending = {step.node: step for step in plan if step.action != SKIP}
+        done = {step.node for step in plan if step.action == SKIP}
+        values = {}
+        futures: dict[Future, str] = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.thread_count) as executor:
+                while pending or futures:
+                    for name, step in list(pending.items()):
+                        if step.action == LOAD or all(input_name in done for input_name in self.nodes[name].inputs):
+                            futures[executor.submit(self.execute, step, values, state)] = name
+                            del pending[name]
+                    finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = futures.pop(future)
+                        values[name] = future.result()
+                        done.add(name)
+        finally:
+            self.save_state(state)
+        return values
+
+
+def get_topological_order(nodes: dict[str, Node]) -> list[str]:
+    """
+    Get node names in topological order (inputs before the nodes that use them; otherwise in input order).
+    Raise ValueError on unknown inputs and cycles.
+    """
+    order = []
+    visiting = set()
+    visited = set()
+
+    def visit(name: str, path: list[str]) -> None:
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"Cycle in DAG: {' -> '.join(path + [name])}")
+        if name not in nodes:
+            raise ValueError(f"Unknown input node {name} of {path[-1]}")
+        visiting.add(name)
+        for input_name in nodes[name].inputs:
+            visit(input_name, path + [name])
+        visiting.remove(name)
+        visited.add(name)
+        order.append(name)
+
+    for name in nodes:
+        visit(name, [])
+    return order
@@ -0,0 +1,69 @@
+# external
+import polars as pl
+
+
+#########################
+# Functions and classes #
+#########################
+
+UNKNOWN_AGE_GROUP = "unknown"
+CLEARCUT_AGE_GROUP = "clearcut"
+AGE_GROUP_SEPARATOR = "..."
+SPECIES_DTYPE = pl.Categorical("lexical")
+OWNER_DTYPE = pl.Categorical("lexical")
+# ^ Lexical ordering, so that sorting by species and owner is the same as with strings
+
+
+def get_age_group_bounds(label: str) -> tuple[int | None, int | None]:
+    """
+    Get lower and upper bound (years) of an age group label, e.g. "11...20" -> (11, 20).
+    Open bounds: "...10" -> (0, 10) and "141..." -> (141, None).
+    Clearcut is taken to be age 0. Unknown and other labels have no bounds.
+    """
+    if label == CLEARCUT_AGE_GROUP:
+        return 0, 0
+    if AGE_GROUP_SEPARATOR not in label:
+        return None, None
+    lower, upper = [part.strip() for part in label.split(AGE_GROUP_SEPARATOR, 1)]
+    return int(lower) if lower else 0, int(upper) if upper else None
+
+
+def get_age_group_enum(*aggregation_maps: dict) -> pl.Enum:
+    """
+    Get enum data type with all age group labels: unknown, age groups in raw data and aggregated age groups
+    (of all input aggregation maps, e.g. for sweeps over aggregation maps).
+    Categories are sorted by label, so that sorting by age group is the same as with strings.
+    """
+    labels = {UNKNOWN_AGE_GROUP}
+    for aggregation_map in aggregation_maps:
+        labels |= set(aggregation_map.keys()) | set(aggregation_map.values())
+    return pl.Enum(sorted(labels))
+
+
+def get_age_group_dimension(aggregation_map: dict, age_group_dtype: pl.Enum | None = None) -> pl.DataFrame:
+    """
+    Get age group dimension table with a record for each age group label (raw and aggregated):
+    AGE_GROUP (enum), AGE_GROUP_START and AGE_GROUP_END (years, null if open or unknown)
+    and AGGREGATED_AGE_GROUP (enum, the aggregated age group that the age group belongs to).
+    Labels are the categories of age_group_dtype (default: enum of aggregation_map labels).
+    Records are in the physical order of the enum.
+    """
+    if age_group_dtype is None:
+        age_group_dtype = get_age_group_enum(aggregation_map)
+    labels = age_group_dtype.categories.to_list()
+    bounds = [get_age_group_bounds(label) for label in labels]
+    out = pl.DataFrame(
+        {
+            "AGE_GROUP": labels,
+            "AGE_GROUP_START": [lower for lower, _ in bounds],
+            "AGE_GROUP_END": [upper for _, upper in bounds],
+            "AGGREGATED_AGE_GROUP": [aggregation_map.get(label, label) for label in labels]
+        },
+        schema={
+            "AGE_GROUP": age_group_dtype,
+            "AGE_GROUP_START": pl.Int32,
+            "AGE_GROUP_END": pl.Int32,
+            "AGGREGATED_AGE_GROUP": age_group_dtype
+        }
+    )
+    return out
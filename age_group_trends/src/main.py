@@ -1,67 +1,162 @@
 # standard
+import argparse
 import os
-# external
-import polars as pl
-from polars import col
 # local
-import clean_data
-import prepare_data
-import plot_data
+import pipeline
+import profiling
+import watch
 
 
 #########
 # Input #
 #########
 
-TREE_SPECIES = "all"    # available values: all, aspen, birch, black alder, grey alder, other, pine, spruce
-PLOT_SAVE_PATH = "result/metsamaa_pindala_kokku.png"
-PLOT_TITLE = {
-    "text": "Mittemajandatava ja majandatava metsamaa pindalad vanusegruppide kaupa",
-    # Define parts of title string that should have different colours:
-    "apply_production_colour_to": "majandatava",
-    "apply_protected_colour_to": "Mittemajandatava"
+TREE_SPECIES = ["all"]
+# ^ Tree species to process. Cleaning is done once and the cleaned data is shared by all species.
+# available values: all, aspen, birch, black alder, grey alder, other, pine, spruce
+# Use ALL_TREE_SPECIES to process all species in batch.
+PROCESS_COUNT = 1
+# ^ Number of worker processes for preparing and plotting species. Species are processed serially if 1.
+RENDER_PROCESS_COUNT = min(len(TREE_SPECIES), os.cpu_count() or 1)
+# ^ Number of worker processes (each with a warm Kaleido process) for rendering plots concurrently.
+DAG_THREAD_COUNT = os.cpu_count() or 1
+# ^ Number of threads for running independent pipeline stages concurrently with the DAG runner (see --dag).
+WATCH_INTERVAL = 2.0
+# ^ Seconds between checks for changed raw data files in watch mode (see --watch)
+PLOT_FORMATS = ["png"]
+# ^ available values: png, svg, pdf (an image for each tree species, rendered with Kaleido, with the extension of PLOT_SAVE_PATHS replaced),
+# html (a single interactive report with all tree species in TREE_SPECIES, see HTML_REPORT_PATH)
+DATA_ONLY = False
+# ^ Only save clean and plot data. Skips plot traces, layout and rendering (plotting libraries are not imported).
+# Can also be set with: python age_group_trends/src/main.py --data-only
+VALIDATE_FIGURES = False
+# ^ Validate figures with plotly (slower). Otherwise figures are built as dicts directly from data frame columns.
+TREND_ANNOTATIONS = False
+# ^ Add trend slopes (with confidence intervals) of each type and age group to plots (see trends module)
+PLOT_SAVE_PATHS = {
+    "all":          "result/metsamaa_pindala_kokku.png",
+    "aspen":        "result/metsamaa_pindala_haab.png",
+    "birch":        "result/metsamaa_pindala_kask.png",
+    "black alder":  "result/metsamaa_pindala_sanglepp.png",
+    "grey alder":   "result/metsamaa_pindala_hall_lepp.png",
+    "other":        "result/metsamaa_pindala_muu.png",
+    "pine":         "result/metsamaa_pindala_mänd.png",
+    "spruce":       "result/metsamaa_pindala_kuusk.png"
 }
+ALL_TREE_SPECIES = list(PLOT_SAVE_PATHS.keys())
+PLOT_TITLES = {
+    "all": {
+        "text": "Mittemajandatava ja majandatava metsamaa pindalad vanusegruppide kaupa",
+        # Define parts of title string that should have different colours:
+        "apply_production_colour_to": "majandatava",
+        "apply_protected_colour_to": "Mittemajandatava"
+    },
+    "aspen": {
+        "text": "Haava mittemajandatava ja majandatava metsamaa pindalad vanusegruppide kaupa",
+        # Define parts of title string that should have different colours:
+        "apply_production_colour_to": "majandatava",
+        "apply_protected_colour_to": "mittemajandatava"
+    },
+    "birch": {
+        "text": "Kase mittemajandatava ja majandatava metsamaa pindalad vanusegruppide kaupa",
+        # Define parts of title string that should have different colours:
+        "apply_production_colour_to": "majandatava",
+        "apply_protected_colour_to": "mittemajandatava"
+    },
+    "black alder": {
+        "text": "Sanglepa mittemajandatava ja majandatava metsamaa pindalad vanusegruppide kaupa",
+        # Define parts of title string that should have different colours:
+        "apply_production_colour_to": "majandatava",
+        "apply_protected_colour_to": "mittemajandatava"
+    },
+    "grey alder": {
+        "text": "Halli lepa mittemajandatava ja majandatava metsamaa pindalad vanusegruppide kaupa",
+        # Define parts of title string that should have different colours:
+        "apply_production_colour_to": "majandatava",
+        "apply_protected_colour_to": "mittemajandatava"
+    },
+    "other": {
+        "text": "Muude puuliikide mittemajandatava ja majandatava metsamaa pindalad vanusegruppide kaupa",
+        # Define parts of title string that should have different colours:
+        "apply_production_colour_to": "majandatava",
+        "apply_protected_colour_to": "mittemajandatava"
+    },
+    "pine": {
+        "text": "Männi mittemajandatava ja majandatava metsamaa pindalad vanusegruppide kaupa",
+        # Define parts of title string that should have different colours:
+        "apply_production_colour_to": "majandatava",
+        "apply_protected_colour_to": "mittemajandatava"
+    },
+    "spruce": {
+        "text": "Kuuse mittemajandatava ja majandatava metsamaa pindalad vanusegruppide kaupa",
+        # Define parts of title string that should have different colours:
+        "apply_production_colour_to": "majandatava",
+        "apply_protected_colour_to": "mittemajandatava"
+    }
+}
+HTML_REPORT_PATH = "result/metsamaa_pindala.html"
 
 ROOT_DIR = "age_group_trends"
 
 # raw data load paths
 # get raw data from Estonian National Forest Inventory tableau data
 # https://tableau.envir.ee/views/SMI/17Vanuseklassidaegrida?%3Aembed=y
-AGE_GROUP_ALL_RAW_PATHS = [
-    "data/raw/1.11.X Vanuseklassid + uuend_data_all_all.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_aspen_all.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_birch_all.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_black_alder_all.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_grey_alder_all.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_other_all.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_pine_all.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_spruce_all.csv"
-]
-AGE_GROUP_PRODUCTION_RAW_PATHS = [
-    "data/raw/1.11.X Vanuseklassid + uuend_data_all_production.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_aspen_production.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_birch_production.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_black_alder_production.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_grey_alder_production.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_other_production.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_pine_production.csv",
-    "data/raw/1.11.X Vanuseklassid + uuend_data_spruce_production.csv"
-]
+AGE_GROUP_RAW_PATHS = "data/raw/1.11.X Vanuseklassid + uuend_data_*.csv"
+# ^ Glob pattern for exports of all tree species, for both all and production forest land (scanned in one pass)
 # https://tableau.envir.ee/views/SMI/28Raieaegrida?%3Aembed=y
 REGENERATION_CUTTING_RAW_PATH = "data/raw/3.2.2.X Raiete ajalugu.csv"
 
 # clean data save paths
-AGE_GROUP_CLEAN_PATH = f'data/clean/age_group_{TREE_SPECIES}.csv'
-REGENERATION_CUTTING_CLEAN_PATH = f'data/clean/regeneration_cutting_{TREE_SPECIES}.csv'
+# (cleaned data contains all tree species)
+AGE_GROUP_CLEAN_PATH = "data/clean/age_group_all"
+REGENERATION_CUTTING_CLEAN_PATH = "data/clean/regeneration_cutting_all"
 
 # plot data save paths
-PRODUCTION_REGENERATION_CUTTING_PLOT_PATH = f'data/plot/production_regeneration_cutting_{TREE_SPECIES}.csv'
-PROTECTED_REGENERATION_CUTTING_PLOT_PATH = f'data/plot/protected_regeneration_cutting_{TREE_SPECIES}.csv'
-PRODUCTION_AREAS_PLOT_PATH = f'data/plot/production_areas_{TREE_SPECIES}.csv'
-PROTECTED_AREAS_PLOT_PATH = f'data/plot/protected_areas_{TREE_SPECIES}.csv'
+# {tree_species} is replaced by the processed tree species
+# (file extensions are set by STORAGE_FORMAT)
+REGENERATION_CUTTING_PLOT_PATHS = {
+    "production":   "data/plot/production_regeneration_cutting_{tree_species}",
+    "protected":    "data/plot/protected_regeneration_cutting_{tree_species}"
+}
+AREAS_PLOT_PATHS = {
+    "production":   "data/plot/production_areas_{tree_species}",
+    "protected":    "data/plot/protected_areas_{tree_species}"
+}
+AREAS_SLICES_PATH = "data/plot/areas_slices"
+# ^ Areas of all tree species, owners and types (one record per slice and year). Set to None to disable.
+
+# storage parameters
+STORAGE_FORMAT = "parquet"
+# ^ Storage format of clean and plot data. available values: parquet, ipc (Arrow IPC, memory mapped on read), csv
+EXPORT_CSV = True
+# ^ Also export clean and plot data as csv
+STORAGE_FORMATS = list(dict.fromkeys([STORAGE_FORMAT] + (["csv"] if EXPORT_CSV else [])))
+
+# cache parameters
+CACHE_DIR = "data/cache"
+# ^ Cleaned and prepared data are cached here (keyed by input file contents and parameters). Set to None to disable.
+# Rendered plots are also cached here (keyed by the final figure), so unchanged plots are copied instead of rendered.
+# Clear cache with: python age_group_trends/src/cache.py clear
+CACHE_MAX_SIZE = 200 * 1024 ** 2
+# ^ Least recently used cache entries are evicted above this size (bytes)
+
+# vintage parameters
+VINTAGE_STORE_DIR = "data/vintages"
+# ^ Raw export records are appended here by report load timestamp (only new or changed records), so that earlier
+# vintages can be queried after the raw files are replaced. Set to None to disable.
+# Query with: python age_group_trends/src/vintages.py revisions --store-dir age_group_trends/data/vintages/age_group
+
+# profiling parameters
+RUN_REPORT_PATH = "data/report/run_report.json"
+# ^ Per-stage wall time, CPU time, peak RSS, rows in/out and bytes written are saved here. Set to None to disable.
+PRINT_RUN_REPORT = True
+EXPLAIN_QUERY_PLANS = False
+# ^ Add optimized polars query plans of lazy stages to the run report
 
 # clean parameters
 TRANSLATION_MAP = {
+    "Kogu metsamaa": "all",
+    "Majandatav metsamaa": "production",
     "Selguseta ala": "unknown",
     "Lage ala": "clearcut",
     "Kokku": "all",
@@ -71,12 +166,15 @@ TRANSLATION_MAP = {
     "Hall lepp": "grey alder",
     "Teised": "other",
     "Mänd": "pine",
-    "Kuusk": "spruce"
+    "Kuusk": "spruce",
+    "Riik": "state",
+    "Eraisik": "private person",
+    "Juriidiline isik": "legal person",
+    "Avalik-õiguslik isik": "public legal person"
 }
 
 # analysis parameters
-IS_REGENERATION_CUTTING_DATA_AVAILABLE = TREE_SPECIES == "all"
-# ^ Set to False when analysing data by tree species (because there is no regeneration cutting data by individual species).
+# Regeneration cutting is only applied to "all" tree species (because there is no regeneration cutting data by individual species).
 AGE_GROUP_AGGREGATION_MAP = {
     TRANSLATION_MAP["Lage ala"]:    "0...20",
     "...10":                        "0...20",
@@ -95,8 +193,14 @@ AGE_GROUP_AGGREGATION_MAP = {
     "131...140":                    "81...",
     "141...":                       "81..."
 }
+# ^ Must include all age groups in raw data (age groups are encoded as an enum of the labels in this map)
 REGENERATION_CUTTING_AGE_THRESHOLD = 60
 # ^ Regeneration cutting total area is subtracted proportionally from age groups above the threshold
+REGENERATION_CUTTING_METRIC = "AREA"
+# ^ Plotted regeneration cutting metric: AREA (kha), VOLUME (thousand m³), DEAD_WOOD_VOLUME (thousand m³) or VOLUME_PER_HA (m³/ha).
+# Shown on the area axis, so set Y_AXIS_TITLE and REGENERATION_CUTTING_NAME accordingly.
+REGENERATION_CUTTING_TYPE = "total"
+# ^ Plotted regeneration cutting type: total, clear (clear-cutting) or shelterwood (shelterwood cutting)
 
 # plot parameters
 X_AXIS_TITLE = "Aasta"
@@ -118,324 +222,99 @@ PRODUCTION_COLORSCALES = {
     "spruce":       "tempo"
 }
 PROTECTED_COLORSCALE = "Darkmint"
-PRODUCTION_COLORSCALE = PRODUCTION_COLORSCALES[TREE_SPECIES]
 LEGEND_COLORSCALE = "Greys"
 REGENERATION_CUTTING_COLOUR = "#C35B00"
 
 
-##############
-# Clean data #
-##############
-
-if IS_REGENERATION_CUTTING_DATA_AVAILABLE:
-    # Read regeneration cutting data
-    regeneration_cutting_raw = pl.read_csv(
-        os.path.join(ROOT_DIR, REGENERATION_CUTTING_RAW_PATH),
-        encoding="utf-8",
-        separator=";")
-
-    # Clean regeneration cutting data
-    regeneration_cutting_clean = clean_data.clean_regeneration_cutting_data(regeneration_cutting_raw)
-
-    # Save regeneration cutting cleaned data
-    os.makedirs(
-        os.path.dirname(os.path.join(ROOT_DIR, REGENERATION_CUTTING_CLEAN_PATH)),
-        exist_ok=True)
-
-    regeneration_cutting_clean.write_csv(
-        os.path.join(ROOT_DIR, REGENERATION_CUTTING_CLEAN_PATH),
-        separator=","
-    )
-
-# Read age group data
-age_group_all_raw = pl.concat([
-    pl.read_csv(
-        os.path.join(ROOT_DIR, path),
-        encoding="utf-8",
-        separator=";"
-    )
-    for path in AGE_GROUP_ALL_RAW_PATHS
-])
-
-age_group_production_raw = pl.concat([
-    pl.read_csv(
-        os.path.join(ROOT_DIR, path),
-        encoding="utf-8",
-        separator=";"
-    )
-    for path in AGE_GROUP_PRODUCTION_RAW_PATHS
-])
-
-# Clean age group data
-age_group_all = clean_data.clean_age_group_data(age_group_all_raw, "all", TRANSLATION_MAP)
-age_group_production = clean_data.clean_age_group_data(age_group_production_raw, "production", TRANSLATION_MAP)
-age_group_clean = clean_data.combine_all_and_production_data(age_group_all, age_group_production)
-
-# Save cleaned age group data
-os.makedirs(
-    os.path.dirname(os.path.join(ROOT_DIR, AGE_GROUP_CLEAN_PATH)),
-    exist_ok=True)
-
-age_group_clean.write_csv(
-    os.path.join(ROOT_DIR, AGE_GROUP_CLEAN_PATH),
-    separator=","
-)
-
-
-##########################################
-# Prepare regeneration cutting plot data #
-##########################################
-
-if IS_REGENERATION_CUTTING_DATA_AVAILABLE:
-    # Use year range from age group data
-    year_min = age_group_clean["YEAR"].min()
-    year_max = age_group_clean["YEAR"].max()
-
-    # Create a dummy data frame for regeneration data of protected forest
-    # Assume negligible regeneration cutting in protected forests
-    protected_regeneration_cutting_raw = pl.DataFrame(
-        schema={
-            "YEAR": pl.Int64,
-            "AREA": pl.Float64,
-            "UNIT": pl.String
-        }
-    )
-    protected_regeneration_cutting_plot = prepare_data.align_regeneration_cutting_data(
-        data=protected_regeneration_cutting_raw,
-        year_min=year_min,
-        year_max=year_max,
-        type_name="protected"
-    )
-
-    # Assume that all regeneration cutting data is for production forest
-    production_regeneration_cutting_raw = regeneration_cutting_clean
-
-    production_regeneration_cutting_plot = prepare_data.align_regeneration_cutting_data(
-        data=production_regeneration_cutting_raw,
-        year_min=year_min,
-        year_max=year_max,
-        type_name="production"
-    )
-
-    # Save prepared regeneration cutting data
-    os.makedirs(
-        os.path.dirname(os.path.join(ROOT_DIR, PROTECTED_REGENERATION_CUTTING_PLOT_PATH)),
-        exist_ok=True
-    )
-    protected_regeneration_cutting_plot.write_csv(
-        os.path.join(ROOT_DIR, PROTECTED_REGENERATION_CUTTING_PLOT_PATH),
-        separator=","
-    )
-
-    os.makedirs(
-        os.path.dirname(os.path.join(ROOT_DIR, PRODUCTION_REGENERATION_CUTTING_PLOT_PATH)),
-        exist_ok=True
-    )
-    production_regeneration_cutting_plot.write_csv(
-        os.path.join(ROOT_DIR, PRODUCTION_REGENERATION_CUTTING_PLOT_PATH),
-        separator=","
-    )
-
-
-###########################
-# Prepare areas plot data #
-###########################
-
-# Select input species
-age_group_species = (
-    age_group_clean
-    .filter(col("DOMINANT_SPECIES") == TREE_SPECIES)
-)
-
-# Add unknown area to the age group area proportionately
-age_group_known = (
-    age_group_species
-    .filter(col("AGE_GROUP") != "unknown")
-)
-age_group_unknown = (
-    age_group_species
-    .filter(col("AGE_GROUP") == "unknown")
-)
-age_group_unknown_added = prepare_data.add_unknown_data(age_group_known, age_group_unknown)
-
-# Aggregate age groups
-age_group_aggregated = prepare_data.aggregate_age_groups(age_group_unknown_added, AGE_GROUP_AGGREGATION_MAP)
-
-# Subtract regeneration cutting data
-if IS_REGENERATION_CUTTING_DATA_AVAILABLE:
-    all_regeneration_cutting = pl.concat([
-        protected_regeneration_cutting_plot,
-        production_regeneration_cutting_plot
-    ])
-
-    age_group_areas_adjusted = prepare_data.subtract_regeneration_cutting(
-        age_group_aggregated,
-        all_regeneration_cutting,
-        REGENERATION_CUTTING_AGE_THRESHOLD
-    )
-else:
-    age_group_areas_adjusted = age_group_aggregated
-
-# Get areas from age group data
-protected_age_group = (
-    age_group_areas_adjusted
-    .filter(
-        col("TYPE") == "protected"
-    )
-)
-protected_areas_plot = prepare_data.get_areas(protected_age_group)
-
-production_age_group = (
-    age_group_areas_adjusted
-    .filter(
-        col("TYPE") == "production"
-    )
-)
-production_areas_plot = prepare_data.get_areas(production_age_group)
-
-# Save prepared age group data
-os.makedirs(
-    os.path.dirname(os.path.join(ROOT_DIR, PROTECTED_AREAS_PLOT_PATH)),
-    exist_ok=True
-)
-protected_areas_plot.write_csv(
-    os.path.join(ROOT_DIR, PROTECTED_AREAS_PLOT_PATH),
-    separator=","
-)
-
-os.makedirs(
-    os.path.dirname(os.path.join(ROOT_DIR, PRODUCTION_AREAS_PLOT_PATH)),
-    exist_ok=True
-)
-production_areas_plot.write_csv(
-    os.path.join(ROOT_DIR, PRODUCTION_AREAS_PLOT_PATH),
-    separator=","
-)
-
-###################
-# Get plot traces #
-###################
-
-traces = []
-
-non_age_group_fields = ["YEAR", "UNIT", "TYPE", "DOMINANT_SPECIES"]
-age_group_names = sorted([
-    name for name in set(production_areas_plot.columns + protected_areas_plot.columns) 
-    if name not in non_age_group_fields
-])
-
-# Add dummy traces to display legend
-legend_colours = plot_data.get_colours(len(age_group_names), LEGEND_COLORSCALE)
-legend_names = age_group_names
-
-if IS_REGENERATION_CUTTING_DATA_AVAILABLE:
-    legend_colours += [REGENERATION_CUTTING_COLOUR]
-    legend_names += [REGENERATION_CUTTING_NAME]
-
-traces += plot_data.get_legend_traces(legend_names, legend_colours)
-
-
-# Add protected area traces
-protected_areas_dict = protected_areas_plot.to_dict(as_series=False)
-# ^ Convert data frames to dicts of lists (each field name is a key and values are a list)
-protected_type_name = protected_areas_dict["TYPE"][0]
-protected_years = protected_areas_dict["YEAR"]
-protected_areas_by_age_group = {key: value for key, value in protected_areas_dict.items() if key not in non_age_group_fields}
-protected_colours = plot_data.get_colours(len(age_group_names), PROTECTED_COLORSCALE)
-protected_colours_by_age_group = dict(zip(protected_areas_by_age_group.keys(), protected_colours))
-
-traces += plot_data.get_area_traces(
-    protected_type_name,
-    protected_years,
-    protected_areas_by_age_group,
-    protected_colours_by_age_group
-)
+PLOT_PARAMETERS = {
+    "x_axis_title": X_AXIS_TITLE,
+    "y_axis_title": Y_AXIS_TITLE,
+    "legend_title": LEGEND_TITLE,
+    "source": SOURCE,
+    "regeneration_cutting_name": REGENERATION_CUTTING_NAME,
+    "production_colorscales": PRODUCTION_COLORSCALES,
+    "protected_colorscale": PROTECTED_COLORSCALE,
+    "legend_colorscale": LEGEND_COLORSCALE,
+    "regeneration_cutting_colour": REGENERATION_CUTTING_COLOUR
+}
+PIPELINE_CONFIG = {
+    "tree_species": TREE_SPECIES,
+    "process_count": PROCESS_COUNT,
+    "render_process_count": RENDER_PROCESS_COUNT,
+    "dag_thread_count": DAG_THREAD_COUNT,
+    "render": not DATA_ONLY,
+    # ^ Render plots to plot_save_paths
+    "plot": not DATA_ONLY,
+    # ^ Get plot figures
+    "root_dir": ROOT_DIR,
+    "age_group_raw_paths": AGE_GROUP_RAW_PATHS,
+    "regeneration_cutting_raw_path": REGENERATION_CUTTING_RAW_PATH,
+    "age_group_clean_path": AGE_GROUP_CLEAN_PATH,
+    "regeneration_cutting_clean_path": REGENERATION_CUTTING_CLEAN_PATH,
+    "cache_dir": os.path.join(ROOT_DIR, CACHE_DIR) if CACHE_DIR is not None else None,
+    "cache_max_size": CACHE_MAX_SIZE,
+    "vintage_store_dir": VINTAGE_STORE_DIR,
+    "storage_formats": STORAGE_FORMATS,
+    # ^ Set to an empty list to skip saving clean and plot data
+    "regeneration_cutting_plot_paths": REGENERATION_CUTTING_PLOT_PATHS,
+    "areas_plot_paths": AREAS_PLOT_PATHS,
+    "areas_slices_path": AREAS_SLICES_PATH,
+    "plot_save_paths": PLOT_SAVE_PATHS,
+    "plot_formats": PLOT_FORMATS,
+    "validate_figures": VALIDATE_FIGURES,
+    "trend_annotations": TREND_ANNOTATIONS,
+    "html_report_path": HTML_REPORT_PATH,
+    "plot_titles": PLOT_TITLES,
+    "translations": TRANSLATION_MAP,
+    "age_group_aggregation_map": AGE_GROUP_AGGREGATION_MAP,
+    "regeneration_cutting_age_threshold": REGENERATION_CUTTING_AGE_THRESHOLD,
+    "regeneration_cutting_metric": REGENERATION_CUTTING_METRIC,
+    "regeneration_cutting_type": REGENERATION_CUTTING_TYPE,
+    "plot_parameters": PLOT_PARAMETERS,
+    "explain_query_plans": EXPLAIN_QUERY_PLANS
+}
+# ^ The pipeline can also be run in process without disk writes, e.g.:
+# results = pipeline.run_pipeline({**PIPELINE_CONFIG, "storage_formats": [], "render": False})
 
-# Add production areas traces
-production_areas_dict = production_areas_plot.to_dict(as_series=False)
-# ^ Convert data frames to dicts of lists (each field name is a key and values are a list)
-production_type_name = production_areas_dict["TYPE"][0]
-production_years = production_areas_dict["YEAR"]
-production_areas_by_age_group = {key: value for key, value in production_areas_dict.items() if key not in non_age_group_fields}
-production_colours = plot_data.get_colours(len(age_group_names), PRODUCTION_COLORSCALE)
-production_colours_by_age_group = dict(zip(production_areas_by_age_group.keys(), production_colours))
 
-traces += plot_data.get_area_traces(
-    production_type_name,
-    production_years,
-    production_areas_by_age_group,
-    production_colours_by_age_group
-)
+if __name__ == "__main__":
 
-# Add regeneration cutting traces
-if IS_REGENERATION_CUTTING_DATA_AVAILABLE:
-    protected_regeneration_cutting_dict = protected_regeneration_cutting_plot.to_dict(as_series=False)
-    # ^ Convert data frames to dicts of lists (each field name is a key and values are a list)
-    protected_regeneration_cutting_years = protected_regeneration_cutting_dict["YEAR"]
-    protected_regeneration_cutting_groups = {key: value for key, value in protected_regeneration_cutting_dict.items() if key not in non_age_group_fields}
-    protected_regeneration_cutting_colours = dict(zip(
-        protected_regeneration_cutting_groups.keys(),
-        [REGENERATION_CUTTING_COLOUR] * len(protected_regeneration_cutting_groups.keys())
-    ))
-    traces += plot_data.get_area_traces(
-        protected_type_name,
-        protected_regeneration_cutting_years,
-        protected_regeneration_cutting_groups,
-        protected_regeneration_cutting_colours
+    parser = argparse.ArgumentParser(description="Clean, prepare and plot age group data.")
+    parser.add_argument("--data-only", action="store_true", help="Only save clean and plot data (see DATA_ONLY)")
+    parser.add_argument(
+        "--dag",
+        action="store_true",
+        help="Run pipeline stages as a DAG: only stages with changed inputs are run, independent stages concurrently"
     )
-
-    production_regeneration_cutting_dict = production_regeneration_cutting_plot.to_dict(as_series=False)
-    # ^ Convert data frames to dicts of lists (each field name is a key and values are a list)
-    production_regeneration_cutting_years = production_regeneration_cutting_dict["YEAR"]
-    production_regeneration_cutting_groups = {key: value for key, value in production_regeneration_cutting_dict.items() if key not in non_age_group_fields}
-    production_regeneration_cutting_colours = dict(zip(
-        production_regeneration_cutting_groups.keys(),
-        [REGENERATION_CUTTING_COLOUR] * len(production_regeneration_cutting_groups.keys())
-    ))
-    traces += plot_data.get_area_traces(
-        production_type_name,
-        production_regeneration_cutting_years,
-        production_regeneration_cutting_groups,
-        production_regeneration_cutting_colours
+    parser.add_argument("--plan", action="store_true", help="Only show the stages that the DAG runner would run")
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Watch raw data files and rebuild only outputs affected by changed files (with the DAG runner)"
     )
-
-
-###################
-# Get plot layout #
-###################
-
-# Apply indicator colours to title string
-plot_title = PLOT_TITLE["text"]
-
-protected_colour = plot_data.get_colours(5, PROTECTED_COLORSCALE)[2]
-plot_title = plot_data.apply_colour_to_substring(
-    plot_title,
-    PLOT_TITLE["apply_protected_colour_to"],
-    protected_colour
-)
-production_colour = plot_data.get_colours(5, PRODUCTION_COLORSCALE)[3]
-plot_title = plot_data.apply_colour_to_substring(
-    plot_title,
-    PLOT_TITLE["apply_production_colour_to"],
-    production_colour
-)
-
-# Get layout
-layout = plot_data.get_layout(
-    plot_title,
-    X_AXIS_TITLE,
-    Y_AXIS_TITLE,
-    LEGEND_TITLE,
-    SOURCE
-)
-
-
-#############
-# Save plot #
-#############
-
-figure = plot_data.get_figure(traces, layout)
-plot_data.save_plot(
-    figure,
-    os.path.join(ROOT_DIR, PLOT_SAVE_PATH)
-)
+    arguments = parser.parse_args()
+
+    config = PIPELINE_CONFIG
+    if arguments.data_only:
+        config = {**PIPELINE_CONFIG, "plot": False, "render": False}
+    if arguments.watch:
+        watch.watch(config, WATCH_INTERVAL, PRINT_RUN_REPORT)
+    if arguments.dag or arguments.plan:
+        profiler = profiling.Profiler(explain=EXPLAIN_QUERY_PLANS)
+        runner = pipeline.get_dag_runner(config, profiler)
+        plan = runner.get_plan()
+        runner.print_plan(plan)
+        if arguments.plan:
+            raise SystemExit
+        runner.run(plan)
+    else:
+        profiler = pipeline.run_pipeline(config).profiler
+
+    ##############
+    # Run report #
+    ##############
+
+    if PRINT_RUN_REPORT:
+        profiler.print_report()
+    if RUN_REPORT_PATH is not None:
+        profiler.save_report(os.path.join(ROOT_DIR, RUN_REPORT_PATH))
@@ -0,0 +1,1202 @@
+# standard
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import glob
+import multiprocessing
+import os
+import re
+from typing import Callable
+import warnings
+# external
+import polars as pl
+from polars import col
+# local
+import cache
+import clean_data
+import dag
+import dimensions
+import prepare_data
+import profiling
+import storage
+import vintages
+# plot_data, render and report (plotly and Kaleido) are imported only when figures are requested, so that data-only runs start faster
+
+
+#########################
+# Functions and classes #
+#########################
+
+NON_AGE_GROUP_FIELDS = ["YEAR", "UNIT", "TYPE", "DOMINANT_SPECIES", "OWNER"]
+REGENERATION_CUTTING_SLICE = {"DOMINANT_SPECIES": "all", "OWNER": "all"}
+# ^ Regeneration cutting data is only available for all tree species and owners combined
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+AGE_GROUP_RAW_FILE_TYPES = ["all", "production"]
+# ^ Forest land types of age group raw files (exports of all and production forest land)
+ALL_SPECIES_GROUP = "all species"
+# ^ DAG node group of age group raw files that can't be split by tree species
+SPECIES_SETTINGS_KEYS = [
+    "root_dir", "storage_formats", "areas_plot_paths", "regeneration_cutting_plot_paths", "plot_save_paths",
+    "plot", "plot_formats", "plot_titles", "plot_parameters", "validate_figures", "trend_annotations"
+]
+# ^ Config keys used by process_species (part of the fingerprint of tree species DAG nodes)
+
+
+def save_data(data: pl.DataFrame, path: str, format_names: list[str]) -> list[str]:
+    """
+    Save data frame in each of the input storage formats (csv, parquet, ipc).
+    File extension of path is set by format.
+    Return saved file paths.
+    """
+    return [storage.write_data(data, path, format_name) for format_name in format_names]
+
+
+def warn_unparseable_numbers(data: pl.DataFrame, source: str) -> None:
+    """
+    Warn about raw values that can't be parsed as numbers (they are set to null in cleaned data).
+    """
+    if data.height == 0:
+        return
+    values = data[clean_data.VALUE_FIELD].unique().head(10).to_list()
+    warnings.warn(f"{data.height} values in {source} can't be parsed as numbers, e.g. {values}")
+
+
+def get_age_group_clean_query(
+        age_group_raw_paths: str,
+        translations: dict,
+        aggregation_map: dict) -> tuple[pl.LazyFrame, pl.LazyFrame]:
+    """
+    Get lazy query of cleaned age group data: all raw files (all and production forest land) are scanned in one pass
+    and cleaned in a single query plan. AGE_GROUP is an enum of the age groups in aggregation_map.
+    DOMINANT_SPECIES and OWNER are categorical.
+    Return cleaned data query and raw data scan.
+    """
+    age_group_raw = clean_data.scan_raw_data(age_group_raw_paths)
+    age_group_clean = (
+        clean_data.clean_age_group_data(
+            age_group_raw,
+            translations,
+            dimensions.get_age_group_enum(aggregation_map),
+            dimensions.SPECIES_DTYPE,
+            dimensions.OWNER_DTYPE
+        )
+        .pipe(clean_data.combine_all_and_production_data)
+    )
+    return age_group_clean, age_group_raw
+
+
+def get_regeneration_cutting_clean_query(regeneration_cutting_raw_path: str) -> tuple[pl.LazyFrame, pl.LazyFrame]:
+    """
+    Get lazy query of cleaned regeneration cutting data.
+    Return cleaned data query and raw data scan.
+    """
+    regeneration_cutting_raw = clean_data.scan_raw_data(regeneration_cutting_raw_path)
+    return clean_data.clean_regeneration_cutting_data(regeneration_cutting_raw), regeneration_cutting_raw
+
+
+def collect_clean_data(clean: pl.LazyFrame, raw: pl.LazyFrame, source: str) -> pl.DataFrame:
+    """
+    Collect cleaned data and unparseable values of raw data together, so that the raw files are scanned once.
+    Warn about unparseable values (see warn_unparseable_numbers).
+    """
+    clean, unparseable = pl.collect_all([clean, clean_data.get_unparseable_numbers(raw)])
+    warn_unparseable_numbers(unparseable, source)
+    return clean
+
+
+def clean_raw_data(
+        age_group_raw_paths: str,
+        regeneration_cutting_raw_path: str | None,
+        translations: dict,
+        aggregation_map: dict,
+        profiler: profiling.Profiler | None = None) -> dict[str, pl.DataFrame]:
+    """
+    Clean age group data and regeneration cutting data (if regeneration_cutting_raw_path is given).
+    See get_age_group_clean_query and get_regeneration_cutting_clean_query.
+    Return dict with keys "age_group" and "regeneration_cutting".
+    """
+    with profiling.stage(profiler, "Clean data") as record:
+        age_group_clean, age_group_raw = get_age_group_clean_query(age_group_raw_paths, translations, aggregation_map)
+        if profiler is not None:
+            profiler.add_query_plan(record, age_group_clean)
+        out = {"age_group": collect_clean_data(age_group_clean, age_group_raw, age_group_raw_paths)}
+
+        if regeneration_cutting_raw_path is not None:
+            regeneration_cutting_clean, regeneration_cutting_raw = get_regeneration_cutting_clean_query(regeneration_cutting_raw_path)
+            if profiler is not None:
+                profiler.add_query_plan(record, regeneration_cutting_clean)
+            out["regeneration_cutting"] = collect_clean_data(
+                regeneration_cutting_clean,
+                regeneration_cutting_raw,
+                regeneration_cutting_raw_path
+            )
+        record.rows_out = profiling.get_rows(out)
+    return out
+
+
+def get_clean_cache_key(
+        age_group_raw_paths: str,
+        regeneration_cutting_raw_path: str | None,
+        translations: dict,
+        aggregation_map: dict) -> str:
+    """
+    Get cache key of cleaned data from raw input file contents, translations,
+    age groups (they define the AGE_GROUP enum) and cleaning code.
+    """
+    key = cache.get_key(
+        "clean",
+        cache.get_files_hash(age_group_raw_paths),
+        cache.get_files_hash(regeneration_cutting_raw_path) if regeneration_cutting_raw_path is not None else None,
+        translations,
+        sorted(dimensions.get_age_group_enum(aggregation_map).categories.to_list()),
+        cache.get_file_hash(clean_data.__file__),
+        cache.get_file_hash(dimensions.__file__)
+    )
+    return key
+
+
+def prepare_regeneration_cutting_plot_data(
+        regeneration_cutting: pl.DataFrame,
+        year_min: int,
+        year_max: int,
+        metric: str = "AREA",
+        cutting_type: str = "total") -> dict[str, pl.DataFrame]:
+    """
+    Align a metric of a cutting type of cleaned regeneration cutting data (see clean_data.clean_regeneration_cutting_data)
+    to input year range for protected and production forest.
+    Assume negligible regeneration cutting in protected forests.
+    Assume that all regeneration cutting data is for production forest.
+    Areas are subtracted from age groups only with the default metric and cutting type (total AREA, see get_areas_query).
+    Return dict with keys "protected" and "production".
+    """
+    # Create a dummy data frame for regeneration data of protected forest
+    protected_regeneration_cutting_raw = regeneration_cutting.clear()
+    out = {
+        "protected": prepare_data.align_regeneration_cutting_data(
+            data=protected_regeneration_cutting_raw,
+            year_min=year_min,
+            year_max=year_max,
+            type_name="protected",
+            metric=metric,
+            cutting_type=cutting_type
+        ),
+        "production": prepare_data.align_regeneration_cutting_data(
+            data=regeneration_cutting,
+            year_min=year_min,
+            year_max=year_max,
+            type_name="production",
+            metric=metric,
+            cutting_type=cutting_type
+        )
+    }
+    return out
+
+
+def get_slice_filter(slice_values: dict) -> pl.Expr:
+    """
+    Get filter expression of a data slice, e.g. {"DOMINANT_SPECIES": "all", "OWNER": "all"}.
+    """
+    return pl.all_horizontal([col(field) == value for field, value in slice_values.items()])
+
+
+def get_areas_query(
+        age_group: pl.DataFrame | pl.LazyFrame,
+        aggregation_map: dict,
+        regeneration_cutting: dict[str, pl.DataFrame] | None,
+        regeneration_cutting_age_threshold: int) -> pl.LazyFrame:
+    """
+    Get lazy query of areas by age group for all slices (tree species, owner and type).
+    Add unknown area to age groups proportionately, aggregate age groups
+    and subtract regeneration cutting from the slice of REGENERATION_CUTTING_SLICE (if regeneration cutting data is given),
+    all in one query (see prepare_data.prepare_areas).
+    """
+    out = (
+        prepare_data.prepare_areas(
+            age_group.lazy(),
+            aggregation_map,
+            dimensions.get_age_group_dimension(aggregation_map),
+            pl.concat([regeneration_cutting["protected"], regeneration_cutting["production"]]).lazy()
+            if regeneration_cutting is not None else None,
+            regeneration_cutting_age_threshold,
+            get_slice_filter(REGENERATION_CUTTING_SLICE)
+        )
+    )
+    return out.sort(*prepare_data.get_slice_fields(out), "TYPE", "YEAR", "AGE_GROUP")
+
+
+def prepare_areas_data(
+        age_group: pl.DataFrame,
+        aggregation_map: dict,
+        regeneration_cutting: dict[str, pl.DataFrame] | None,
+        regeneration_cutting_age_threshold: int) -> pl.DataFrame:
+    """
+    Get areas by age group for all slices (tree species, owner and type) in one grouped pass (see get_areas_query).
+    Return long data with DOMINANT_SPECIES, OWNER, YEAR, TYPE, AGE_GROUP, AREA and UNIT.
+    """
+    return get_areas_query(age_group, aggregation_map, regeneration_cutting, regeneration_cutting_age_threshold).collect()
+
+
+def get_slice_areas(areas: pl.DataFrame, tree_species: str, owner: str = "all") -> dict[str, pl.DataFrame]:
+    """
+    Get plot areas by age group of a single tree species and owner from areas data of all slices (see prepare_areas_data).
+    Return dict with keys "protected" and "production".
+    """
+    areas_slice = (
+        areas
+        .filter(get_slice_filter({"DOMINANT_SPECIES": tree_species, "OWNER": owner}))
+        .drop(prepare_data.SLICE_FIELDS)
+    )
+    out = {
+        type_name: prepare_data.get_areas(
+            areas_slice
+            .filter(col("TYPE") == type_name)
+        )
+        for type_name in ["protected", "production"]
+    }
+    return out
+
+
+def prepare_areas_plot_data(
+        age_group: pl.DataFrame,
+        tree_species: str,
+        aggregation_map: dict,
+        regeneration_cutting: dict[str, pl.DataFrame] | None,
+        regeneration_cutting_age_threshold: int) -> dict[str, pl.DataFrame]:
+    """
+    Get plot areas by age group for input tree species (all owners).
+    See prepare_areas_data and get_slice_areas.
+    Return dict with keys "protected" and "production".
+    """
+    areas = prepare_areas_data(
+        age_group.filter(col("DOMINANT_SPECIES") == tree_species),
+        aggregation_map,
+        regeneration_cutting,
+        regeneration_cutting_age_threshold
+    )
+    return get_slice_areas(areas, tree_species)
+
+
+def prepare_areas_sweep_data(
+        age_group: pl.DataFrame,
+        tree_species: str,
+        aggregation_maps: list[dict],
+        regeneration_cutting: dict[str, pl.DataFrame] | None,
+        regeneration_cutting_age_thresholds: list[int]) -> pl.DataFrame:
+    """
+    Get areas by age group for input tree species for each combination of aggregation map and regeneration cutting
+    age threshold (scenario) in one vectorized query. See prepare_areas_plot_data.
+    Return long data with SCENARIO, AGGREGATION_MAP (index in aggregation_maps), THRESHOLD, DOMINANT_SPECIES, OWNER,
+    YEAR, TYPE, AGE_GROUP, AREA and UNIT (THRESHOLD only if regeneration cutting data is given).
+    """
+    age_group_dtype = dimensions.get_age_group_enum(*aggregation_maps)
+    age_group_dimension = dimensions.get_age_group_dimension(aggregation_maps[0], age_group_dtype)
+
+    age_group_species = (
+        age_group
+        .filter(col("DOMINANT_SPECIES") == tree_species)
+        .with_columns(col("AGE_GROUP").cast(pl.String).cast(age_group_dtype))
+        # ^ Aggregated age groups of all maps must be categories of AGE_GROUP
+    )
+
+    # Add unknown area to the age group area proportionately
+    age_group_known = (
+        age_group_species
+        .filter(col("AGE_GROUP") != dimensions.UNKNOWN_AGE_GROUP)
+    )
+    age_group_unknown = (
+        age_group_species
+        .filter(col("AGE_GROUP") == dimensions.UNKNOWN_AGE_GROUP)
+    )
+    age_group_unknown_added = prepare_data.add_unknown_data(age_group_known, age_group_unknown)
+
+    # Aggregate age groups by each map
+    age_group_aggregated = prepare_data.aggregate_age_groups_sweep(age_group_unknown_added, aggregation_maps)
+
+    # Subtract regeneration cutting data with each threshold
+    if regeneration_cutting is not None:
+        age_group_areas_adjusted = prepare_data.subtract_regeneration_cutting_sweep(
+            age_group_aggregated,
+            pl.concat([regeneration_cutting["protected"], regeneration_cutting["production"]]),
+            regeneration_cutting_age_thresholds,
+            age_group_dimension,
+            get_slice_filter(REGENERATION_CUTTING_SLICE)
+        )
+    else:
+        age_group_areas_adjusted = age_group_aggregated
+
+    out = age_group_areas_adjusted.sort(*prepare_data.get_slice_fields(age_group_areas_adjusted), "TYPE", "YEAR", "AGE_GROUP")
+    return out
+
+
+def get_age_group_names(areas: dict[str, pl.DataFrame]) -> list[str]:
+    """
+    Get sorted age group names from the fields of area data frames.
+    """
+    fields = set()
+    for data in areas.values():
+        fields.update(data.columns)
+    return sorted([name for name in fields if name not in NON_AGE_GROUP_FIELDS])
+
+
+def get_traces(
+        areas: dict[str, pl.DataFrame],
+        regeneration_cutting: dict[str, pl.DataFrame] | None,
+        plot_parameters: dict,
+        production_colorscale: str) -> list:
+    """
+    Get legend, area and regeneration cutting traces (dicts in plotly json structure, not validated)
+    for protected and production forest. Trace values are taken from data frame columns directly.
+    """
+    import plot_data
+    traces = []
+    age_group_names = get_age_group_names(areas)
+
+    # Add dummy traces to display legend
+    legend_colours = plot_data.get_colours(len(age_group_names), plot_parameters["legend_colorscale"])
+    legend_names = age_group_names
+
+    if regeneration_cutting is not None:
+        legend_colours += [plot_parameters["regeneration_cutting_colour"]]
+        legend_names += [plot_parameters["regeneration_cutting_name"]]
+
+    traces += plot_data.get_legend_trace_dicts(legend_names, legend_colours)
+
+    # Add area traces
+    colorscales = {
+        "protected": plot_parameters["protected_colorscale"],
+        "production": production_colorscale
+    }
+    type_names = {}
+    for type_key in ["protected", "production"]:
+        data = areas[type_key]
+        type_names[type_key] = data["TYPE"][0]
+        age_group_fields = [field for field in data.columns if field not in NON_AGE_GROUP_FIELDS]
+        colours = plot_data.get_colours(len(age_group_names), colorscales[type_key])
+        colours_by_age_group = dict(zip(age_group_fields, colours))
+
+        traces += plot_data.get_area_trace_dicts(
+            type_names[type_key],
+            data["YEAR"],
+            data.select(age_group_fields),
+            colours_by_age_group
+        )
+
+    # Add regeneration cutting traces
+    if regeneration_cutting is not None:
+        for type_key in ["protected", "production"]:
+            data = regeneration_cutting[type_key]
+            regeneration_cutting_fields = [field for field in data.columns if field not in NON_AGE_GROUP_FIELDS]
+            regeneration_cutting_colours = dict(zip(
+                regeneration_cutting_fields,
+                [plot_parameters["regeneration_cutting_colour"]] * len(regeneration_cutting_fields)
+            ))
+            traces += plot_data.get_area_trace_dicts(
+                type_names[type_key],
+                data["YEAR"],
+                data.select(regeneration_cutting_fields),
+                regeneration_cutting_colours
+            )
+
+    return traces
+
+
+def get_plot_layout(title: dict, plot_parameters: dict, production_colorscale: str):
+    """
+    Apply indicator colours to title string and get plot layout.
+    """
+    import plot_data
+    plot_title = title["text"]
+
+    protected_colour = plot_data.get_colours(5, plot_parameters["protected_colorscale"])[2]
+    plot_title = plot_data.apply_colour_to_substring(
+        plot_title,
+        title["apply_protected_colour_to"],
+        protected_colour
+    )
+    production_colour = plot_data.get_colours(5, production_colorscale)[3]
+    plot_title = plot_data.apply_colour_to_substring(
+        plot_title,
+        title["apply_production_colour_to"],
+        production_colour
+    )
+
+    layout = plot_data.get_layout(
+        plot_title,
+        plot_parameters["x_axis_title"],
+        plot_parameters["y_axis_title"],
+        plot_parameters["legend_title"],
+        plot_parameters["source"]
+    )
+    return layout
+
+
+def get_prepare_cache_key(
+        clean_cache_key: str,
+        aggregation_map: dict,
+        regeneration_cutting_age_threshold: int,
+        regeneration_cutting_metric: str = "AREA",
+        regeneration_cutting_type: str = "total") -> str:
+    """
+    Get cache key of prepared data from cleaned data cache key, prepare parameters and prepare code.
+    """
+    key = cache.get_key(
+        "prepare",
+        clean_cache_key,
+        aggregation_map,
+        regeneration_cutting_age_threshold,
+        regeneration_cutting_metric,
+        regeneration_cutting_type,
+        cache.get_file_hash(prepare_data.__file__),
+        cache.get_file_hash(__file__)
+    )
+    return key
+
+
+def cached_stage(
+        config: dict,
+        key: str | None,
+        compute: Callable[[], dict[str, pl.DataFrame]],
+        name: str,
+        rows_in: int | None = None,
+        profiler: profiling.Profiler | None = None) -> dict[str, pl.DataFrame]:
+    """
+    Load data frames from cache in config["cache_dir"] by key or compute and cache them (see cache.cached).
+    compute records its own stages. A cache hit is recorded as stage name with the cached flag and the bytes read.
+    Caching is disabled if key is None.
+    """
+    cache_dir = config.get("cache_dir") if key is not None else None
+    max_size = config.get("cache_max_size", cache.DEFAULT_MAX_SIZE)
+    entry_size = cache.get_entry_size(cache_dir, key) if cache_dir is not None else None
+    if entry_size is None:
+        return cache.cached(cache_dir, key, compute, max_size)
+    with profiling.stage(profiler, name, rows_in) as record:
+        out = cache.cached(cache_dir, key, compute, max_size)
+        record.cached = True
+        record.bytes_read = entry_size
+        record.rows_out = profiling.get_rows(out)
+    return out
+
+
+def prepare_stage(
+        clean: dict[str, pl.DataFrame],
+        config: dict,
+        clean_cache_key: str | None = None,
+        profiler: profiling.Profiler | None = None) -> tuple[pl.DataFrame, dict[str, pl.DataFrame] | None]:
+    """
+    Prepare regeneration cutting plot data (if cleaned regeneration cutting data is given, metric and cutting type
+    from config["regeneration_cutting_metric"] and config["regeneration_cutting_type"], total area by default)
+    and areas data of all slices from cleaned data (or load from cache if clean_cache_key and config["cache_dir"] are given).
+    Stages are recorded with profiler if it is given (a single cached "Prepare data" stage on cache hits).
+    Return areas data (see prepare_areas_data) and regeneration cutting plot data by type (None if not available).
+    """
+    age_group_clean = clean["age_group"]
+    regeneration_cutting_clean = clean.get("regeneration_cutting")
+    metric = config.get("regeneration_cutting_metric", "AREA")
+    cutting_type = config.get("regeneration_cutting_type", "total")
+
+    def prepare() -> dict[str, pl.DataFrame]:
+        out = {}
+        regeneration_cutting_plot = None
+        regeneration_cutting_areas = None
+        if regeneration_cutting_clean is not None:
+            with profiling.stage(profiler, "Prepare regeneration cutting plot data", regeneration_cutting_clean.height) as record:
+                regeneration_cutting_areas = prepare_regeneration_cutting_plot_data(
+                    regeneration_cutting_clean,
+                    year_min=age_group_clean["YEAR"].min(),
+                    year_max=age_group_clean["YEAR"].max()
+                )
+                regeneration_cutting_plot = regeneration_cutting_areas
+                if (metric, cutting_type) != ("AREA", "total"):
+                    regeneration_cutting_plot = prepare_regeneration_cutting_plot_data(
+                        regeneration_cutting_clean,
+                        year_min=age_group_clean["YEAR"].min(),
+                        year_max=age_group_clean["YEAR"].max(),
+                        metric=metric,
+                        cutting_type=cutting_type
+                    )
+                    # ^ Plotted metric. Total area is still subtracted from age groups.
+                record.rows_out = profiling.get_rows(regeneration_cutting_plot)
+            out.update({
+                f"regeneration_cutting_{type_name}": data
+                for type_name, data in regeneration_cutting_plot.items()
+            })
+            # ^ Flattened to {"regeneration_cutting_<type>": data frame} for caching
+
+        with profiling.stage(profiler, "Prepare areas data", age_group_clean.height) as record:
+            areas = get_areas_query(
+                age_group_clean,
+                config["age_group_aggregation_map"],
+                regeneration_cutting_areas,
+                config["regeneration_cutting_age_threshold"]
+            )
+            if profiler is not None:
+                profiler.add_query_plan(record, areas)
+            out["areas"] = areas.collect()
+            record.rows_out = out["areas"].height
+        return out
+
+    prepare_cache_key = None
+    if config.get("cache_dir") is not None and clean_cache_key is not None:
+        prepare_cache_key = get_prepare_cache_key(
+            clean_cache_key,
+            config["age_group_aggregation_map"],
+            config["regeneration_cutting_age_threshold"],
+            metric,
+            cutting_type
+        )
+    prepared = cached_stage(config, prepare_cache_key, prepare, "Prepare data", age_group_clean.height, profiler)
+
+    regeneration_cutting_plot = None
+    if "regeneration_cutting_production" in prepared:
+        regeneration_cutting_plot = {
+            type_name: prepared[f"regeneration_cutting_{type_name}"]
+            for type_name in ["protected", "production"]
+        }
+    return prepared["areas"], regeneration_cutting_plot
+
+
+def process_species(
+        tree_species: str,
+        areas: pl.DataFrame,
+        regeneration_cutting_plot: dict[str, pl.DataFrame] | None,
+        settings: dict,
+        profiler: profiling.Profiler | None = None) -> dict:
+    """
+    Get plot data and plot for a single tree species (all owners) from prepared areas data of all slices.
+    Regeneration cutting is only used if it is given and tree_species is "all"
+    (there is no regeneration cutting data by individual species).
+    Save plot data to paths in settings (formatted with tree_species) in each of settings["storage_formats"].
+    Figure is skipped if settings["plot"] is False. Trend slopes are added to it if settings["trend_annotations"] is True.
+    Stages are recorded with profiler if it is given.
+    Return dict with keys "areas" and "regeneration_cutting" (plot data by type, None if not available),
+    "plot_save_path" and "figure" (as dict, ready for rendering. None if skipped).
+    """
+    root_dir = settings["root_dir"]
+
+    if tree_species != REGENERATION_CUTTING_SLICE["DOMINANT_SPECIES"]:
+        regeneration_cutting_plot = None
+    with profiling.stage(profiler, "Get areas plot data", areas.height, tree_species) as record:
+        areas_plot = get_slice_areas(areas, tree_species)
+        record.rows_out = profiling.get_rows(areas_plot)
+    out = {
+        "areas": areas_plot,
+        "regeneration_cutting": regeneration_cutting_plot,
+        "plot_save_path": os.path.join(root_dir, settings["plot_save_paths"][tree_species]),
+        "figure": None
+    }
+
+    # Save plot data
+    if settings["storage_formats"]:
+        with profiling.stage(profiler, "Save plot data", label=tree_species) as record:
+            plot_data_paths = {
+                **({
+                    settings["regeneration_cutting_plot_paths"][type_name]: data
+                    for type_name, data in regeneration_cutting_plot.items()
+                } if regeneration_cutting_plot is not None else {}),
+                **{
+                    settings["areas_plot_paths"][type_name]: data
+                    for type_name, data in areas_plot.items()
+                }
+            }
+            for path, data in plot_data_paths.items():
+                saved_paths = save_data(
+                    data,
+                    os.path.join(root_dir, path.format(tree_species=tree_species)),
+                    settings["storage_formats"]
+                )
+                record.bytes_written += profiling.get_file_sizes(saved_paths)
+
+    if not settings.get("plot", True):
+        return out
+
+    # Get plot traces and layout
+    plot_parameters = settings["plot_parameters"]
+    production_colorscale = plot_parameters["production_colorscales"][tree_species]
+    with profiling.stage(profiler, "Get plot traces", profiling.get_rows(areas_plot), tree_species) as record:
+        traces = get_traces(areas_plot, regeneration_cutting_plot, plot_parameters, production_colorscale)
+        record.rows_out = len(traces)
+    with profiling.stage(profiler, "Get plot layout", label=tree_species):
+        layout = get_plot_layout(settings["plot_titles"][tree_species], plot_parameters, production_colorscale)
+
+    # Get figure (rendering is done separately, see render module)
+    import plot_data
+    out["figure"] = plot_data.get_figure_dict(traces, layout, validate=settings.get("validate_figures", False))
+    if settings.get("trend_annotations", False):
+        import trends
+        with profiling.stage(profiler, "Get trend annotation", profiling.get_rows(areas_plot), tree_species):
+            out["figure"]["layout"]["annotations"] = [
+                *out["figure"]["layout"].get("annotations", []),
+                trends.get_trend_annotation(trends.get_trend_summary(areas_plot), areas_plot["production"]["UNIT"][0])
+            ]
+    return out
+
+
+def process_species_profiled(
+        tree_species: str,
+        areas: pl.DataFrame,
+        regeneration_cutting_plot: dict[str, pl.DataFrame] | None,
+        settings: dict,
+        explain: bool = False) -> tuple[dict, list[profiling.StageRecord]]:
+    """
+    Run process_species with a new profiler and return its stage records with the results.
+    Used in worker processes, where the profiler of the main process is not available.
+    """
+    profiler = profiling.Profiler(explain)
+    out = process_species(
+        tree_species,
+        areas,
+        regeneration_cutting_plot,
+        settings,
+        profiler
+    )
+    return out, profiler.stages
+
+
+@dataclass
+class PipelineResults:
+    age_group: pl.DataFrame
+    # ^ Cleaned age group data (all tree species)
+    regeneration_cutting: pl.DataFrame | None
+    # ^ Cleaned regeneration cutting data (None if not used)
+    areas_data: pl.DataFrame | None = None
+    # ^ Long areas data of all slices (tree species, owner and type), see prepare_areas_data
+    areas: dict[str, dict[str, pl.DataFrame]] = field(default_factory=dict)
+    # ^ Areas plot data by tree species and type (protected, production)
+    regeneration_cutting_plot: dict[str, dict[str, pl.DataFrame]] = field(default_factory=dict)
+    # ^ Regeneration cutting plot data by tree species and type (only tree species with regeneration cutting data)
+    figures: dict[str, dict] = field(default_factory=dict)
+    # ^ Figures (dicts in plotly json structure) by tree species
+    plot_save_paths: dict[str, str] = field(default_factory=dict)
+    # ^ Plot save paths by tree species (plots are only saved if config["render"] is True)
+    profiler: profiling.Profiler | None = None
+
+
+def clean_stage(config: dict, profiler: profiling.Profiler | None = None) -> tuple[dict[str, pl.DataFrame], str | None]:
+    """
+    Clean raw data in config (or load from cache if inputs are unchanged).
+    Regeneration cutting data is only cleaned if "all" is in config["tree_species"].
+    Return cleaned data and its cache key (None if caching is disabled).
+    """
+    root_dir = config["root_dir"]
+    age_group_raw_paths = os.path.join(root_dir, config["age_group_raw_paths"])
+    regeneration_cutting_raw_path = (
+        os.path.join(root_dir, config["regeneration_cutting_raw_path"])
+        if config.get("regeneration_cutting_raw_path") is not None and "all" in config["tree_species"] else None
+    )
+    # ^ Regeneration cutting data is only available for all tree species combined
+
+    clean_cache_key = None
+    if config.get("cache_dir") is not None:
+        clean_cache_key = get_clean_cache_key(
+            age_group_raw_paths,
+            regeneration_cutting_raw_path,
+            config["translations"],
+            config["age_group_aggregation_map"]
+        )
+    clean = cached_stage(
+        config,
+        clean_cache_key,
+        lambda: clean_raw_data(
+            age_group_raw_paths,
+            regeneration_cutting_raw_path,
+            config["translations"],
+            config["age_group_aggregation_map"],
+            profiler
+        ),
+        "Clean data",
+        profiler=profiler
+    )
+    return clean, clean_cache_key
+
+
+def run_pipeline(config: dict, profiler: profiling.Profiler | None = None) -> PipelineResults:
+    """
+    Run the full pipeline in process: clean raw data, prepare areas data of all slices (tree species, owner and type)
+    in one pass and get plot data and figures for each tree species in config["tree_species"].
+    Results are returned in memory.
+    Disk writes are optional sinks:
+        clean data is saved if config["age_group_clean_path"] / config["regeneration_cutting_clean_path"] are set,
+        areas of all slices are saved if config["areas_slices_path"] is set,
+        clean and plot data are saved in each of config["storage_formats"] (none if empty),
+        raw files are appended to the vintage store in config["vintage_store_dir"] if it is set (see vintages.ingest_raw_data),
+        plots are saved if config["render"] is True: rendered to config["plot_save_paths"] (with the file extension of the format)
+        in each image format (png, svg, pdf) in config["plot_formats"], or copied from the render cache in config["cache_dir"]
+        if the same figure has been rendered before, and as a single interactive report of all tree species to config["html_report_path"] if "html" is in config["plot_formats"].
+    Species are processed in config["process_count"] worker processes (serially if 1)
+    and plots are rendered in config["render_process_count"] worker processes.
+    See main.PIPELINE_CONFIG for all config keys.
+    A new profiler is created if it is not given (see PipelineResults.profiler).
+    """
+    if profiler is None:
+        profiler = profiling.Profiler(explain=config.get("explain_query_plans", False))
+    root_dir = config["root_dir"]
+    storage_formats = config.get("storage_formats", [])
+
+    ##############
+    # Clean data #
+    ##############
+
+    # New export vintages are appended to the vintage store before cleaning (ingested files are skipped by hash)
+    if config.get("vintage_store_dir") is not None:
+        with profiler.stage("Ingest vintages") as record:
+            store_dir = os.path.join(root_dir, config["vintage_store_dir"])
+            ingested = vintages.ingest_raw_data(
+                store_dir,
+                os.path.join(root_dir, config["age_group_raw_paths"]),
+                os.path.join(root_dir, config["regeneration_cutting_raw_path"])
+                if config.get("regeneration_cutting_raw_path") is not None else None
+            )
+            record.rows_out = sum(entry["appended"] + entry["deleted"] for entries in ingested.values() for entry in entries)
+            record.bytes_written = profiling.get_file_sizes([
+                os.path.join(store_dir, dataset, vintages.SEGMENT_DIR, entry["segment"])
+                for dataset, entries in ingested.items()
+                for entry in entries
+                if entry["segment"] is not None
+            ])
+
+    # All age group raw files are scanned lazily in one pass
+    clean, clean_cache_key = clean_stage(config, profiler)
+    results = PipelineResults(
+        age_group=clean["age_group"],
+        regeneration_cutting=clean.get("regeneration_cutting"),
+        profiler=profiler
+    )
+
+    clean_paths = {
+        "age_group": config.get("age_group_clean_path"),
+        "regeneration_cutting": config.get("regeneration_cutting_clean_path")
+    }
+    if storage_formats and any(path is not None and key in clean for key, path in clean_paths.items()):
+        with profiler.stage("Save clean data") as record:
+            for key in ["regeneration_cutting", "age_group"]:
+                if key not in clean or clean_paths[key] is None:
+                    continue
+                saved_paths = save_data(clean[key], os.path.join(root_dir, clean_paths[key]), storage_formats)
+                record.bytes_written += profiling.get_file_sizes(saved_paths)
+
+
+    ################
+    # Prepare data #
+    ################
+
+    # Areas of all slices are prepared in one grouped pass
+    results.areas_data, regeneration_cutting_plot = prepare_stage(clean, config, clean_cache_key, profiler)
+
+    if storage_formats and config.get("areas_slices_path") is not None:
+        with profiler.stage("Save areas data") as record:
+            saved_paths = save_data(
+                prepare_data.get_areas(results.areas_data),
+                os.path.join(root_dir, config["areas_slices_path"]),
+                storage_formats
+            )
+            record.bytes_written += profiling.get_file_sizes(saved_paths)
+
+
+    ########################
+    # Plot by tree species #
+    ########################
+
+    # Each species gets its plot data from the areas of all slices and gets plot traces and layout.
+    settings = {**config, "storage_formats": storage_formats}
+    tree_species_results = {}
+    process_count = config.get("process_count", 1)
+    if process_count > 1:
+        with ProcessPoolExecutor(
+                max_workers=process_count,
+                mp_context=multiprocessing.get_context("spawn")) as executor:
+            # ^ spawn instead of fork, because polars thread pool doesn't survive fork
+            futures = {
+                tree_species: executor.submit(
+                    process_species_profiled,
+                    tree_species,
+                    results.areas_data,
+                    regeneration_cutting_plot,
+                    settings,
+                    profiler.explain
+                )
+                for tree_species in config["tree_species"]
+            }
+            for tree_species, future in futures.items():
+                tree_species_results[tree_species], stages = future.result()
+                profiler.extend(stages)
+    else:
+        for tree_species in config["tree_species"]:
+            tree_species_results[tree_species] = process_species(
+                tree_species,
+                results.areas_data,
+                regeneration_cutting_plot,
+                settings,
+                profiler
+            )
+
+    for tree_species, out in tree_species_results.items():
+        results.areas[tree_species] = out["areas"]
+        if out["regeneration_cutting"] is not None:
+            results.regeneration_cutting_plot[tree_species] = out["regeneration_cutting"]
+        if out["figure"] is not None:
+            results.figures[tree_species] = out["figure"]
+        results.plot_save_paths[tree_species] = out["plot_save_path"]
+
+
+    #############
+    # Save plot #
+    #############
+
+    plot_formats = config.get("plot_formats", ["png"])
+    if config.get("render", False) and results.figures:
+        import render
+        image_formats = [image_format for image_format in render.IMAGE_FORMATS if image_format in plot_formats]
+        with render.RenderPool(config.get("render_process_count", 1)) as render_pool:
+            for image_format in image_formats:
+                figures = {
+                    render.get_image_path(results.plot_save_paths[tree_species], image_format): figure
+                    for tree_species, figure in results.figures.items()
+                }
+                render_results = render_pool.render(
+                    figures,
+                    image_format,
+                    config.get("cache_dir"),
+                    config.get("cache_max_size", cache.DEFAULT_MAX_SIZE)
+                )
+                for result in render_results:
+                    profiler.extend([
+                        profiling.StageRecord(
+                            name="Load cached plot" if result.cached else "Save plot",
+                            wall_seconds=result.seconds,
+                            cpu_seconds=None,
+                            bytes_written=os.path.getsize(result.path),
+                            cached=result.cached,
+                            label=os.path.basename(result.path)
+                        )
+                    ])
+                    # ^ Rendered in worker processes: only the worker wall time is recorded
+
+    if config.get("render", False) and results.figures and "html" in plot_formats:
+        import report
+        with profiler.stage("Save HTML report") as record:
+            report_path = report.write_html_report(results.figures, os.path.join(root_dir, config["html_report_path"]))
+            record.bytes_written = os.path.getsize(report_path)
+
+    return results
+
+
+def get_age_group_raw_paths_by_species(age_group_raw_paths: str) -> dict[str, list[str]] | None:
+    """
+    Get age group raw file paths matching a glob pattern by tree species. The part of the file name matched by the
+    wildcard of the pattern is {tree species}_{all|production}, spaces in tree species replaced by underscores,
+    e.g. "..._data_*.csv" matches "..._data_black_alder_production.csv".
+    Return None if the pattern doesn't have a single wildcard in the file name or any file name doesn't follow this naming.
+    """
+    file_name_pattern = os.path.basename(age_group_raw_paths)
+    if file_name_pattern.count("*") != 1 or any(character in file_name_pattern for character in "?["):
+        return None
+    file_name_regex = re.compile(re.escape(file_name_pattern).replace(r"\*", "(?P<name>.+)") + "$")
+    out = {}
+    for path in sorted(glob.glob(age_group_raw_paths)):
+        match = file_name_regex.match(os.path.basename(path))
+        tree_species, _, file_type = match["name"].rpartition("_") if match is not None else ("", "", "")
+        if not tree_species or file_type not in AGE_GROUP_RAW_FILE_TYPES:
+            return None
+        out.setdefault(tree_species.replace("_", " "), []).append(path)
+    return out
+
+
+def concat_node_values(inputs: dict, names: list[str], key: str, sort_fields: list[str] | None = None) -> pl.DataFrame:
+    """
+    Concatenate data frames (key) of DAG node values (see get_dag_nodes) and sort them by sort_fields.
+    Categorical fields are concatenated as strings, because node values have their own categorical encodings.
+    """
+    frames = [inputs[name][key] for name in names]
+    schema = frames[0].schema
+    categorical_fields = [field for field, dtype in schema.items() if dtype == pl.Categorical]
+    out = (
+        pl.concat([frame.with_columns(col(categorical_fields).cast(pl.String)) for frame in frames])
+        .with_columns([col(field).cast(schema[field]) for field in categorical_fields])
+    )
+    return out.sort(sort_fields) if sort_fields else out
+
+
+def get_dag_nodes(config: dict) -> list[dag.Node]:
+    """
+    Get pipeline stages as DAG nodes (see dag.Runner) with the same config as run_pipeline:
+    age group data is cleaned and prepared (areas of all slices) by tree species (see get_age_group_raw_paths_by_species)
+    and regeneration cutting data in an independent branch (only if "all" is in config["tree_species"]).
+    Each tree species in config["tree_species"] saves its plot data and renders its plots in a node of its own,
+    so that a changed raw file only affects the nodes of its tree species.
+    Only the tree species in config["tree_species"] are cleaned and prepared. Their clean and areas data are saved
+    in nodes of their own and the HTML report
+    (if "html" is in config["plot_formats"]) is written in a node that depends only on the prepared data.
+    Raw files are appended to the vintage store in config["vintage_store_dir"] (if it is set) in a node per dataset
+    that depends only on the raw files, so that refreshed exports are ingested in watch mode too.
+    """
+    root_dir = config["root_dir"]
+    storage_formats = config.get("storage_formats", [])
+    translations = config["translations"]
+    aggregation_map = config["age_group_aggregation_map"]
+    threshold = config["regeneration_cutting_age_threshold"]
+    regeneration_cutting_metric = config.get("regeneration_cutting_metric", "AREA")
+    regeneration_cutting_type = config.get("regeneration_cutting_type", "total")
+    age_group_raw_paths = os.path.join(root_dir, config["age_group_raw_paths"])
+    regeneration_cutting_raw_path = (
+        os.path.join(root_dir, config["regeneration_cutting_raw_path"])
+        if config.get("regeneration_cutting_raw_path") is not None and "all" in config["tree_species"] else None
+    )
+    clean_code = [clean_data.__file__, dimensions.__file__]
+    prepare_code = [prepare_data.__file__, dimensions.__file__, __file__]
+    plot_code = [__file__] + [os.path.join(SOURCE_DIR, f"{name}.py") for name in ["plot_data", "render", "report"]]
+    # ^ Plotting modules are not imported for fingerprints
+    render_plots = config.get("render", False) and config.get("plot", True)
+    plot_formats = config.get("plot_formats", ["png"])
+    image_formats = []
+    if render_plots:
+        import render
+        image_formats = [image_format for image_format in render.IMAGE_FORMATS if image_format in plot_formats]
+    has_regeneration_cutting = regeneration_cutting_raw_path is not None
+
+    def save_node(name: str, input_names: list[str], key: str, sort_fields: list[str] | None, path: str | None) -> list[dag.Node]:
+        # Node that saves data frames of input nodes (concatenated and sorted) in each storage format (none if not saved)
+        if not storage_formats or path is None:
+            return []
+        path = os.path.join(root_dir, path)
+
+        def save(inputs: dict) -> None:
+            data = concat_node_values(inputs, input_names, key, sort_fields)
+            save_data(prepare_data.get_areas(data) if key == "areas" else data, path, storage_formats)
+            # ^ Areas of all slices are saved in wide format (see run_pipeline)
+
+        return [dag.Node(
+            name=name,
+            function=save,
+            inputs=input_names,
+            parameters=[path, storage_formats],
+            outputs=[storage.get_path(path, format_name) for format_name in storage_formats],
+            cached=False
+        )]
+
+    # Age group raw files are cleaned and prepared by tree species (from file names), so that a changed file
+    # only affects its own tree species. All files are in one group if file names don't follow the export naming.
+    raw_paths_by_species = get_age_group_raw_paths_by_species(age_group_raw_paths)
+
+    def get_group(tree_species: str) -> str:
+        return tree_species if raw_paths_by_species is not None else ALL_SPECIES_GROUP
+
+    if raw_paths_by_species is None:
+        groups = {ALL_SPECIES_GROUP: [age_group_raw_paths]}
+    else:
+        groups = {group: paths for group, paths in raw_paths_by_species.items() if group in config["tree_species"]}
+        # ^ Only the tree species in config are cleaned, prepared and saved
+
+    regeneration_cutting_group = get_group(REGENERATION_CUTTING_SLICE["DOMINANT_SPECIES"])
+    clean_names = [f"clean_age_group:{group}" for group in groups]
+    areas_names = [f"prepare_areas:{group}" for group in groups]
+
+    nodes = [
+        dag.Node(
+            name=f"clean_age_group:{group}",
+            function=lambda inputs, paths=paths: {
+                "age_group": collect_clean_data(*get_age_group_clean_query(paths, translations, aggregation_map), str(paths))
+            },
+            parameters=[translations, sorted(dimensions.get_age_group_enum(aggregation_map).categories.to_list())],
+            files=paths,
+            code=clean_code
+        )
+        for group, paths in groups.items()
+    ]
+    nodes += save_node(
+        "save_clean_age_group",
+        clean_names,
+        "age_group",
+        ["YEAR", "DOMINANT_SPECIES", "OWNER", "TYPE", "AGE_GROUP"],
+        config.get("age_group_clean_path")
+    )
+
+    if has_regeneration_cutting:
+        nodes += [
+            dag.Node(
+                name="clean_regeneration_cutting",
+                function=lambda inputs: {
+                    "regeneration_cutting": collect_clean_data(
+                        *get_regeneration_cutting_clean_query(regeneration_cutting_raw_path),
+                        regeneration_cutting_raw_path
+                    )
+                },
+                files=[regeneration_cutting_raw_path],
+                code=clean_code
+            ),
+            dag.Node(
+                name="prepare_regeneration_cutting",
+                function=lambda inputs: prepare_regeneration_cutting_plot_data(
+                    inputs["clean_regeneration_cutting"]["regeneration_cutting"],
+                    year_min=inputs[f"clean_age_group:{regeneration_cutting_group}"]["age_group"]["YEAR"].min(),
+                    year_max=inputs[f"clean_age_group:{regeneration_cutting_group}"]["age_group"]["YEAR"].max()
+                ),
+                inputs=["clean_regeneration_cutting", f"clean_age_group:{regeneration_cutting_group}"],
+                # ^ Aligned to the years of the tree species that regeneration cutting is subtracted from
+                code=prepare_code
+            ),
+            dag.Node(
+                name="prepare_regeneration_cutting_plot",
+                function=lambda inputs: prepare_regeneration_cutting_plot_data(
+                    inputs["clean_regeneration_cutting"]["regeneration_cutting"],
+                    year_min=inputs[f"clean_age_group:{regeneration_cutting_group}"]["age_group"]["YEAR"].min(),
+                    year_max=inputs[f"clean_age_group:{regeneration_cutting_group}"]["age_group"]["YEAR"].max(),
+                    metric=regeneration_cutting_metric,
+                    cutting_type=regeneration_cutting_type
+                ),
+                inputs=["clean_regeneration_cutting", f"clean_age_group:{regeneration_cutting_group}"],
+                parameters=[regeneration_cutting_metric, regeneration_cutting_type],
+                code=prepare_code
+            )
+        ]
+        # ^ Total area is subtracted from age groups, the plotted metric and cutting type are set in config
+        nodes += save_node(
+            "save_clean_regeneration_cutting",
+            ["clean_regeneration_cutting"],
+            "regeneration_cutting",
+            None,
+            config.get("regeneration_cutting_clean_path")
+        )
+
+    def get_prepared_inputs(group: str) -> list[str]:
+        # Regeneration cutting is only needed by the group of the regeneration cutting slice
+        if has_regeneration_cutting and group == regeneration_cutting_group:
+            return ["prepare_regeneration_cutting"]
+        return []
+
+    def get_plot_inputs(tree_species: str) -> list[str]:
+        # Regeneration cutting is only plotted for the tree species of the regeneration cutting slice
+        if has_regeneration_cutting and tree_species == REGENERATION_CUTTING_SLICE["DOMINANT_SPECIES"]:
+            return ["prepare_regeneration_cutting_plot"]
+        return []
+
+    nodes += [
+        dag.Node(
+            name=f"prepare_areas:{group}",
+            function=lambda inputs, group=group: {
+                "areas": get_areas_query(
+                    inputs[f"clean_age_group:{group}"]["age_group"],
+                    aggregation_map,
+                    inputs.get("prepare_regeneration_cutting"),
+                    threshold
+                ).collect()
+            },
+            inputs=[f"clean_age_group:{group}"] + get_prepared_inputs(group),
+            parameters=[aggregation_map, threshold],
+            code=prepare_code
+        )
+        for group in groups
+    ]
+    nodes += save_node(
+        "save_areas_data",
+        areas_names,
+        "areas",
+        [*prepare_data.SLICE_FIELDS, "TYPE", "YEAR", "AGE_GROUP"],
+        config.get("areas_slices_path")
+    )
+
+    settings = {**config, "storage_formats": storage_formats, "plot": bool(image_formats)}
+    settings_parameters = {key: settings.get(key) for key in SPECIES_SETTINGS_KEYS}
+
+    def process_species_node(tree_species: str, inputs: dict) -> None:
+        out = process_species(
+            tree_species,
+            inputs[f"prepare_areas:{get_group(tree_species)}"]["areas"],
+            inputs.get("prepare_regeneration_cutting_plot"),
+            settings
+        )
+        if out["figure"] is None:
+            return None
+        for image_format in image_formats:
+            render.render_figure_cached(
+                out["figure"],
+                render.get_image_path(out["plot_save_path"], image_format),
+                image_format,
+                config.get("cache_dir"),
+                config.get("cache_max_size", cache.DEFAULT_MAX_SIZE)
+            )
+        return None
+
+    for tree_species in config["tree_species"]:
+        plot_data_paths = [settings["areas_plot_paths"][type_name] for type_name in ["protected", "production"]]
+        if has_regeneration_cutting and tree_species == REGENERATION_CUTTING_SLICE["DOMINANT_SPECIES"]:
+            plot_data_paths += [settings["regeneration_cutting_plot_paths"][type_name] for type_name in ["protected", "production"]]
+        plot_save_path = os.path.join(root_dir, settings["plot_save_paths"][tree_species])
+        nodes += [dag.Node(
+            name=f"species:{tree_species}",
+            function=lambda inputs, tree_species=tree_species: process_species_node(tree_species, inputs),
+            inputs=[f"prepare_areas:{get_group(tree_species)}"] + get_plot_inputs(tree_species),
+            parameters=[tree_species, settings_parameters],
+            code=plot_code,
+            outputs=[
+                storage.get_path(os.path.join(root_dir, path.format(tree_species=tree_species)), format_name)
+                for path in plot_data_paths
+                for format_name in storage_formats
+            ] + [render.get_image_path(plot_save_path, image_format) for image_format in image_formats],
+            cached=False
+        )]
+
+    if config.get("vintage_store_dir") is not None:
+        store_dir = os.path.join(root_dir, config["vintage_store_dir"])
+        vintage_raw_paths = {"age_group": age_group_raw_paths}
+        if config.get("regeneration_cutting_raw_path") is not None:
+            vintage_raw_paths["regeneration_cutting"] = os.path.join(root_dir, config["regeneration_cutting_raw_path"])
+        # ^ Regeneration cutting exports are versioned even if they are not used (as in run_pipeline)
+
+        def ingest(dataset: str, path: str) -> None:
+            vintages.VintageStore(os.path.join(store_dir, dataset)).ingest(path)
+            return None
+
+        nodes += [
+            dag.Node(
+                name=f"ingest_vintages:{dataset}",
+                function=lambda inputs, dataset=dataset, path=path: ingest(dataset, path),
+                parameters=[store_dir],
+                files=[path],
+                code=[vintages.__file__, clean_data.__file__, storage.__file__],
+                outputs=[os.path.join(store_dir, dataset, vintages.MANIFEST_FILE)],
+                cached=False
+            )
+            for dataset, path in vintage_raw_paths.items()
+        ]
+
+    if render_plots and "html" in plot_formats:
+        report_path = os.path.join(root_dir, config["html_report_path"])
+
+        def write_report(inputs: dict) -> None:
+            import report
+            report_settings = {**settings, "storage_formats": [], "plot": True}
+            areas = concat_node_values(inputs, areas_names, "areas")
+            figures = {
+                tree_species: process_species(
+                    tree_species,
+                    areas,
+                    inputs.get("prepare_regeneration_cutting_plot"),
+                    report_settings
+                )["figure"]
+                for tree_species in config["tree_species"]
+            }
+            report.write_html_report(figures, report_path)
+
+        nodes += [dag.Node(
+            name="html_report",
+            function=write_report,
+            inputs=areas_names + get_plot_inputs(REGENERATION_CUTTING_SLICE["DOMINANT_SPECIES"]),
+            parameters=[config["tree_species"], settings_parameters, report_path],
+            code=plot_code,
+            outputs=[report_path],
+            cached=False
+        )]
+    return nodes
+
+
+def get_dag_runner(config: dict, profiler: profiling.Profiler | None = None) -> dag.Runner:
+    """
+    Get DAG runner of the pipeline (see get_dag_nodes). Nodes run in config["dag_thread_count"] threads
+    and their values and run state are kept in config["cache_dir"].
+    """
+    return dag.Runner(
+        get_dag_nodes(config),
+        config.get("cache_dir"),
+        config.get("cache_max_size", cache.DEFAULT_MAX_SIZE),
+        config.get("dag_thread_count", os.cpu_count() or 1),
+        profiler
+    )
@@ -1,13 +1,35 @@
 # standard
+from array import array
+import base64
 import re
+import sys
 # external
 import plotly
+import polars as pl
 
 
 #########################
 # Functions and classes #
 #########################
 
+TYPED_ARRAY_DTYPES = {
+    pl.Float64:     ("f8", "d"),
+    pl.Float32:     ("f4", "f"),
+    pl.Int32:       ("i4", "i"),
+    pl.Int16:       ("i2", "h"),
+    pl.Int8:        ("i1", "b"),
+    pl.UInt32:      ("u4", "I"),
+    pl.UInt16:      ("u2", "H"),
+    pl.UInt8:       ("u1", "B")
+}
+# ^ Column data types that plotly.js typed arrays support: typed array dtype and array module type code
+TYPED_ARRAY_CASTS = {
+    pl.Int64:       pl.Int32,
+    pl.UInt64:      pl.UInt32
+}
+# ^ plotly.js has no 64 bit integer typed arrays. Integer columns (e.g. years) are cast if their values fit.
+
+
 def rgb_to_hex(rgb: str) -> str:
     """
     Convert string in the form of 'rgb(10, 20, 30)' to a hex string.
@@ -40,21 +62,67 @@ def get_colours(n: int, scale_name: str) -> list[str]:
     return colours_hex
 
 
+def get_column_values(data: pl.Series) -> dict | list:
+    """
+    Get values of a data frame column for a trace: a plotly.js typed array ({"dtype": ..., "bdata": base64 of
+    the little-endian values}) for numeric columns without missing values, otherwise a list.
+    """
+    if data.dtype in TYPED_ARRAY_CASTS:
+        cast = data.cast(TYPED_ARRAY_CASTS[data.dtype], strict=False)
+        data = cast if cast.null_count() == data.null_count() else data
+    if data.dtype not in TYPED_ARRAY_DTYPES or data.null_count() > 0:
+        return data.to_list()
+    dtype, type_code = TYPED_ARRAY_DTYPES[data.dtype]
+    values = array(type_code, data.to_list())
+    if sys.byteorder == "big":
+        values.byteswap()
+    return {"dtype": dtype, "bdata": base64.b64encode(values.tobytes()).decode("ascii")}
+
+
+def get_legend_trace_dicts(names: list[str], colours: list[str]) -> list[dict]:
+    """
+    Get dummy traces to control the plot legend as dicts (plotly json structure, not validated).
+    """
+    traces = [
+        {
+            "type": "bar",
+            "x": [None],
+            "y": [None],
+            "name": name,
+            "marker": {"color": colour},
+            "showlegend": True
+        }
+        for name, colour in zip(names, colours)
+    ]
+    return traces
+
+
+def get_area_trace_dicts(type_name: str, years: pl.Series, areas: pl.DataFrame, colours_by_age_group: dict[str, str]) -> list[dict]:
+    """
+    Get traces for area data as dicts (plotly json structure, not validated) directly from data frame columns.
+    There is a trace for each field of areas (age group).
+    """
+    years_values = get_column_values(years)
+    traces = [
+        {
+            "type": "bar",
+            "x": years_values,
+            "y": get_column_values(areas[age_group]),
+            "name": age_group,
+            "offsetgroup": type_name,
+            "marker": {"color": colours_by_age_group[age_group]},
+            "showlegend": False
+        }
+        for age_group in areas.columns
+    ]
+    return traces
+
+
 def get_legend_traces(names: list[str], colours: list[str]) -> list[plotly.graph_objects.Bar]:
     """
     Get dummy traces to control the plot legend.
     """
-    traces = []
-    for name, colour in zip(names, colours):
-        traces += [
-            plotly.graph_objects.Bar(
-                x=[None], y=[None],
-                name=name,
-                marker_color=colour,
-                showlegend=True
-            )
-        ]
-    return traces
+    return [plotly.graph_objects.Bar(trace) for trace in get_legend_trace_dicts(names, colours)]
 
 
 def get_area_traces(type_name: str, years: list[int], areas_by_age_group: dict[str, list], colours_by_age_group: dict[str: str]) -> list[plotly.graph_objects.Bar]:
@@ -164,5 +232,19 @@ def get_figure(traces: list[plotly.graph_objects.Bar], layout: plotly.graph_obje
     return plotly.graph_objects.Figure(traces, layout)
 
 
+def get_figure_dict(traces: list[dict], layout: plotly.graph_objects.Layout, validate: bool = False) -> dict:
+    """
+    Get figure as a dict (plotly json structure) from trace dicts and layout.
+    If validate is False, traces are used as they are (fast path) and the default template is added to the layout,
+    like plotly.graph_objects.Figure does. Otherwise the figure is built and validated by plotly.
+    """
+    if validate:
+        return get_figure(traces, layout).to_dict()
+    layout_dict = layout.to_plotly_json()
+    if "template" not in layout_dict:
+        layout_dict["template"] = plotly.io.templates[plotly.io.templates.default].to_plotly_json()
+    return {"data": traces, "layout": layout_dict}
+
+
 def save_plot(figure: plotly.graph_objects.Figure, path: str) -> None:
     plotly.io.write_image(figure, path, format="png")
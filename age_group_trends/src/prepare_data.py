@@ -1,35 +1,62 @@
 # external
 import polars as pl
 from polars import col
+# local
+import clean_data
+import dimensions
 
 
-def align_regeneration_cutting_data(data: pl.DataFrame, year_min: int, year_max: int, type_name: str) -> pl.DataFrame:
+SCENARIO_FIELD = "SCENARIO"
+SCENARIO_PARAMETER_FIELDS = ["AGGREGATION_MAP", "THRESHOLD"]
+# ^ Parameter fields of sweep scenarios: index of aggregation map and regeneration cutting age threshold
+SLICE_FIELDS = ["DOMINANT_SPECIES", "OWNER"]
+# ^ Dimension fields of data slices. Windows, joins and groups are partitioned by the ones present in data,
+# so that all slices are computed in one grouped pass.
+
+
+def get_slice_fields(data: pl.DataFrame | pl.LazyFrame) -> list[str]:
+    """
+    Get scenario and slice fields of data (see SCENARIO_PARAMETER_FIELDS and SLICE_FIELDS).
     """
-    Set regeneration cutting data to input year range.
+    names = data.collect_schema().names()
+    return [name for name in [SCENARIO_FIELD, *SCENARIO_PARAMETER_FIELDS, *SLICE_FIELDS] if name in names]
+
+
+def align_regeneration_cutting_data(
+        data: pl.DataFrame,
+        year_min: int,
+        year_max: int,
+        type_name: str,
+        metric: str = "AREA",
+        cutting_type: str = "total") -> pl.DataFrame:
+    """
+    Select a metric of a cutting type from cleaned regeneration cutting data (see clean_data.get_regeneration_cutting_metric)
+    and set it to input year range.
     Set TYPE (production/protected) to input type_name.
-    Fill missing AREA data with zeros.
-    Fill missing UNIT data with kha.
+    Fill missing metric data (field named by metric, e.g. AREA) with zeros.
+    Fill missing UNIT data with the unit of the metric (e.g. kha).
     """
     year_type_data = pl.DataFrame({
         "YEAR": range(year_min, year_max + 1),
         "TYPE": [type_name] * (year_max - year_min + 1)
     })
+    units = {value["name"]: value["unit"] for value in clean_data.REGENERATION_CUTTING_METRICS.values()}
 
     out = (
         year_type_data
         .join(
-            data,
+            clean_data.get_regeneration_cutting_metric(data, metric, cutting_type),
             on=col("YEAR"),
             how="left"
         )
         .with_columns(
-            AREA=col("AREA").fill_null(0),
-            UNIT=col("UNIT").fill_null("kha")
+            col(metric).fill_null(0),
+            UNIT=col("UNIT").fill_null(units[metric])
         )
         .select(
             col("YEAR"),
             col("TYPE"),
-            col("AREA"),
+            col(metric),
             col("UNIT")
         )
         .sort(col("YEAR"))
@@ -40,18 +67,20 @@ def align_regeneration_cutting_data(data: pl.DataFrame, year_min: int, year_max:
 def add_unknown_data(known: pl.DataFrame, unknown: pl.DataFrame) -> pl.DataFrame:
     """
     Add data with "unknown" age group proportionally to all known age groups.
+    All slices (e.g. tree species and owners) are processed in one pass.
     """
+    slice_fields = get_slice_fields(known)
     out = (
         known
         .with_columns(
-            AREA_YEAR_TYPE_TOTAL=pl.sum("AREA").over("YEAR", "TYPE")
+            AREA_YEAR_TYPE_TOTAL=pl.sum("AREA").over(*slice_fields, "YEAR", "TYPE")
         )
         .with_columns(
             AREA_PROPORTION=col("AREA") / col("AREA_YEAR_TYPE_TOTAL")
         )
         .join(
-            unknown,
-            on=["YEAR", "TYPE"],
+            unknown.select(*slice_fields, "YEAR", "TYPE", "AREA"),
+            on=[*slice_fields, "YEAR", "TYPE"],
             how="left",
             suffix="_UNKNOWN"
         )
@@ -59,6 +88,7 @@ def add_unknown_data(known: pl.DataFrame, unknown: pl.DataFrame) -> pl.DataFrame
             AREA=col("AREA") + (col("AREA_PROPORTION") * col("AREA_UNKNOWN"))
         )
         .select(
+            *slice_fields,
             col("YEAR"),
             col("TYPE"),
             col("AGE_GROUP"),
@@ -72,14 +102,20 @@ def add_unknown_data(known: pl.DataFrame, unknown: pl.DataFrame) -> pl.DataFrame
 def aggregate_age_groups(data: pl.DataFrame, aggregation_map: dict) -> pl.DataFrame:
     """
     Aggregate age groups by input aggregation map.
-    Set AREA to the sum of areas for each group.
+    Set AREA to the sum of areas for each group (and slice).
+    AGE_GROUP keeps its data type (aggregated age groups must be categories of an enum AGE_GROUP).
     """
     out = (
         data
         .with_columns(
-            AGE_GROUP=col("AGE_GROUP").replace(aggregation_map)
+            AGE_GROUP=col("AGE_GROUP").replace_strict(
+                aggregation_map,
+                default=col("AGE_GROUP"),
+                return_dtype=data.collect_schema()["AGE_GROUP"]
+            )
         )
         .group_by([
+            *get_slice_fields(data),
             col("YEAR"),
             col("TYPE"),
             col("AGE_GROUP")
@@ -92,15 +128,26 @@ def aggregate_age_groups(data: pl.DataFrame, aggregation_map: dict) -> pl.DataFr
     return out
 
 
-def subtract_regeneration_cutting(age_group: pl.DataFrame, regeneration_cutting: pl.DataFrame, threshold: int) -> pl.DataFrame:
+def subtract_regeneration_cutting(
+        age_group: pl.DataFrame,
+        regeneration_cutting: pl.DataFrame,
+        threshold: int,
+        age_group_dimension: pl.DataFrame,
+        slice_filter: pl.Expr | None = None) -> pl.DataFrame:
     """
     Subtract regeneration cutting area proportionately from eligible age groups.
     Eligible age groups are the ones that have age equal or older to the input threshold age.
+    Age group start ages are taken from age_group_dimension (see dimensions module).
+    If slice_filter is given, regeneration cutting is only subtracted from the slices that match it
+    (e.g. the slice that regeneration cutting data is for). Other slices are unchanged.
     """
+    slice_fields = get_slice_fields(age_group)
     out = (
         age_group
-        .with_columns(
-            AGE_GROUP_START=col("AGE_GROUP").str.split("...").list.get(0).str.strip_chars().cast(pl.Int32)
+        .join(
+            age_group_dimension.select("AGE_GROUP", "AGE_GROUP_START"),
+            on="AGE_GROUP",
+            how="left"
         )
         .with_columns(
             IS_REGENERATION_CUTTING_ELIGIBLE=(col("AGE_GROUP_START") >= pl.lit(threshold))
@@ -110,7 +157,240 @@ def subtract_regeneration_cutting(age_group: pl.DataFrame, regeneration_cutting:
                 pl.when(
                     col("IS_REGENERATION_CUTTING_ELIGIBLE")
                 )
-                .then(col("AREA") / pl.sum("AREA").over("YEAR", "AGE_GROUP", "IS_REGENERATION_CUTTING_ELIGIBLE"))
+                .then(col("AREA") / pl.sum("AREA").over(*slice_fields, "YEAR", "AGE_GROUP", "IS_REGENERATION_CUTTING_ELIGIBLE"))
+                .otherwise(0)
+            )
+        )
+        .join(
+            regeneration_cutting,
+            on=["YEAR", "TYPE"],
+            how="left",
+            suffix="_REGENERATION_CUTTING"
+        )
+        .with_columns(
+            # Subtract regeneration cutting area proportionately from eligible age groups
+            AREA=(
+                pl.when(slice_filter if slice_filter is not None else pl.lit(True))
+                .then((col("AREA") - col("REGENERATION_CUTTING_AREA_PROPORTION") * col("AREA_REGENERATION_CUTTING")).round(2))
+                .otherwise(col("AREA"))
+            )
+        )
+        .select(
+            *slice_fields,
+            col("YEAR"),
+            col("TYPE"),
+            col("AGE_GROUP"),
+            col("AREA"),
+            col("UNIT")
+        )
+    )
+    return out
+
+
+def prepare_areas(
+        data: pl.LazyFrame,
+        aggregation_map: dict,
+        age_group_dimension: pl.DataFrame,
+        regeneration_cutting: pl.LazyFrame | None = None,
+        threshold: int | None = None,
+        slice_filter: pl.Expr | None = None) -> pl.LazyFrame:
+    """
+    Add unknown data, aggregate age groups and subtract regeneration cutting (if it is given) in a single lazy query.
+    Same result as add_unknown_data, aggregate_age_groups and subtract_regeneration_cutting in sequence, but:
+    unknown area is taken with a window instead of a join, age group start ages are mapped from age_group_dimension
+    instead of joined and nothing is materialised in between, so that the optimizer can plan all steps together.
+    Input data has all age groups, including unknown. All slices are processed in one pass.
+    """
+    slice_fields = get_slice_fields(data)
+    age_group_dtype = data.collect_schema()["AGE_GROUP"]
+    is_unknown = col("AGE_GROUP") == dimensions.UNKNOWN_AGE_GROUP
+
+    out = (
+        data
+        # Add unknown area to known age groups proportionately
+        .with_columns(
+            AREA_UNKNOWN=col("AREA").filter(is_unknown).first().over(*slice_fields, "YEAR", "TYPE")
+        )
+        .filter(
+            ~is_unknown
+        )
+        .with_columns(
+            AREA=col("AREA") + (col("AREA") / pl.sum("AREA").over(*slice_fields, "YEAR", "TYPE")) * col("AREA_UNKNOWN")
+        )
+        # Aggregate age groups
+        .with_columns(
+            AGE_GROUP=col("AGE_GROUP").replace_strict(
+                aggregation_map,
+                default=col("AGE_GROUP"),
+                return_dtype=age_group_dtype
+            )
+        )
+        .group_by([
+            *slice_fields,
+            col("YEAR"),
+            col("TYPE"),
+            col("AGE_GROUP")
+        ])
+        .agg(
+            col("AREA").sum().alias("AREA"),
+            col("UNIT").first().alias("UNIT")
+        )
+    )
+
+    if regeneration_cutting is not None:
+        # Subtract regeneration cutting area proportionately from eligible age groups
+        out = (
+            out
+            .with_columns(
+                IS_REGENERATION_CUTTING_ELIGIBLE=(
+                    col("AGE_GROUP").replace_strict(
+                        age_group_dimension["AGE_GROUP"],
+                        age_group_dimension["AGE_GROUP_START"],
+                        default=None
+                    )
+                    >= pl.lit(threshold)
+                )
+            )
+            .with_columns(
+                REGENERATION_CUTTING_AREA_PROPORTION=(
+                    pl.when(
+                        col("IS_REGENERATION_CUTTING_ELIGIBLE")
+                    )
+                    .then(col("AREA") / pl.sum("AREA").over(*slice_fields, "YEAR", "AGE_GROUP", "IS_REGENERATION_CUTTING_ELIGIBLE"))
+                    .otherwise(0)
+                )
+            )
+            .join(
+                regeneration_cutting,
+                on=["YEAR", "TYPE"],
+                how="left",
+                suffix="_REGENERATION_CUTTING"
+            )
+            .with_columns(
+                AREA=(
+                    pl.when(slice_filter if slice_filter is not None else pl.lit(True))
+                    .then((col("AREA") - col("REGENERATION_CUTTING_AREA_PROPORTION") * col("AREA_REGENERATION_CUTTING")).round(2))
+                    .otherwise(col("AREA"))
+                )
+            )
+        )
+
+    out = (
+        out
+        .select(
+            *slice_fields,
+            col("YEAR"),
+            col("TYPE"),
+            col("AGE_GROUP"),
+            col("AREA"),
+            col("UNIT")
+        )
+    )
+    return out
+
+
+def add_scenarios(data: pl.DataFrame | pl.LazyFrame, parameters: pl.DataFrame) -> pl.DataFrame | pl.LazyFrame:
+    """
+    Cross join data with a scenario parameter table (one record per parameter value).
+    Set SCENARIO to the parameter index. If data already has scenarios,
+    each existing scenario is combined with each parameter value (SCENARIO = old SCENARIO * parameter count + index).
+    """
+    parameter_count = parameters.height
+    parameters = parameters.with_row_index("PARAMETER_INDEX")
+    if isinstance(data, pl.LazyFrame):
+        parameters = parameters.lazy()
+    scenario = col("PARAMETER_INDEX")
+    if SCENARIO_FIELD in data.collect_schema().names():
+        scenario = col(SCENARIO_FIELD) * parameter_count + scenario
+    out = (
+        data
+        .join(parameters, how="cross")
+        .with_columns(scenario.cast(pl.UInt32).alias(SCENARIO_FIELD))
+        .drop("PARAMETER_INDEX")
+    )
+    return out
+
+
+def aggregate_age_groups_sweep(data: pl.DataFrame, aggregation_maps: list[dict]) -> pl.DataFrame:
+    """
+    Aggregate age groups by each of the input aggregation maps in one query.
+    Data is cross joined with the aggregation map indexes (AGGREGATION_MAP field) and the maps are applied by a join.
+    Return long data with a record for each scenario (SCENARIO field), year, type and aggregated age group.
+    AGE_GROUP keeps its data type (aggregated age groups of all maps must be categories of an enum AGE_GROUP,
+    see dimensions.get_age_group_enum).
+    """
+    age_group_dtype = data.collect_schema()["AGE_GROUP"]
+    aggregation = pl.DataFrame(
+        {
+            "AGGREGATION_MAP": [index for index, aggregation_map in enumerate(aggregation_maps) for _ in aggregation_map],
+            "AGE_GROUP": [key for aggregation_map in aggregation_maps for key in aggregation_map.keys()],
+            "AGGREGATED_AGE_GROUP": [value for aggregation_map in aggregation_maps for value in aggregation_map.values()]
+        },
+        schema={
+            "AGGREGATION_MAP": pl.UInt32,
+            "AGE_GROUP": age_group_dtype,
+            "AGGREGATED_AGE_GROUP": age_group_dtype
+        }
+    )
+    if isinstance(data, pl.LazyFrame):
+        aggregation = aggregation.lazy()
+
+    data = add_scenarios(data, pl.DataFrame({"AGGREGATION_MAP": range(len(aggregation_maps))}, schema={"AGGREGATION_MAP": pl.UInt32}))
+    out = (
+        data
+        .join(
+            aggregation,
+            on=["AGGREGATION_MAP", "AGE_GROUP"],
+            how="left"
+        )
+        .with_columns(
+            AGE_GROUP=pl.coalesce(col("AGGREGATED_AGE_GROUP"), col("AGE_GROUP"))
+        )
+        .group_by([
+            *get_slice_fields(data),
+            col("YEAR"),
+            col("TYPE"),
+            col("AGE_GROUP")
+        ])
+        .agg(
+            col("AREA").sum().alias("AREA"),
+            col("UNIT").first().alias("UNIT")
+        )
+    )
+    return out
+
+
+def subtract_regeneration_cutting_sweep(
+        age_group: pl.DataFrame,
+        regeneration_cutting: pl.DataFrame,
+        thresholds: list[int],
+        age_group_dimension: pl.DataFrame,
+        slice_filter: pl.Expr | None = None) -> pl.DataFrame:
+    """
+    Subtract regeneration cutting area proportionately from eligible age groups for each of the input thresholds in one query.
+    Data is cross joined with the thresholds (THRESHOLD field).
+    Existing scenarios of age_group (e.g. from aggregate_age_groups_sweep) are combined with each threshold.
+    Return long data with a record for each scenario (SCENARIO field), year, type and age group.
+    See subtract_regeneration_cutting.
+    """
+    age_group = add_scenarios(age_group, pl.DataFrame({"THRESHOLD": thresholds}, schema={"THRESHOLD": pl.Int32}))
+    slice_fields = get_slice_fields(age_group)
+    out = (
+        age_group
+        .join(
+            age_group_dimension.select("AGE_GROUP", "AGE_GROUP_START"),
+            on="AGE_GROUP",
+            how="left"
+        )
+        .with_columns(
+            IS_REGENERATION_CUTTING_ELIGIBLE=(col("AGE_GROUP_START") >= col("THRESHOLD"))
+        )
+        .with_columns(
+            REGENERATION_CUTTING_AREA_PROPORTION=(
+                pl.when(
+                    col("IS_REGENERATION_CUTTING_ELIGIBLE")
+                )
+                .then(col("AREA") / pl.sum("AREA").over(*slice_fields, "YEAR", "AGE_GROUP", "IS_REGENERATION_CUTTING_ELIGIBLE"))
                 .otherwise(0)
             )
         )
@@ -123,10 +403,13 @@ def subtract_regeneration_cutting(age_group: pl.DataFrame, regeneration_cutting:
         .with_columns(
             # Subtract regeneration cutting area proportionately from eligible age groups
             AREA=(
-                col("AREA") - col("REGENERATION_CUTTING_AREA_PROPORTION") * col("AREA_REGENERATION_CUTTING")
-            ).round(2)
+                pl.when(slice_filter if slice_filter is not None else pl.lit(True))
+                .then((col("AREA") - col("REGENERATION_CUTTING_AREA_PROPORTION") * col("AREA_REGENERATION_CUTTING")).round(2))
+                .otherwise(col("AREA"))
+            )
         )
         .select(
+            *slice_fields,
             col("YEAR"),
             col("TYPE"),
             col("AGE_GROUP"),
@@ -140,17 +423,19 @@ def subtract_regeneration_cutting(age_group: pl.DataFrame, regeneration_cutting:
 def get_areas(data: pl.DataFrame) -> pl.DataFrame:
     """
     Pivot each AGE_GROUP area into a separate field.
-    Fill missing values with zero for all fields except YEAR.
+    All slices (e.g. tree species and owners) are pivoted in one pass: slice fields are kept as index fields.
+    Fill missing values with zero for all fields except YEAR and slice fields.
     """
+    slice_fields = get_slice_fields(data)
     out = (
         data
         .pivot(
-            index=["YEAR", "UNIT", "TYPE"],
+            index=[*slice_fields, "YEAR", "UNIT", "TYPE"],
             on="AGE_GROUP",
             values="AREA",
             sort_columns=True
         )
-        .with_columns(pl.exclude("YEAR").fill_null(0.0))
-        .sort(col("YEAR"))
+        .with_columns(pl.exclude("YEAR", *slice_fields).fill_null(0.0))
+        .sort(*slice_fields, col("YEAR"))
     )
     return out
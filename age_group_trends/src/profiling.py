@@ -0,0 +1,146 @@
+# standard
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+import json
+import os
+import sys
+import time
+from typing import Iterator
+try:
+    import resource
+except ImportError:
+    # ^ Not available on Windows. Peak RSS is not recorded there.
+    resource = None
+# external
+import polars as pl
+
+
+#########################
+# Functions and classes #
+#########################
+
+@dataclass
+class StageRecord:
+    name: str
+    wall_seconds: float = 0.0
+    cpu_seconds: float | None = 0.0
+    # ^ None if the stage ran in another process
+    peak_rss_bytes: int | None = None
+    # ^ Peak resident set size of the process at the end of the stage (process lifetime peak)
+    rows_in: int | None = None
+    rows_out: int | None = None
+    bytes_written: int = 0
+    cached: bool = False
+    # ^ Output was loaded from cache instead of computed
+    bytes_read: int = 0
+    # ^ Bytes loaded from cache (not raw data reads)
+    label: str | None = None
+    # ^ Optional label to distinguish repeated stages (e.g. tree species)
+    query_plan: str | None = None
+
+
+def get_peak_rss() -> int | None:
+    """
+    Get peak resident set size of the current process in bytes.
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def get_file_sizes(paths: list[str]) -> int:
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def get_rows(data: pl.DataFrame | dict | None) -> int | None:
+    """
+    Get number of rows of a data frame or the total number of rows of a dict of data frames.
+    """
+    if data is None:
+        return None
+    if isinstance(data, dict):
+        return sum(get_rows(value) or 0 for value in data.values())
+    return data.height
+
+
+class Profiler:
+    """
+    Collect per-stage wall time, CPU time, peak RSS, row counts, bytes written, cache hits (with bytes read)
+    and (optionally) lazy query plans.
+    """
+    def __init__(self, explain: bool = False):
+        self.explain = explain
+        self.stages: list[StageRecord] = []
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int | None = None, label: str | None = None) -> Iterator[StageRecord]:
+        """
+        Record a stage. Set rows_out, bytes_written, cached, bytes_read and query_plan on the yielded record inside the block.
+        """
+        record = StageRecord(name=name, rows_in=rows_in, label=label)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.process_time() - cpu_start
+            record.peak_rss_bytes = get_peak_rss()
+            self.stages += [record]
+
+    def add_query_plan(self, record: StageRecord, data: pl.LazyFrame) -> None:
+        """
+        Add optimized query plan of a lazy frame to a stage record (if explain is enabled).
+        """
+        if self.explain:
+            plan = data.explain()
+            record.query_plan = plan if record.query_plan is None else f"{record.query_plan}\n\n{plan}"
+
+    def extend(self, stages: list[StageRecord]) -> None:
+        """
+        Add stage records collected elsewhere (e.g. in worker processes).
+        """
+        self.stages += stages
+
+    def get_report(self) -> dict:
+        return {
+            "stages": [asdict(record) for record in self.stages],
+            "total_wall_seconds": sum(record.wall_seconds for record in self.stages),
+            "peak_rss_bytes": max((record.peak_rss_bytes or 0 for record in self.stages), default=None)
+        }
+
+    def save_report(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.get_report(), file, indent=2, ensure_ascii=False)
+
+    def print_report(self) -> None:
+        print(f"{'stage':<45} {'wall s':>8} {'cpu s':>8} {'peak MB':>8} {'rows in':>9} {'rows out':>9} {'kB written':>10} {'kB read':>9}")
+        for record in self.stages:
+            name = f"{record.name} ({record.label})" if record.label else record.name
+            name = f"{name} [cached]" if record.cached else name
+            peak_rss = f"{record.peak_rss_bytes / 1024 ** 2:.0f}" if record.peak_rss_bytes is not None else "-"
+            cpu_seconds = f"{record.cpu_seconds:.3f}" if record.cpu_seconds is not None else "-"
+            print(
+                f"{name:<45} {record.wall_seconds:>8.3f} {cpu_seconds:>8} {peak_rss:>8} "
+                f"{record.rows_in if record.rows_in is not None else '-':>9} "
+                f"{record.rows_out if record.rows_out is not None else '-':>9} "
+                f"{record.bytes_written / 1024:>10.1f} {record.bytes_read / 1024:>9.1f}"
+            )
+        for record in self.stages:
+            if record.query_plan:
+                print(f"\nQuery plan: {record.name}\n{record.query_plan}")
+
+
+@contextmanager
+def stage(profiler: Profiler | None, name: str, rows_in: int | None = None, label: str | None = None) -> Iterator[StageRecord]:
+    """
+    Record a stage with input profiler. Records are discarded if profiler is None.
+    """
+    if profiler is None:
+        yield StageRecord(name=name, rows_in=rows_in, label=label)
+        return
+    with profiler.stage(name, rows_in, label) as record:
+        yield record
@@ -0,0 +1,298 @@
+# external
+import polars as pl
+from polars import col
+# local
+import clean_data
+import dimensions
+import pipeline
+import prepare_data
+import sensitivity
+
+
+#########################
+# Functions and classes #
+#########################
+
+DEFAULT_REGROWTH_RATE = 0.5
+# ^ Share of clearcut area that regrows into the first age class each year
+DEFAULT_CUTTING_RATE_YEARS = 5
+# ^ Number of latest years of regeneration cutting data that the default cutting rate is estimated from
+
+
+def get_age_classes(aggregation_map: dict) -> pl.DataFrame:
+    """
+    Get raw age classes (keys of aggregation_map, incl. clearcut) in age order with AGE_GROUP_START,
+    AGING_RATE (share of area that moves to the next class in a year: 1 / class width in years) and NEXT_AGE_GROUP.
+    Clearcut is age 0, so the first age class starts at age 1. The oldest (open) class doesn't age.
+    """
+    out = (
+        dimensions.get_age_group_dimension(aggregation_map)
+        .filter(col("AGE_GROUP").cast(pl.String).is_in(list(aggregation_map.keys())))
+        .sort("AGE_GROUP_START", col("AGE_GROUP_END").fill_null(0))
+        .with_columns(
+            AGING_RATE=(
+                pl.when(col("AGE_GROUP_END").is_null() | (col("AGE_GROUP") == dimensions.CLEARCUT_AGE_GROUP))
+                .then(pl.lit(0.0))
+                .otherwise(1 / (col("AGE_GROUP_END") - pl.max_horizontal(col("AGE_GROUP_START"), pl.lit(1)) + 1))
+            ),
+            NEXT_AGE_GROUP=col("AGE_GROUP").shift(-1)
+        )
+        .select("AGE_GROUP", "AGE_GROUP_START", "AGING_RATE", "NEXT_AGE_GROUP")
+    )
+    return out
+
+
+def get_transition_table(aggregation_map: dict, threshold: int) -> pl.DataFrame:
+    """
+    Get the sparse one year transition matrix of raw age classes (see get_age_classes) as a table of
+    FROM_AGE_GROUP, AGE_GROUP (to) and coefficient terms. The coefficient of a transition is
+        BASE + CUTTING_WEIGHT * CUTTING_RATE + REGROWTH_WEIGHT * REGROWTH_RATE,
+    so that the matrix of any rates is a linear combination of three constant matrices:
+        - area of classes at or above the threshold age (as in prepare_data.subtract_regeneration_cutting)
+          is cut into clearcut at the cutting rate,
+        - uncut area stays in its class or ages into the next class at the aging rate,
+        - clearcut regrows into the first age class at the regrowth rate.
+    Coefficients from each class sum to 1 for any rates (area is preserved).
+    """
+    classes = get_age_classes(aggregation_map)
+    age_group_dtype = classes.schema["AGE_GROUP"]
+    is_clearcut = col("AGE_GROUP") == dimensions.CLEARCUT_AGE_GROUP
+    is_eligible = ~is_clearcut & (col("AGE_GROUP_START") >= threshold)
+    first_age_group = classes.filter(~is_clearcut)["AGE_GROUP"][0]
+
+    stay = classes.select(
+        FROM_AGE_GROUP=col("AGE_GROUP"),
+        AGE_GROUP=col("AGE_GROUP"),
+        BASE=pl.when(is_clearcut).then(1.0).otherwise(1 - col("AGING_RATE")),
+        CUTTING_WEIGHT=-(1 - col("AGING_RATE")) * is_eligible.cast(pl.Float64),
+        REGROWTH_WEIGHT=pl.when(is_clearcut).then(-1.0).otherwise(0.0)
+    )
+    age = (
+        classes
+        .filter(~is_clearcut, col("AGING_RATE") > 0)
+        .select(
+            FROM_AGE_GROUP=col("AGE_GROUP"),
+            AGE_GROUP=col("NEXT_AGE_GROUP"),
+            BASE=col("AGING_RATE"),
+            CUTTING_WEIGHT=-col("AGING_RATE") * is_eligible.cast(pl.Float64),
+            REGROWTH_WEIGHT=pl.lit(0.0)
+        )
+    )
+    cut = (
+        classes
+        .filter(is_eligible)
+        .select(
+            FROM_AGE_GROUP=col("AGE_GROUP"),
+            AGE_GROUP=pl.lit(dimensions.CLEARCUT_AGE_GROUP, dtype=age_group_dtype),
+            BASE=pl.lit(0.0),
+            CUTTING_WEIGHT=pl.lit(1.0),
+            REGROWTH_WEIGHT=pl.lit(0.0)
+        )
+    )
+    regrow = pl.DataFrame(
+        {
+            "FROM_AGE_GROUP": [dimensions.CLEARCUT_AGE_GROUP],
+            "AGE_GROUP": [first_age_group],
+            "BASE": [0.0],
+            "CUTTING_WEIGHT": [0.0],
+            "REGROWTH_WEIGHT": [1.0]
+        },
+        schema=stay.schema
+    )
+    return pl.concat([stay, age, cut, regrow])
+
+
+def get_class_areas(age_group: pl.DataFrame, aggregation_map: dict) -> pl.DataFrame:
+    """
+    Get areas by raw age class (not aggregated) with unknown area added proportionately, for all slices and years
+    (see prepare_data.prepare_areas).
+    """
+    out = prepare_data.prepare_areas(
+        age_group.lazy(),
+        {label: label for label in aggregation_map},
+        dimensions.get_age_group_dimension(aggregation_map)
+    )
+    return out.collect()
+
+
+def estimate_cutting_rate(
+        age_group: pl.DataFrame,
+        regeneration_cutting: pl.DataFrame,
+        aggregation_map: dict,
+        threshold: int,
+        year_count: int = DEFAULT_CUTTING_RATE_YEARS) -> float:
+    """
+    Estimate the yearly cutting rate of production forest: regeneration cutting area divided by the area of
+    eligible age classes (at or above the threshold age) of all tree species and owners,
+    averaged over the latest year_count years that have both data.
+    Regeneration cutting is cleaned data of all metrics (total area is used, see clean_data.get_regeneration_cutting_metric).
+    """
+    eligible = (
+        get_class_areas(age_group, aggregation_map)
+        .filter(pipeline.get_slice_filter(pipeline.REGENERATION_CUTTING_SLICE), col("TYPE") == "production")
+        .join(get_age_classes(aggregation_map), on="AGE_GROUP", how="inner")
+        .filter(col("AGE_GROUP") != dimensions.CLEARCUT_AGE_GROUP, col("AGE_GROUP_START") >= threshold)
+        .group_by("YEAR")
+        .agg(ELIGIBLE_AREA=col("AREA").sum())
+    )
+    out = (
+        eligible
+        .join(clean_data.get_regeneration_cutting_metric(regeneration_cutting).select("YEAR", "AREA"), on="YEAR", how="inner")
+        .sort("YEAR")
+        .tail(year_count)
+        .select((col("AREA") / col("ELIGIBLE_AREA")).mean())
+    )
+    return out.item()
+
+
+def get_scenario_rates(
+        years: list[int],
+        cutting_rates: dict[str, float],
+        regrowth_rate: float = DEFAULT_REGROWTH_RATE,
+        path_count: int = 1,
+        variation: float = 0.0,
+        seed: int = 0) -> pl.DataFrame:
+    """
+    Get cutting and regrowth rates of scenario paths: a record for each SCENARIO (path), YEAR and TYPE.
+    cutting_rates are by type, e.g. {"protected": 0.0, "production": 0.03}.
+    If variation is given, each path and year has the rates multiplied by a random factor
+    (normal with mean 1 and standard deviation variation, rates clipped to 0...1).
+    The same factor is used for all types and tree species in a path and year.
+    Factors of all paths and years are drawn in one vectorized query (see sensitivity.get_normal).
+    """
+    factors = (
+        pl.LazyFrame({prepare_data.SCENARIO_FIELD: range(path_count)}, schema={prepare_data.SCENARIO_FIELD: pl.UInt32})
+        .join(pl.LazyFrame({"YEAR": years}, schema={"YEAR": pl.Int64}), how="cross")
+        .with_columns(
+            CUTTING_FACTOR=1 + variation * sensitivity.get_normal(0, seed),
+            REGROWTH_FACTOR=1 + variation * sensitivity.get_normal(2, seed)
+        )
+    )
+    types = pl.LazyFrame({"TYPE": list(cutting_rates.keys()), "BASE_CUTTING_RATE": list(cutting_rates.values())})
+    out = (
+        factors
+        .join(types, how="cross")
+        .select(
+            prepare_data.SCENARIO_FIELD,
+            "YEAR",
+            "TYPE",
+            CUTTING_RATE=(col("BASE_CUTTING_RATE") * col("CUTTING_FACTOR")).clip(0, 1),
+            REGROWTH_RATE=(regrowth_rate * col("REGROWTH_FACTOR")).clip(0, 1)
+        )
+    )
+    return out.collect()
+
+
+def get_transition_expressions(transitions: pl.DataFrame) -> list[pl.Expr]:
+    """
+    Get an expression for the area of each age class after one year from wide areas by age class
+    (a field for each class) and CUTTING_RATE and REGROWTH_RATE fields of the same record (see get_transition_table).
+    Together the expressions are the matrix product of the transition matrix and the areas of each record.
+    """
+    rates = {"CUTTING_WEIGHT": col("CUTTING_RATE"), "REGROWTH_WEIGHT": col("REGROWTH_RATE")}
+    out = []
+    for age_group in transitions["AGE_GROUP"].unique(maintain_order=True).to_list():
+        terms = []
+        for transition in transitions.filter(col("AGE_GROUP") == age_group).iter_rows(named=True):
+            coefficient = pl.lit(transition["BASE"])
+            for weight, rate in rates.items():
+                if transition[weight] != 0:
+                    coefficient = coefficient + transition[weight] * rate
+            terms += [col(transition["FROM_AGE_GROUP"]) * coefficient]
+        out += [pl.sum_horizontal(terms).alias(age_group)]
+    return out
+
+
+def project_areas(
+        age_group: pl.DataFrame,
+        aggregation_map: dict,
+        rates: pl.DataFrame,
+        threshold: int,
+        start_year: int | None = None) -> pl.DataFrame:
+    """
+    Project areas by age group of all slices (tree species, owner and type) forward from start_year
+    (default: latest year in data) for each scenario path in rates (see get_scenario_rates).
+    Areas are kept wide (a field for each raw age class, a record for each path and slice), so that each projected
+    year is one batched matrix product for all paths and slices: a set of column expressions with the rates of
+    the path and year (see get_transition_expressions). Age classes are aggregated by aggregation_map at the end.
+    Raise ValueError if rates have no record for a type in the data.
+    Return long data with SCENARIO, DOMINANT_SPECIES, OWNER, YEAR, TYPE, AGE_GROUP, AREA and UNIT
+    (start year included with the observed areas), like pipeline.prepare_areas_data.
+    """
+    class_areas = get_class_areas(age_group, aggregation_map)
+    start_year = class_areas["YEAR"].max() if start_year is None else start_year
+    slice_fields = prepare_data.get_slice_fields(class_areas)
+    key_fields = [prepare_data.SCENARIO_FIELD, *slice_fields, "TYPE"]
+    transitions = get_transition_table(aggregation_map, threshold).with_columns(
+        col("FROM_AGE_GROUP", "AGE_GROUP").cast(pl.String)
+    )
+    age_classes = transitions["AGE_GROUP"].unique(maintain_order=True).to_list()
+    transition_expressions = get_transition_expressions(transitions)
+    scenarios = rates.select(prepare_data.SCENARIO_FIELD).unique().sort(prepare_data.SCENARIO_FIELD)
+
+    state = (
+        class_areas
+        .filter(col("YEAR") == start_year)
+        .pivot(index=[*slice_fields, "TYPE"], on="AGE_GROUP", values="AREA")
+        .join(scenarios, how="cross")
+        .select(*key_fields, *[
+            col(age_class).fill_null(0.0) if age_class in class_areas["AGE_GROUP"].cast(pl.String) else pl.lit(0.0).alias(age_class)
+            for age_class in age_classes
+        ])
+        .sort(key_fields)
+        .with_row_index("ROW")
+    )
+    # ^ Record order is kept in all years (ROW), so that the output is sorted by integers instead of categoricals
+    missing_types = set(state["TYPE"].cast(pl.String).unique()) - set(rates["TYPE"].cast(pl.String).unique())
+    if missing_types:
+        raise ValueError(f"No rates for types: {sorted(missing_types)}. Add them to cutting_rates (e.g. with rate 0).")
+    states =[state.with_columns(YEAR=pl.lit(start_year, dtype=pl.Int64))]
+    years = sorted(year for year in rates["YEAR"].unique().to_list() if year > start_year)
+    for year in years:
+        state = (
+            state
+            .join(rates.filter(col("YEAR") == year), on=[prepare_data.SCENARIO_FIELD, "TYPE"], how="inner", maintain_order="left")
+            .select("ROW", *key_fields, *transition_expressions)
+        )
+        states += [state.with_columns(YEAR=pl.lit(year, dtype=pl.Int64))]
+
+    # Aggregate age classes and explode to long data (age groups in enum order)
+    aggregated = {}
+    for age_class in age_classes:
+        aggregated.setdefault(aggregation_map.get(age_class, age_class), []).append(age_class)
+    age_group_dtype = class_areas.schema["AGE_GROUP"]
+    age_group_names = [name for name in age_group_dtype.categories if name in aggregated]
+    unit = class_areas["UNIT"].drop_nulls().first()
+    out = (
+        pl.concat(states)
+        .sort("ROW", "YEAR")
+        .select(
+            *key_fields[:-1],
+            "YEAR",
+            "TYPE",
+            AREA=pl.concat_list([pl.sum_horizontal(aggregated[name]) for name in age_group_names])
+        )
+        .explode("AREA")
+        .with_columns(
+            AGE_GROUP=pl.lit(pl.Series(age_group_names, dtype=age_group_dtype)).gather(pl.int_range(pl.len()) % len(age_group_names)),
+            UNIT=pl.lit(unit)
+        )
+        .select(*key_fields[:-1], "YEAR", "TYPE", "AGE_GROUP", "AREA", "UNIT")
+    )
+    return out
+
+
+def summarize_paths(projection: pl.DataFrame, quantile: float | None = None) -> pl.DataFrame:
+    """
+    Get mean (or quantile, e.g. 0.05) area over scenario paths for each slice, year, type and age group.
+    Return long data without SCENARIO, so that plot data can be taken with pipeline.get_slice_areas.
+    """
+    slice_fields = [field for field in prepare_data.get_slice_fields(projection) if field != prepare_data.SCENARIO_FIELD]
+    area = col("AREA").mean() if quantile is None else col("AREA").quantile(quantile, interpolation="linear")
+    out = (
+        projection
+        .group_by(*slice_fields, "YEAR", "TYPE", "AGE_GROUP")
+        .agg(AREA=area, UNIT=col("UNIT").first())
+        .sort(*slice_fields, "TYPE", "YEAR", "AGE_GROUP")
+    )
+    return out
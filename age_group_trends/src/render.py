@@ -0,0 +1,168 @@
+# standard
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+import hashlib
+import importlib.metadata
+import multiprocessing
+import os
+import shutil
+import time
+# external
+import plotly
+# local
+import cache
+
+
+#########################
+# Functions and classes #
+#########################
+
+IMAGE_FORMATS = ["png", "svg", "pdf"]
+# ^ Image formats supported by Kaleido that can be rendered and cached
+
+
+@dataclass
+class RenderResult:
+    path: str
+    seconds: float
+    # ^ Render and write time in the worker (excludes queueing). Copy time if cached.
+    cached: bool = False
+
+
+def get_image_path(path: str, format: str) -> str:
+    """
+    Get image save path with the file extension of input format, e.g. "plot.png", "svg" -> "plot.svg".
+    """
+    return f"{os.path.splitext(path)[0]}.{format}"
+
+
+def get_figure_key(figure: dict, format: str) -> str:
+    """
+    Get render cache key (sha256 hash) of a figure: its final json (traces and layout with template),
+    image format and the plotly and Kaleido versions (the renderer).
+    """
+    figure_hash = hashlib.sha256(plotly.io.to_json(figure, validate=False).encode("utf-8")).hexdigest()
+    return cache.get_key(figure_hash, format, plotly.__version__, importlib.metadata.version("kaleido"))
+
+
+def load_cached_figure(cache_dir: str, key: str, path: str, format: str) -> RenderResult | None:
+    """
+    Copy a cached rendered figure by key to path. Return None if it is not cached.
+    Create parent directories if necessary.
+    """
+    start = time.perf_counter()
+    cached_path = cache.load_file(cache_dir, key, f"figure.{format}")
+    if cached_path is None:
+        return None
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    shutil.copyfile(cached_path, path)
+    return RenderResult(path=path, seconds=time.perf_counter() - start, cached=True)
+
+
+def save_cached_figure(cache_dir: str, key: str, path: str, format: str, max_size: int = cache.DEFAULT_MAX_SIZE) -> None:
+    """
+    Save a rendered figure file to the render cache under key.
+    """
+    cache.save_files(cache_dir, key, {f"figure.{format}": path}, max_size)
+
+
+def start_kaleido() -> None:
+    """
+    Start the Kaleido (Chromium) process of the current process by rendering an empty figure.
+    Kaleido keeps the process alive, so later renders skip the startup cost.
+    """
+    plotly.io.to_image({"data": [], "layout": {}}, format="png", width=10, height=10, validate=False)
+
+
+def render_figure(figure: dict, path: str, format: str = "png") -> RenderResult:
+    """
+    Render a figure (dict in plotly json structure) to an image file.
+    Create parent directories if necessary.
+    """
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    plotly.io.write_image(figure, path, format=format, validate=False)
+    return RenderResult(path=path, seconds=time.perf_counter() - start)
+
+
+def render_image(figure: dict, format: str = "png") -> bytes:
+    """
+    Render a figure (dict in plotly json structure) to image bytes in memory.
+    """
+    return plotly.io.to_image(figure, format=format, validate=False)
+
+
+def render_figure_cached(
+        figure: dict,
+        path: str,
+        format: str = "png",
+        cache_dir: str | None = None,
+        max_size: int = cache.DEFAULT_MAX_SIZE) -> RenderResult:
+    """
+    Render a figure to an image file or copy it from the render cache in cache_dir
+    if the same figure has been rendered before (see get_figure_key). Caching is disabled if cache_dir is None.
+    """
+    if cache_dir is None:
+        return render_figure(figure, path, format)
+    key = get_figure_key(figure, format)
+    result = load_cached_figure(cache_dir, key, path, format)
+    if result is None:
+        result = render_figure(figure, path, format)
+        save_cached_figure(cache_dir, key, path, format, max_size)
+    return result
+
+
+class RenderPool:
+    """
+    Pool of worker processes with warm Kaleido processes for rendering figures concurrently.
+    Worker processes (and Kaleido) are started on the first submitted figure, so they are not started if all figures are cached.
+    Use as a context manager, so that the workers are shut down after use.
+    """
+    def __init__(self, process_count: int = os.cpu_count() or 1):
+        self.executor = ProcessPoolExecutor(
+            max_workers=max(process_count, 1),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=start_kaleido
+        )
+
+    def __enter__(self) -> "RenderPool":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def submit(self, figure: dict, path: str, format: str = "png") -> Future:
+        """
+        Submit a figure for rendering. Return future of RenderResult.
+        """
+        return self.executor.submit(render_figure, figure, path, format)
+
+    def render(
+            self,
+            figures: dict[str, dict],
+            format: str = "png",
+            cache_dir: str | None = None,
+            max_size: int = cache.DEFAULT_MAX_SIZE) -> list[RenderResult]:
+        """
+        Render figures (dict of save path: figure) concurrently. Return results in input order.
+        Figures in the render cache in cache_dir are copied instead (see render_figure_cached).
+        Rendered figures are added to the cache in this process, so that workers don't evict concurrently.
+        """
+        results = {}
+        futures = {}
+        keys = {}
+        for path, figure in figures.items():
+            if cache_dir is not None:
+                keys[path] = get_figure_key(figure, format)
+                results[path] = load_cached_figure(cache_dir, keys[path], path, format)
+                if results[path] is not None:
+                    continue
+            futures[path] = self.submit(figure, path, format)
+        for path, future in futures.items():
+            results[path] = future.result()
+            if cache_dir is not None:
+                save_cached_figure(cache_dir, keys[path], path, format, max_size)
+        return [results[path] for path in figures]
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
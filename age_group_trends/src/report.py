@@ -0,0 +1,125 @@
+# standard
+from array import array
+import base64
+import os
+import sys
+# external
+import plotly
+# local
+import plot_data
+
+
+#########################
+# Functions and classes #
+#########################
+
+TYPED_ARRAY_CODES = {
+    "f4":   "f",    # float32: areas (2 decimal precision is kept up to ~100 000 kha)
+    "i2":   "h"     # int16: years
+}
+# ^ plotly.js typed array dtypes and the corresponding array module type codes
+# Typed arrays are stored as base64 strings: about 5 characters per area and 3 per year, instead of up to 20 in JSON
+
+
+def get_typed_array(values: list, dtype: str) -> dict | list:
+    """
+    Encode numbers as a plotly.js typed array ({"dtype": ..., "bdata": base64 of the little-endian values}).
+    Lists with missing values (e.g. legend dummy traces) are returned as is.
+    """
+    if any(value is None for value in values):
+        return values
+    data = array(TYPED_ARRAY_CODES[dtype], values)
+    if sys.byteorder == "big":
+        data.byteswap()
+    return {"dtype": dtype, "bdata": base64.b64encode(data.tobytes()).decode("ascii")}
+
+
+def get_values(values: dict | list) -> list:
+    """
+    Get values of a trace field: decode a plotly.js typed array (see plot_data.get_column_values), lists are returned as is.
+    """
+    if not isinstance(values, dict):
+        return list(values)
+    type_codes = dict(plot_data.TYPED_ARRAY_DTYPES.values())
+    out = array(type_codes[values["dtype"]], base64.b64decode(values["bdata"]))
+    if sys.byteorder == "big":
+        out.byteswap()
+    return out.tolist()
+
+
+def get_compact_trace(trace: dict) -> dict:
+    """
+    Get copy of a bar trace (dict) with x (years) and y (areas) as compact typed arrays (int16 and float32).
+    """
+    out = dict(trace)
+    if "x" in out:
+        out["x"] = get_typed_array(get_values(out["x"]), "i2")
+    if "y" in out:
+        out["y"] = get_typed_array(get_values(out["y"]), "f4")
+    return out
+
+
+def get_report_figure(figures: dict[str, dict]) -> dict:
+    """
+    Combine figures (dicts in plotly json structure, by tree species) into a single figure
+    with a dropdown to switch between tree species and types (all types or a single type).
+    Types are the offsetgroups of the area traces (traces without offsetgroup, e.g. legend, are shown with all types).
+    The first tree species is shown initially. Layout is taken from the first figure, titles and annotations
+    (e.g. trend slopes) are switched with the tree species.
+    """
+    data = []
+    data_tree_species = []
+    for tree_species, figure in figures.items():
+        data += [get_compact_trace(trace) for trace in figure["data"]]
+        data_tree_species += [tree_species] * len(figure["data"])
+    type_names = list(dict.fromkeys(trace["offsetgroup"] for trace in data if trace.get("offsetgroup") is not None))
+
+    buttons = []
+    for tree_species, figure in figures.items():
+        for type_name in [None] + type_names:
+            visible = [
+                trace_tree_species == tree_species and trace.get("offsetgroup") in (None, type_name)
+                if type_name is not None else trace_tree_species == tree_species
+                for trace, trace_tree_species in zip(data, data_tree_species)
+            ]
+            buttons += [{
+                "label": tree_species if type_name is None else f"{tree_species}: {type_name}",
+                "method": "update",
+                "args": [
+                    {"visible": visible},
+                    {"title.text": figure["layout"]["title"]["text"], "annotations": figure["layout"].get("annotations", [])}
+                ]
+                # ^ Annotations differ by tree species (e.g. trend slopes)
+            }]
+
+    for trace, visible in zip(data, buttons[0]["args"][0]["visible"]):
+        trace["visible"] = visible
+    layout = dict(next(iter(figures.values()))["layout"])
+    layout["updatemenus"] = [{
+        "buttons": buttons,
+        "direction": "down",
+        "showactive": True,
+        "x": 0,
+        "xanchor": "left",
+        "y": 1.15,
+        "yanchor": "bottom",
+        "font": {"size": 24}
+    }]
+    return {"data": data, "layout": layout}
+
+
+def write_html_report(figures: dict[str, dict], path: str) -> str:
+    """
+    Write a single self-contained interactive HTML report of figures (dicts, by tree species) with plotly.js embedded once.
+    See get_report_figure. Create parent directories if necessary.
+    Return path.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    plotly.io.write_html(
+        get_report_figure(figures),
+        path,
+        include_plotlyjs=True,
+        full_html=True,
+        validate=False
+    )
+    return path
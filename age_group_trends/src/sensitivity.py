@@ -0,0 +1,225 @@
+# standard
+import math
+# external
+import polars as pl
+from polars import col
+# local
+import dimensions
+import pipeline
+import prepare_data
+
+
+#########################
+# Functions and classes #
+#########################
+
+DRAW_FIELD = "DRAW"
+QUANTILE_FIELD = "QUANTILE"
+TYPES = ["protected", "production"]
+NAME_SEPARATOR = "|"
+# ^ Separator of type, age group and quantile in wide field names
+DEFAULT_QUANTILES = [0.05, 0.5, 0.95]
+DEFAULT_UNKNOWN_CONCENTRATION = 50.0
+DEFAULT_CUTTING_CONCENTRATION = 50.0
+# ^ Dirichlet concentrations (sum of parameters) of allocation weights.
+# Draws are closer to the observed proportions with higher values.
+
+
+def get_uniform(stream: int, seed: int) -> pl.Expr:
+    """
+    Get pseudo-random uniform values in (0, 1), one per record: hash of the record index (53 bits).
+    Each stream is an independent sequence for the same seed. Values depend on the polars hash function,
+    so they are reproducible for the same seed and polars version.
+    """
+    bits = pl.int_range(pl.len(), dtype=pl.UInt64).hash(seed, stream) // 2 ** 11
+    return (bits.cast(pl.Float64) + 0.5) / 2 ** 53
+
+
+def get_normal(stream: int, seed: int) -> pl.Expr:
+    """
+    Get pseudo-random standard normal values: Box-Muller transform of uniform streams stream and stream + 1.
+    """
+    radius = (-2 * get_uniform(stream, seed).log()).sqrt()
+    return radius * (2 * math.pi * get_uniform(stream + 1, seed)).cos()
+
+
+def get_gamma(shape: pl.Expr, stream: int, seed: int) -> pl.Expr:
+    """
+    Get pseudo-random gamma(shape, 1) values from uniform streams stream, stream + 1 and stream + 2.
+    Gamma(shape + 1) is approximated by the Wilson-Hilferty transform of a normal value and multiplied by
+    U ** (1 / shape) (Marsaglia and Tsang), so that small shapes are accurate too. Non-positive shapes give 0.
+    """
+    boosted = shape + 1
+    cube = (1 - 1 / (9 * boosted) + get_normal(stream, seed) * (1 / (9 * boosted)).sqrt()).clip(lower_bound=0) ** 3
+    out = (
+        pl.when(shape > 0)
+        .then(boosted * cube * get_uniform(stream + 2, seed) ** (1 / shape))
+        .otherwise(0.0)
+    )
+    return out
+
+
+def get_name(*parts: str) -> str:
+    return NAME_SEPARATOR.join(parts)
+
+
+def get_allocation_data(
+        age_group: pl.DataFrame,
+        aggregation_map: dict,
+        regeneration_cutting: dict[str, pl.DataFrame] | None) -> pl.DataFrame:
+    """
+    Get wide data for allocation draws: a record for each slice (tree species and owner) and year
+    with known area by type and aggregated age group ("production|0...20"), unknown area by type ("production|unknown")
+    and regeneration cutting area by type ("production|cutting", only in the slice of pipeline.REGENERATION_CUTTING_SLICE).
+    Missing areas are 0.
+    """
+    slice_fields = prepare_data.get_slice_fields(age_group)
+    is_unknown = col("AGE_GROUP") == dimensions.UNKNOWN_AGE_GROUP
+    areas = (
+        age_group
+        .lazy()
+        .with_columns(
+            AGE_GROUP=pl.when(is_unknown).then(col("AGE_GROUP")).otherwise(
+                col("AGE_GROUP").replace_strict(aggregation_map, default=col("AGE_GROUP"), return_dtype=age_group.schema["AGE_GROUP"])
+            )
+        )
+        .group_by(*slice_fields, "YEAR", "TYPE", "AGE_GROUP")
+        .agg(AREA=col("AREA").sum())
+        .select(*slice_fields, "YEAR", NAME=pl.concat_str(col("TYPE"), col("AGE_GROUP").cast(pl.String), separator=NAME_SEPARATOR), AREA=col("AREA"))
+    )
+    if regeneration_cutting is not None:
+        cutting = (
+            pl.concat([regeneration_cutting[type_name] for type_name in TYPES])
+            .lazy()
+            .join(pl.LazyFrame({field: [value] for field, value in pipeline.REGENERATION_CUTTING_SLICE.items()}), how="cross")
+            .select(*slice_fields, "YEAR", NAME=col("TYPE") + NAME_SEPARATOR + "cutting", AREA=col("AREA"))
+        )
+        areas = pl.concat([areas.with_columns(col(slice_fields).cast(pl.String)), cutting])
+        # ^ Categoricals from different frames are concatenated as strings
+    out = (
+        areas
+        .collect()
+        .pivot(index=[*slice_fields, "YEAR"], on="NAME", values="AREA", aggregate_function="sum")
+        .with_columns(col(field).cast(age_group.schema[field]) for field in slice_fields)
+    )
+    names = [
+        get_name(type_name, name)
+        for type_name in TYPES
+        for name in [*dict.fromkeys(aggregation_map.values()), dimensions.UNKNOWN_AGE_GROUP, "cutting"]
+    ]
+    out = out.with_columns(
+        col(name).fill_null(0.0) if name in out.columns else pl.lit(0.0).alias(name)
+        for name in names
+    )
+    return out.select(*slice_fields, "YEAR", *names).sort(*slice_fields, "YEAR")
+
+
+def prepare_areas_bands(
+        age_group: pl.DataFrame,
+        aggregation_map: dict,
+        regeneration_cutting: dict[str, pl.DataFrame] | None,
+        regeneration_cutting_age_threshold: int,
+        draw_count: int = 1000,
+        quantiles: list[float] = DEFAULT_QUANTILES,
+        unknown_concentration: float = DEFAULT_UNKNOWN_CONCENTRATION,
+        cutting_concentration: float = DEFAULT_CUTTING_CONCENTRATION,
+        seed: int = 0) -> pl.DataFrame:
+    """
+    Get quantile bands of areas by age group for all slices (tree species, owner and type) over draw_count draws of
+    the allocation weights that pipeline.prepare_areas_data takes to be the observed proportions
+    (see prepare_data.prepare_areas):
+        - unknown area is allocated to the age groups of its slice, year and type with weights drawn from
+          Dirichlet(unknown_concentration * proportions of known area),
+        - regeneration cutting area of each eligible age group (start at or above the threshold age) is allocated
+          to the types with weights drawn from Dirichlet(cutting_concentration * proportions of type area).
+    Mean weights are the observed proportions. Dirichlet weights are normalized gamma draws (see get_gamma).
+    All draws of all slices and years are computed in one vectorized query: a record for each draw, slice and year
+    with a field for each type and age group.
+    Return long data with QUANTILE, DOMINANT_SPECIES, OWNER, YEAR, TYPE, AGE_GROUP, AREA and UNIT
+    (areas are not rounded).
+    """
+    allocation = get_allocation_data(age_group, aggregation_map, regeneration_cutting)
+    slice_fields = prepare_data.get_slice_fields(age_group)
+    age_group_dtype = age_group.schema["AGE_GROUP"]
+    age_group_names = list(dict.fromkeys(aggregation_map.values()))
+    age_group_dimension = dimensions.get_age_group_dimension(aggregation_map, age_group_dtype)
+    eligible_names = (
+        age_group_dimension
+        .filter(col("AGE_GROUP").cast(pl.String).is_in(age_group_names), col("AGE_GROUP_START") >= regeneration_cutting_age_threshold)
+        ["AGE_GROUP"].cast(pl.String).to_list()
+    )
+
+    # Allocate unknown area with Dirichlet weights (normalized gamma draws, materialized once per record)
+    stream = 0
+    unknown_gammas = []
+    for type_name in TYPES:
+        known_total = pl.sum_horizontal(get_name(type_name, name) for name in age_group_names)
+        for name in age_group_names:
+            shape = unknown_concentration * col(get_name(type_name, name)) / known_total
+            unknown_gammas += [get_gamma(shape, stream, seed).alias(get_name("gamma", type_name, name))]
+            stream += 3
+    allocated = []
+    for type_name in TYPES:
+        gamma_total = pl.sum_horizontal(get_name("gamma", type_name, name) for name in age_group_names)
+        unknown = col(get_name(type_name, dimensions.UNKNOWN_AGE_GROUP))
+        allocated += [
+            (col(get_name(type_name, name)) + (col(get_name("gamma", type_name, name)) / gamma_total).fill_nan(0.0) * unknown)
+            .alias(get_name(type_name, name))
+            for name in age_group_names
+        ]
+        # ^ Slices without known area keep their (zero) known area
+
+    # Allocate regeneration cutting area of eligible age groups to types with Dirichlet weights
+    cutting_gammas = []
+    subtracted = []
+    for name in eligible_names:
+        group_total = pl.sum_horizontal(get_name(type_name, name) for type_name in TYPES)
+        for type_name in TYPES:
+            shape = cutting_concentration * col(get_name(type_name, name)) / group_total
+            cutting_gammas += [get_gamma(shape, stream, seed).alias(get_name("cutting gamma", type_name, name))]
+            stream += 3
+        gamma_total = pl.sum_horizontal(get_name("cutting gamma", type_name, name) for type_name in TYPES)
+        subtracted += [
+            (col(get_name(type_name, name)) - (col(get_name("cutting gamma", type_name, name)) / gamma_total).fill_nan(0.0) * col(get_name(type_name, "cutting")))
+            .alias(get_name(type_name, name))
+            for type_name in TYPES
+        ]
+
+    area_names = [get_name(type_name, name) for type_name in TYPES for name in age_group_names]
+    bands = (
+        allocation
+        .lazy()
+        .join(pl.LazyFrame({DRAW_FIELD: range(draw_count)}, schema={DRAW_FIELD: pl.UInt32}), how="cross")
+        .with_columns(unknown_gammas)
+        .with_columns(allocated)
+        .with_columns(cutting_gammas)
+        .with_columns(subtracted)
+        .group_by(*slice_fields, "YEAR")
+        .agg(
+            col(name).quantile(quantile, interpolation="linear").alias(get_name(name, str(quantile)))
+            for name in area_names
+            for quantile in quantiles
+        )
+        .unpivot(index=[*slice_fields, "YEAR"], variable_name="NAME", value_name="AREA")
+        .with_columns(col("NAME").str.split_exact(NAME_SEPARATOR, 2).struct.rename_fields(["TYPE", "AGE_GROUP", QUANTILE_FIELD]))
+        .unnest("NAME")
+        .select(
+            col(QUANTILE_FIELD).cast(pl.Float64),
+            *slice_fields,
+            "YEAR",
+            "TYPE",
+            col("AGE_GROUP").cast(age_group_dtype),
+            "AREA",
+            UNIT=pl.lit(age_group["UNIT"].drop_nulls().first())
+        )
+        .sort(QUANTILE_FIELD, *slice_fields, "TYPE", "YEAR", "AGE_GROUP")
+    )
+    return bands.collect()
+
+
+def get_band_areas(bands: pl.DataFrame, quantile: float, tree_species: str, owner: str = "all") -> dict[str, pl.DataFrame]:
+    """
+    Get plot areas by age group of a quantile band, tree species and owner (see pipeline.get_slice_areas).
+    Return dict with keys "protected" and "production".
+    """
+    return pipeline.get_slice_areas(bands.filter(col(QUANTILE_FIELD) == quantile).drop(QUANTILE_FIELD), tree_species, owner)
@@ -0,0 +1,283 @@
+# standard
+import argparse
+import asyncio
+from collections import OrderedDict
+import io
+import json
+import threading
+import time
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlsplit
+# external
+import polars as pl
+# local
+import pipeline
+# render (plotly and Kaleido) are imported on the first chart request
+
+
+#########################
+# Functions and classes #
+#########################
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8050
+DEFAULT_AREAS_CACHE_SIZE = 16
+# ^ Number of prepared areas data frames (one per regeneration cutting age threshold, all slices) kept in memory
+DEFAULT_IMAGE_CACHE_SIZE = 64
+# ^ Number of rendered charts kept in memory
+DATA_CONTENT_TYPES = {
+    "json":     "application/json",
+    "arrow":    "application/vnd.apache.arrow.stream",
+    "csv":      "text/csv; charset=utf-8"
+}
+IMAGE_CONTENT_TYPES = {
+    "png":      "image/png",
+    "svg":      "image/svg+xml",
+    "pdf":      "application/pdf"
+}
+STATUS_TEXTS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class LRUCache:
+    """
+    Thread safe least recently used cache with a maximum number of entries.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key: Any, compute: Callable[[], Any]) -> Any:
+        """
+        Get value by key or compute and cache it if key is not cached.
+        Value is computed outside the lock, so that other keys can be read meanwhile.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return value
+
+    def get_info(self) -> dict:
+        with self.lock:
+            return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+class QueryError(Exception):
+    """
+    Invalid query. Answered with status (400 or 404) and message.
+    """
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def get_parameter(parameters: dict[str, list[str]], name: str, default: str | None = None) -> str:
+    values = parameters.get(name)
+    if not values:
+        if default is None:
+            raise QueryError(400, f"Missing parameter: {name}")
+        return default
+    return values[-1]
+
+
+def get_choice(parameters: dict[str, list[str]], name: str, choices: list[str], default: str | None = None) -> str:
+    value = get_parameter(parameters, name, default)
+    if value not in choices:
+        raise QueryError(400 if name == "format" else 404, f"Unknown {name}: {value}. Available values: {choices}")
+    return value
+
+
+def write_data(data: pl.DataFrame, format_name: str) -> bytes:
+    """
+    Serialize data frame as json (list of records), Arrow IPC stream or csv.
+    """
+    if format_name == "json":
+        return data.write_json().encode("utf-8")
+    if format_name == "arrow":
+        buffer = io.BytesIO()
+        data.write_ipc_stream(buffer)
+        return buffer.getvalue()
+    return data.write_csv().encode("utf-8")
+
+
+class QueryService:
+    """
+    Query service of areas data and charts with cleaned data in memory (loaded once, or from the data cache).
+    Areas of all slices are prepared once per regeneration cutting age threshold and rendered charts are kept
+    in LRU caches. Queries are answered by handle, which doesn't depend on the HTTP server (see serve).
+    """
+    def __init__(
+            self,
+            config: dict,
+            areas_cache_size: int = DEFAULT_AREAS_CACHE_SIZE,
+            image_cache_size: int = DEFAULT_IMAGE_CACHE_SIZE):
+        self.config = {**config, "tree_species": ["all"], "storage_formats": [], "plot": True}
+        # ^ "all" makes clean_stage clean regeneration cutting data too. Clean and plot data are not saved.
+        clean, _ = pipeline.clean_stage(self.config)
+        self.age_group = clean["age_group"]
+        self.regeneration_cutting = None
+        if clean.get("regeneration_cutting") is not None:
+            self.regeneration_cutting = pipeline.prepare_regeneration_cutting_plot_data(
+                clean["regeneration_cutting"],
+                self.age_group["YEAR"].min(),
+                self.age_group["YEAR"].max()
+            )
+        self.tree_species = sorted(self.age_group["DOMINANT_SPECIES"].unique().cast(pl.String).to_list())
+        self.owners = sorted(self.age_group["OWNER"].unique().cast(pl.String).to_list())
+        self.areas_cache = LRUCache(areas_cache_size)
+        self.image_cache = LRUCache(image_cache_size)
+
+    def get_areas_data(self, threshold: int) -> pl.DataFrame:
+        """
+        Get areas data of all slices for a regeneration cutting age threshold (see pipeline.prepare_areas_data).
+        """
+        return self.areas_cache.get_or_compute(
+            threshold,
+            lambda: pipeline.prepare_areas_data(
+                self.age_group,
+                self.config["age_group_aggregation_map"],
+                self.regeneration_cutting,
+                threshold
+            )
+        )
+
+    def get_areas(self, tree_species: str, owner: str, type_name: str | None, threshold: int) -> pl.DataFrame:
+        """
+        Get areas by age group of a slice in plot data format (see prepare_data.get_areas) for one type
+        or both types (protected and production) if type_name is None.
+        """
+        areas = pipeline.get_slice_areas(self.get_areas_data(threshold), tree_species, owner)
+        if type_name is not None:
+            return areas[type_name]
+        return pl.concat([areas["protected"], areas["production"]], how="diagonal")
+
+    def get_chart(self, tree_species: str, threshold: int, format_name: str) -> bytes:
+        """
+        Get chart of a tree species (all owners) rendered as image bytes (see pipeline.process_species).
+        """
+        def render_chart() -> bytes:
+            import render
+            out = pipeline.process_species(tree_species, self.get_areas_data(threshold), self.regeneration_cutting, self.config)
+            return render.render_image(out["figure"], format_name)
+
+        return self.image_cache.get_or_compute((tree_species, threshold, format_name), render_chart)
+
+    def get_query(self, parameters: dict[str, list[str]]) -> tuple[str, int]:
+        tree_species = get_choice(parameters, "species", self.tree_species, "all")
+        threshold_value = get_parameter(parameters, "threshold", str(self.config["regeneration_cutting_age_threshold"]))
+        try:
+            threshold = int(threshold_value)
+        except ValueError:
+            raise QueryError(400, f"Threshold must be an integer (years): {threshold_value}")
+        return tree_species, threshold
+
+    def handle(self, method: str, target: str) -> tuple[int, str, bytes]:
+        """
+        Answer a request (blocking). Return status, content type and body. Endpoints:
+            /areas?species=pine&owner=all&type=production&threshold=60&format=json (format: json, arrow, csv)
+            /chart?species=pine&threshold=60&format=png (format: png, svg, pdf)
+            /info (available species, owners and cache statistics)
+        """
+        url = urlsplit(target)
+        parameters = parse_qs(url.query)
+        try:
+            if method not in ["GET", "HEAD"]:
+                raise QueryError(405, f"Method not allowed: {method}")
+            if url.path == "/areas":
+                tree_species, threshold = self.get_query(parameters)
+                owner = get_choice(parameters, "owner", self.owners, "all")
+                type_name = get_choice(parameters, "type", ["protected", "production", "both"], "both")
+                format_name = get_choice(parameters, "format", list(DATA_CONTENT_TYPES), "json")
+                data = self.get_areas(tree_species, owner, None if type_name == "both" else type_name, threshold)
+                return 200, DATA_CONTENT_TYPES[format_name], write_data(data, format_name)
+            if url.path == "/chart":
+                tree_species, threshold = self.get_query(parameters)
+                format_name = get_choice(parameters, "format", list(IMAGE_CONTENT_TYPES), "png")
+                if tree_species not in self.config["plot_titles"]:
+                    raise QueryError(404, f"No chart for species: {tree_species}")
+                return 200, IMAGE_CONTENT_TYPES[format_name], self.get_chart(tree_species, threshold, format_name)
+            if url.path == "/info":
+                info = {
+                    "species": self.tree_species,
+                    "owners": self.owners,
+                    "types": ["protected", "production"],
+                    "areas_cache": self.areas_cache.get_info(),
+                    "image_cache": self.image_cache.get_info()
+                }
+                return 200, DATA_CONTENT_TYPES["json"], json.dumps(info, ensure_ascii=False).encode("utf-8")
+            raise QueryError(404, f"Unknown path: {url.path}")
+        except QueryError as error:
+            return error.status, "text/plain; charset=utf-8", str(error).encode("utf-8")
+
+
+async def handle_connection(service: QueryService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Answer a single HTTP/1.1 request (connection is closed after the response).
+    Queries run in a worker thread, so that the event loop keeps accepting requests meanwhile.
+    """
+    start = time.perf_counter()
+    try:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        while (await reader.readline()).strip():
+            pass    # headers are not used
+        parts = request_line.split()
+        if len(parts) != 3:
+            status, content_type, body = 400, "text/plain; charset=utf-8", b"Invalid request line"
+        else:
+            try:
+                status, content_type, body = await asyncio.to_thread(service.handle, parts[0], parts[1])
+            except Exception as error:
+                status, content_type, body = 500, "text/plain; charset=utf-8", repr(error).encode("utf-8")
+        header = (
+            f"HTTP/1.1 {status} {STATUS_TEXTS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(header.encode("latin-1") + (body if parts[:1] != ["HEAD"] else b""))
+        await writer.drain()
+        print(f"{request_line} {status} {len(body)} B {(time.perf_counter() - start) * 1000:.1f} ms")
+    finally:
+        writer.close()
+
+
+async def serve(service: QueryService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+    """
+    Serve queries of service over HTTP until cancelled.
+    """
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(service, reader, writer), host, port)
+    print(f"Serving on http://{host}:{port} (endpoints: /areas, /chart, /info)")
+    async with server:
+        await server.serve_forever()
+
+
+##########
+# Script #
+##########
+
+if __name__ == "__main__":
+    import main
+
+    parser = argparse.ArgumentParser(description="Serve areas data and charts from cleaned data in memory.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--areas-cache-size", type=int, default=DEFAULT_AREAS_CACHE_SIZE)
+    parser.add_argument("--image-cache-size", type=int, default=DEFAULT_IMAGE_CACHE_SIZE)
+    arguments = parser.parse_args()
+
+    query_service = QueryService(main.PIPELINE_CONFIG, arguments.areas_cache_size, arguments.image_cache_size)
+    try:
+        asyncio.run(serve(query_service, arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,80 @@
+# standard
+import os
+# external
+import polars as pl
+
+
+#########################
+# Functions and classes #
+#########################
+
+FILE_EXTENSIONS = {
+    "csv":      ".csv",
+    "parquet":  ".parquet",
+    "ipc":      ".arrow"
+}
+
+
+def get_format(path: str) -> str:
+    """
+    Get storage format name from file extension.
+    """
+    extension = os.path.splitext(path)[1]
+    for format_name, format_extension in FILE_EXTENSIONS.items():
+        if extension == format_extension:
+            return format_name
+    raise ValueError(f"Unknown storage format for file {path}. Known extensions: {list(FILE_EXTENSIONS.values())}")
+
+
+def get_path(path: str, format_name: str) -> str:
+    """
+    Replace (or add) file extension of input path with the extension of input format.
+    """
+    return os.path.splitext(path)[0] + FILE_EXTENSIONS[format_name]
+
+
+def write_data(data: pl.DataFrame, path: str, format_name: str | None = None) -> str:
+    """
+    Write data frame to csv, parquet (zstd compressed, with column statistics) or Arrow IPC file.
+    Format is taken from file extension if format_name is not given.
+    Create parent directories if necessary.
+    Return written file path.
+    """
+    if format_name is not None:
+        path = get_path(path, format_name)
+    format_name = get_format(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if format_name == "csv":
+        data.write_csv(path, separator=",")
+    elif format_name == "parquet":
+        data.write_parquet(path, compression="zstd", statistics=True)
+    else:
+        data.write_ipc(path, compression="uncompressed")
+        # ^ Uncompressed, so that readers can memory map the file without copying
+    return path
+
+
+def read_data(path: str) -> pl.DataFrame:
+    """
+    Read data frame from csv, parquet or Arrow IPC file. Format is taken from file extension.
+    Parquet and Arrow IPC files are memory mapped (Arrow IPC is read without copying).
+    """
+    format_name = get_format(path)
+    if format_name == "csv":
+        return pl.read_csv(path, separator=",")
+    if format_name == "parquet":
+        return pl.read_parquet(path, memory_map=True)
+    return pl.read_ipc(path, memory_map=True)
+
+
+def scan_data(path: str) -> pl.LazyFrame:
+    """
+    Lazily scan csv, parquet or Arrow IPC file. Format is taken from file extension.
+    """
+    format_name = get_format(path)
+    if format_name == "csv":
+        return pl.scan_csv(path, separator=",")
+    if format_name == "parquet":
+        return pl.scan_parquet(path)
+    return pl.scan_ipc(path, memory_map=True)
@@ -0,0 +1,180 @@
+# standard
+from statistics import NormalDist
+# external
+import polars as pl
+from polars import col
+# local
+import pipeline
+import prepare_data
+
+
+#########################
+# Functions and classes #
+#########################
+
+DEFAULT_ROLLING_WINDOW = 5
+# ^ Years in rolling means
+DEFAULT_CONFIDENCE = 0.95
+# ^ Confidence level of trend slope intervals
+DEFAULT_MIN_SEGMENT = 3
+# ^ Minimum number of year-over-year changes on each side of a change point
+
+
+def get_series_fields(data: pl.DataFrame | pl.LazyFrame) -> list[str]:
+    """
+    Get fields that identify a time series: scenario and slice fields (see prepare_data.get_slice_fields), TYPE and AGE_GROUP.
+    """
+    names = data.collect_schema().names()
+    return [*prepare_data.get_slice_fields(data), *[name for name in ["TYPE", "AGE_GROUP"] if name in names]]
+
+
+def get_long_data(data: pl.DataFrame | dict[str, pl.DataFrame]) -> pl.DataFrame:
+    """
+    Get long data with an AGE_GROUP and AREA field from the output of clean_data.combine_all_and_production_data,
+    pipeline.prepare_areas_data (long) or prepare_data.get_areas (wide, a field for each age group, or a dict of them by type).
+    """
+    if isinstance(data, dict):
+        data = pl.concat(list(data.values()), how="diagonal")
+    if "AGE_GROUP" in data.columns:
+        return data
+    out = data.unpivot(
+        index=[field for field in data.columns if field in pipeline.NON_AGE_GROUP_FIELDS or field in prepare_data.get_slice_fields(data)],
+        variable_name="AGE_GROUP",
+        value_name="AREA"
+    )
+    return out
+
+
+def get_t_quantile(probability: float, degrees_of_freedom: pl.Expr) -> pl.Expr:
+    """
+    Get quantile of Student's t distribution: Cornish-Fisher expansion around the normal quantile
+    (error below 0.004 for 3 or more degrees of freedom, exact in the limit).
+    """
+    z = NormalDist().inv_cdf(probability)
+    v = degrees_of_freedom.cast(pl.Float64)
+    out = (
+        z
+        + (z ** 3 + z) / (4 * v)
+        + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * v ** 2)
+        + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * v ** 3)
+        + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * v ** 4)
+    )
+    return out
+
+
+def get_trend_series(data: pl.DataFrame | dict[str, pl.DataFrame], rolling_window: int = DEFAULT_ROLLING_WINDOW) -> pl.DataFrame:
+    """
+    Get yearly statistics of each time series (see get_series_fields) in one windowed pass:
+    YOY_CHANGE (area change from the previous year), YOY_GROWTH (relative change) and
+    ROLLING_MEAN (mean of the last rolling_window years, shorter at the start of the series).
+    """
+    data = get_long_data(data)
+    series_fields = get_series_fields(data)
+    change = col("AREA") - col("AREA").shift(1)
+    out = (
+        data
+        .sort(*series_fields, "YEAR")
+        .with_columns(
+            YOY_CHANGE=change.over(series_fields),
+            YOY_GROWTH=(change / col("AREA").shift(1)).over(series_fields),
+            ROLLING_MEAN=col("AREA").rolling_mean(rolling_window, min_samples=1).over(series_fields)
+        )
+    )
+    return out
+
+
+def get_trend_summary(
+        data: pl.DataFrame | dict[str, pl.DataFrame],
+        confidence: float = DEFAULT_CONFIDENCE,
+        min_segment: int = DEFAULT_MIN_SEGMENT) -> pl.DataFrame:
+    """
+    Get trend statistics of each time series (see get_series_fields) in one grouped pass:
+        - YEAR_FIRST, YEAR_LAST, AREA_FIRST, AREA_LAST and YEAR_COUNT,
+        - SLOPE (least squares trend, area per year) with SLOPE_LOW and SLOPE_HIGH (confidence interval, t distribution),
+        - CAGR (compound annual growth rate from the first to the last year, null if the first area is not positive),
+        - CHANGE_POINT_YEAR: first year of the second segment when year-over-year changes are split into two segments
+          with different mean changes (trend break) with the least squared error,
+          TREND_BEFORE and TREND_AFTER (mean yearly changes of the segments) and CHANGE_POINT_SCORE
+          (share of the variance of yearly changes explained by the split, 0...1).
+          Segments have at least min_segment changes (null if the series is too short).
+    """
+    data = get_long_data(data)
+    series_fields = get_series_fields(data)
+
+    # Least squares slope
+    year = col("YEAR").cast(pl.Float64)
+    year_deviation = year - year.mean()
+    sxx = (year_deviation ** 2).sum()
+    slope = (year_deviation * (col("AREA") - col("AREA").mean())).sum() / sxx
+    residual = col("AREA") - col("AREA").mean() - slope * year_deviation
+    slope_error = ((residual ** 2).sum() / (pl.len() - 2)).sqrt() / sxx.sqrt()
+    slope_margin = get_t_quantile(1 - (1 - confidence) / 2, pl.len() - 2) * slope_error
+
+    # Change point of yearly changes: squared error of each split (k changes in the first segment)
+    changes = col("AREA").diff().slice(1)
+    change_count = pl.len() - 1
+    k = pl.int_range(1, change_count + 1).cast(pl.Float64)
+    left_sum, left_squares = changes.cum_sum(), (changes ** 2).cum_sum()
+    right_sum, right_squares = changes.sum() - left_sum, (changes ** 2).sum() - left_squares
+    split_error = (
+        (left_squares - left_sum ** 2 / k)
+        + (right_squares - right_sum ** 2 / (change_count - k))
+    )
+    is_valid = (k >= min_segment) & (change_count - k >= min_segment)
+    split_error = pl.when(is_valid).then(split_error).otherwise(None)
+    is_best = split_error == split_error.min()
+    total_error = ((changes - changes.mean()) ** 2).sum()
+    has_split = split_error.is_not_null().any()
+
+    out = (
+        data
+        .sort(*series_fields, "YEAR")
+        .group_by(series_fields, maintain_order=True)
+        .agg(
+            YEAR_FIRST=col("YEAR").first(),
+            YEAR_LAST=col("YEAR").last(),
+            YEAR_COUNT=pl.len(),
+            AREA_FIRST=col("AREA").first(),
+            AREA_LAST=col("AREA").last(),
+            SLOPE=slope,
+            SLOPE_LOW=slope - slope_margin,
+            SLOPE_HIGH=slope + slope_margin,
+            CHANGE_POINT_YEAR=col("YEAR").slice(2).extend_constant(None, 1).filter(is_best).first(),
+            TREND_BEFORE=(left_sum / k).filter(is_best).first(),
+            TREND_AFTER=(right_sum / (change_count - k)).filter(is_best).first(),
+            CHANGE_POINT_SCORE=pl.when(has_split & (total_error > 0)).then(1 - split_error.min() / total_error).otherwise(None)
+        )
+        .with_columns(
+            CAGR=(
+                pl.when(col("AREA_FIRST") > 0)
+                .then((col("AREA_LAST") / col("AREA_FIRST")) ** (1 / (col("YEAR_LAST") - col("YEAR_FIRST"))) - 1)
+                .otherwise(None)
+            )
+        )
+    )
+    return out
+
+
+def get_trend_annotation(summary: pl.DataFrame, unit: str = "kha", font_size: int = 20) -> dict:
+    """
+    Get plot annotation (dict in plotly json structure) with the trend slope and confidence interval
+    of each type and age group in summary (see get_trend_summary, a single slice), placed below the legend.
+    """
+    summary = summary.sort("TYPE", "AGE_GROUP")
+    lines = [f"Trend {summary['YEAR_FIRST'].min()}...{summary['YEAR_LAST'].max()} ({unit}/year):"]
+    for record in summary.iter_rows(named=True):
+        margin = (record["SLOPE_HIGH"] - record["SLOPE_LOW"]) / 2
+        lines += [f"{record['TYPE']} {record['AGE_GROUP']}: {record['SLOPE']:+.1f} (±{margin:.1f})"]
+    out = {
+        "text": "<br>".join(lines),
+        "xref": "paper",
+        "yref": "paper",
+        "x": 1.01,
+        "y": 0,
+        "xanchor": "left",
+        "yanchor": "bottom",
+        "showarrow": False,
+        "font": {"size": font_size},
+        "align": "left"
+    }
+    return out
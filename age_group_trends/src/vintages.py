@@ -0,0 +1,344 @@
+# standard
+import argparse
+from datetime import datetime
+import glob
+import hashlib
+import json
+import os
+# external
+import polars as pl
+from polars import col
+# local
+import cache
+import clean_data
+import storage
+
+
+#########################
+# Functions and classes #
+#########################
+
+DEFAULT_STORE_DIR = "age_group_trends/data/vintages"
+TIMESTAMP_FIELD = "Laadimise ajatempel aruandele"
+TIMESTAMP_FORMAT = "%d.%m.%Y %H:%M:%S"
+# ^ Report load timestamp of raw records, e.g. "27.02.2025 13:21:59". Each timestamp is a vintage of the export.
+VINTAGE_FIELD = "VINTAGE"
+DELETED_FIELD = "DELETED"
+# ^ Record marks a key as removed in its vintage (only for vintages ingested as complete exports)
+MANIFEST_FILE = "manifest.json"
+SEGMENT_DIR = "segments"
+STORAGE_FORMAT = "parquet"
+
+
+def get_vintage(value: datetime | str) -> datetime:
+    """
+    Get vintage from datetime or string in raw timestamp format ("27.02.2025 13:21:59") or ISO format.
+    """
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        return datetime.fromisoformat(value)
+
+
+def get_rows_hash(data: pl.DataFrame) -> str:
+    """
+    Get sha256 hash of records (sorted, so that it doesn't depend on record order or source files).
+    Csv serialization is used, so that the hash is stable across polars versions.
+    """
+    serialized = data.sort(data.columns, nulls_last=True).write_csv()
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def get_latest(records: pl.LazyFrame, key_fields: list[str]) -> pl.LazyFrame:
+    """
+    Get the latest record (by vintage) of each key.
+    """
+    return records.sort(VINTAGE_FIELD).unique(subset=key_fields, keep="last")
+
+
+class VintageStore:
+    """
+    Append-only store of raw export records of a single dataset (e.g. age group or regeneration cutting exports),
+    versioned by report load timestamp (vintage).
+    Records are keyed by all raw fields except the timestamp and Meetriku väärtus. Ingesting a vintage appends only
+    records that are new or changed compared to the latest earlier vintage, as a segment file that is never rewritten.
+    A manifest keeps the hash of each ingested vintage batch and of each ingested file, so that files and vintages
+    that have been ingested before are skipped (history isn't read again).
+    Records as of any vintage and revisions between vintages are taken from the segments.
+    """
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+        self.manifest = {"fields": None, "key_fields": None, "schema": None, "files": {}, "batches": []}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as file:
+                self.manifest = json.load(file)
+
+    def save_manifest(self) -> None:
+        """
+        Save manifest atomically (written to a temporary file first).
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        temporary_path = f"{self.manifest_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, ensure_ascii=False, indent=2)
+        os.replace(temporary_path, self.manifest_path)
+
+    def get_schema(self) -> pl.Schema:
+        """
+        Get schema of stored records: raw fields (without the timestamp), VINTAGE and DELETED.
+        """
+        return pl.Schema({
+            **{name: getattr(pl, dtype)() for name, dtype in self.manifest["schema"].items()},
+            VINTAGE_FIELD: pl.Datetime("us"),
+            DELETED_FIELD: pl.Boolean
+        })
+
+    def scan_records(self) -> pl.LazyFrame:
+        """
+        Lazily scan all stored records (all segments).
+        """
+        if self.manifest["schema"] is None:
+            return pl.LazyFrame(schema={VINTAGE_FIELD: pl.Datetime("us"), DELETED_FIELD: pl.Boolean})
+        paths = [
+            os.path.join(self.store_dir, SEGMENT_DIR, batch["segment"])
+            for batch in self.manifest["batches"]
+            if batch["segment"] is not None
+        ]
+        if not paths:
+            return pl.LazyFrame(schema=self.get_schema())
+        return pl.scan_parquet(paths)
+
+    def scan_state(self, vintage: datetime | str | None = None) -> pl.LazyFrame:
+        """
+        Lazily get the latest stored record of each key as of vintage (latest vintage if None), removed keys included.
+        """
+        records = self.scan_records()
+        if vintage is not None:
+            records = records.filter(col(VINTAGE_FIELD) <= get_vintage(vintage))
+        return get_latest(records, self.manifest["key_fields"] or [])
+
+    def scan_as_of(self, vintage: datetime | str | None = None) -> pl.LazyFrame:
+        """
+        Lazily get records as of vintage (latest vintage if None) in raw data schema, so that they can be cleaned
+        like raw files (see clean_data). Laadimise ajatempel aruandele is the vintage that each record was last revised in.
+        """
+        if self.manifest["fields"] is None:
+            raise ValueError(f"No vintages ingested in {self.store_dir}")
+        out = (
+            self.scan_state(vintage)
+            .filter(~col(DELETED_FIELD))
+            .with_columns(col(VINTAGE_FIELD).dt.strftime(TIMESTAMP_FORMAT).alias(TIMESTAMP_FIELD))
+            .select(self.manifest["fields"])
+            .sort(self.manifest["key_fields"])
+        )
+        return out
+
+    def get_vintages(self) -> pl.DataFrame:
+        """
+        Get ingested vintages with the number of records in their exports (ROWS), appended records (APPENDED)
+        and removed keys (DELETED).
+        """
+        batches = pl.DataFrame(
+            self.manifest["batches"],
+            schema={"vintage": pl.String, "rows": pl.Int64, "appended": pl.Int64, "deleted": pl.Int64},
+            strict=False
+        )
+        out = (
+            batches
+            .group_by(col("vintage").str.to_datetime("%Y-%m-%dT%H:%M:%S").alias(VINTAGE_FIELD))
+            .agg(
+                BATCHES=pl.len(),
+                ROWS=col("rows").sum(),
+                APPENDED=col("appended").sum(),
+                DELETED=col("deleted").sum()
+            )
+            .sort(VINTAGE_FIELD)
+        )
+        return out
+
+    def get_revisions(self, from_vintage: datetime | str, to_vintage: datetime | str | None = None) -> pl.DataFrame:
+        """
+        Get records that differ between two vintages (to_vintage is the latest vintage if None):
+        key fields, VALUE_FROM and VALUE_TO (raw Meetriku väärtus), VINTAGE_FROM and VINTAGE_TO (vintages that the
+        values were last revised in), REVISION (added, removed or changed) and CHANGE (numeric difference, null if
+        either value is missing or not a number).
+        """
+        key_fields = self.manifest["key_fields"]
+        value_field = clean_data.VALUE_FIELD
+
+        def get_values(vintage: datetime | str | None, suffix: str) -> pl.LazyFrame:
+            return (
+                self.scan_state(vintage)
+                .filter(~col(DELETED_FIELD))
+                .select(*key_fields, col(value_field).alias(f"VALUE_{suffix}"), col(VINTAGE_FIELD).alias(f"VINTAGE_{suffix}"))
+            )
+
+        out = (
+            get_values(from_vintage, "FROM")
+            .join(get_values(to_vintage, "TO"), on=key_fields, how="full", coalesce=True, nulls_equal=True)
+            .filter(
+                col("VINTAGE_FROM").is_null()
+                | col("VINTAGE_TO").is_null()
+                | col("VALUE_FROM").ne_missing(col("VALUE_TO"))
+            )
+            .with_columns(
+                REVISION=(
+                    pl.when(col("VINTAGE_FROM").is_null()).then(pl.lit("added"))
+                    .when(col("VINTAGE_TO").is_null()).then(pl.lit("removed"))
+                    .otherwise(pl.lit("changed"))
+                ),
+                CHANGE=clean_data.parse_number(col("VALUE_TO")) - clean_data.parse_number(col("VALUE_FROM"))
+            )
+            .sort(key_fields)
+        )
+        return out.collect()
+
+    def ingest(self, paths: str | list[str], complete: bool = False) -> list[dict]:
+        """
+        Ingest raw export files (paths or glob patterns). Files that have been ingested before are skipped without
+        reading them. Records are split into vintages by Laadimise ajatempel aruandele and each vintage batch is
+        skipped if its hash has been ingested before. Otherwise new and changed records are appended as a segment.
+        If complete is True, the files are taken to be complete exports of the dataset in their vintages,
+        so keys that are missing from a vintage are marked as removed in it.
+        Vintages can be ingested out of order, but not before a later revision of the same keys
+        (raise ValueError, because the later revision would then be compared to the wrong values).
+        Return manifest entries of ingested batches.
+        """
+        patterns = [paths] if isinstance(paths, str) else paths
+        file_hashes = {
+            path: cache.get_file_hash(path)
+            for pattern in patterns
+            for path in sorted(glob.glob(pattern))
+        }
+        new_paths = [path for path, file_hash in file_hashes.items() if file_hash not in self.manifest["files"]]
+        if not new_paths:
+            return []
+
+        raw = clean_data.scan_raw_data(new_paths).collect()
+        fields = raw.columns
+        key_fields = [name for name in fields if name not in [TIMESTAMP_FIELD, clean_data.VALUE_FIELD]]
+        if self.manifest["fields"] is None:
+            self.manifest["fields"] = fields
+            self.manifest["key_fields"] = key_fields
+            self.manifest["schema"] = {name: dtype.base_type().__name__ for name, dtype in raw.drop(TIMESTAMP_FIELD).schema.items()}
+        elif sorted(fields) != sorted(self.manifest["fields"]):
+            raise ValueError(f"Fields of {new_paths} don't match the fields of {self.store_dir}: {self.manifest['fields']}")
+        schema = self.get_schema()
+
+        records = (
+            raw
+            .with_columns(col(TIMESTAMP_FIELD).str.to_datetime(TIMESTAMP_FORMAT, time_unit="us").alias(VINTAGE_FIELD))
+            .select([col(name).cast(dtype) for name, dtype in schema.items() if name != DELETED_FIELD])
+        )
+        batches = []
+        for vintage in records[VINTAGE_FIELD].unique().sort().to_list():
+            batch = records.filter(col(VINTAGE_FIELD) == vintage)
+            batch_hash = get_rows_hash(batch)
+            if any(entry["hash"] == batch_hash for entry in self.manifest["batches"]):
+                continue
+
+            later = (
+                self.scan_records()
+                .filter(col(VINTAGE_FIELD) > vintage)
+                .join(batch.lazy(), on=key_fields, how="semi", nulls_equal=True)
+                .select(pl.len())
+                .collect()
+                .item()
+            )
+            if later > 0:
+                raise ValueError(f"Keys of vintage {vintage} have {later} later revisions in {self.store_dir}")
+
+            current = self.scan_state(vintage).filter(~col(DELETED_FIELD)).collect()
+            changed = (
+                batch
+                .join(current.drop(VINTAGE_FIELD, DELETED_FIELD), on=[*key_fields, clean_data.VALUE_FIELD], how="anti", nulls_equal=True)
+                .with_columns(pl.lit(False).alias(DELETED_FIELD))
+            )
+            deleted = current.clear()
+            if complete:
+                deleted = (
+                    current
+                    .join(batch, on=key_fields, how="anti", nulls_equal=True)
+                    .with_columns(
+                        pl.lit(None, schema[clean_data.VALUE_FIELD]).alias(clean_data.VALUE_FIELD),
+                        pl.lit(vintage, schema[VINTAGE_FIELD]).alias(VINTAGE_FIELD),
+                        pl.lit(True).alias(DELETED_FIELD)
+                    )
+                )
+            appended = pl.concat([changed.select(schema.names()), deleted.select(schema.names())])
+
+            segment = None
+            if appended.height > 0:
+                segment = f"{len(self.manifest['batches']):06d}_{vintage:%Y%m%d%H%M%S}{storage.FILE_EXTENSIONS[STORAGE_FORMAT]}"
+                storage.write_data(appended, os.path.join(self.store_dir, SEGMENT_DIR, segment))
+            entry = {
+                "vintage": vintage.isoformat(),
+                "hash": batch_hash,
+                "segment": segment,
+                "rows": batch.height,
+                "appended": changed.height,
+                "deleted": deleted.height,
+                "complete": complete,
+                "ingested": datetime.now().isoformat(timespec="seconds")
+            }
+            self.manifest["batches"] += [entry]
+            batches += [entry]
+            self.save_manifest()
+            # ^ Saved after each segment, so that an interrupted ingest keeps the vintages that were appended
+
+        self.manifest["files"].update({
+            file_hash: os.path.basename(path)
+            for path, file_hash in file_hashes.items()
+            if path in new_paths
+        })
+        self.save_manifest()
+        return batches
+
+
+def ingest_raw_data(store_dir: str, age_group_raw_paths: str, regeneration_cutting_raw_path: str | None) -> dict[str, list[dict]]:
+    """
+    Ingest age group and regeneration cutting raw files to vintage stores of their own in store_dir
+    (subdirectories age_group and regeneration_cutting). Exports of single tree species are not complete exports
+    of the dataset, so removed keys are not marked.
+    Return manifest entries of ingested batches by dataset.
+    """
+    out = {"age_group": VintageStore(os.path.join(store_dir, "age_group")).ingest(age_group_raw_paths)}
+    if regeneration_cutting_raw_path is not None:
+        out["regeneration_cutting"] = VintageStore(os.path.join(store_dir, "regeneration_cutting")).ingest(regeneration_cutting_raw_path)
+    return out
+
+
+##########
+# Script #
+##########
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest raw export vintages and query records as of a vintage or revisions between vintages.")
+    parser.add_argument("command", choices=["ingest", "vintages", "as-of", "revisions"])
+    parser.add_argument("paths", nargs="*", help="Raw files or glob patterns (for ingest)")
+    parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR, help="Store of a single dataset")
+    parser.add_argument("--complete", action="store_true", help="Files are complete exports: mark missing keys as removed")
+    parser.add_argument("--vintage", default=None, help="Vintage (as-of), e.g. \"27.02.2025 13:21:59\". Latest if not given")
+    parser.add_argument("--from-vintage", default=None, help="Earlier vintage (revisions). First if not given")
+    parser.add_argument("--output", default=None, help="Save as-of records or revisions (csv, parquet or ipc by extension)")
+    arguments = parser.parse_args()
+
+    store = VintageStore(arguments.store_dir)
+    if arguments.command == "ingest":
+        for entry in store.ingest(arguments.paths, arguments.complete):
+            print(f"{entry['vintage']}: {entry['rows']} records, {entry['appended']} appended, {entry['deleted']} removed")
+    elif arguments.command == "vintages":
+        print(store.get_vintages())
+    else:
+        if arguments.command == "as-of":
+            result = store.scan_as_of(arguments.vintage).collect()
+        else:
+            from_vintage = arguments.from_vintage or store.get_vintages()[VINTAGE_FIELD].min()
+            result = store.get_revisions(from_vintage, arguments.vintage)
+        if arguments.output is not None:
+            print(f"Saved {result.height} records to {storage.write_data(result, arguments.output)}")
+        else:
+            print(result)
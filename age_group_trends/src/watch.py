@@ -0,0 +1,102 @@
+# standard
+import glob
+import os
+import time
+import traceback
+# local
+import dag
+import pipeline
+import profiling
+
+
+#########################
+# Functions and classes #
+#########################
+
+DEFAULT_INTERVAL = 2.0     # seconds
+
+
+def get_snapshot(patterns: list[str]) -> dict[str, tuple[int, int]]:
+    """
+    Get modification time (ns) and size of all files matching input glob patterns.
+    """
+    snapshot = {}
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            stat = os.stat(path)
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def get_changed_paths(old: dict[str, tuple[int, int]], new: dict[str, tuple[int, int]]) -> list[str]:
+    """
+    Get sorted paths of added, modified and deleted files between two snapshots.
+    """
+    return sorted(path for path in old.keys() | new.keys() if old.get(path) != new.get(path))
+
+
+def get_watch_patterns(config: dict) -> list[str]:
+    """
+    Get glob patterns of raw data files in config (see main.PIPELINE_CONFIG).
+    """
+    root_dir = config["root_dir"]
+    patterns = [os.path.join(root_dir, config["age_group_raw_paths"])]
+    if config.get("regeneration_cutting_raw_path") is not None:
+        patterns += [os.path.join(root_dir, config["regeneration_cutting_raw_path"])]
+    return patterns
+
+
+def wait_for_changes(
+        patterns: list[str],
+        snapshot: dict[str, tuple[int, int]],
+        interval: float = DEFAULT_INTERVAL) -> tuple[dict[str, tuple[int, int]], list[str]]:
+    """
+    Poll files matching patterns every interval seconds until they differ from snapshot
+    and are unchanged for one more interval (so that files that are still being written are not read).
+    Return new snapshot and changed paths.
+    """
+    while True:
+        time.sleep(interval)
+        new_snapshot = get_snapshot(patterns)
+        if new_snapshot == snapshot:
+            continue
+        time.sleep(interval)
+        if get_snapshot(patterns) == new_snapshot:
+            return new_snapshot, get_changed_paths(snapshot, new_snapshot)
+
+
+def rebuild(config: dict, profiler: profiling.Profiler | None = None) -> list[dag.PlanStep]:
+    """
+    Run stale pipeline DAG nodes (see pipeline.get_dag_nodes): only nodes that depend on changed raw files
+    (e.g. the tree species of a changed export) are run. Print the nodes that are run.
+    Return steps of the nodes that were run or loaded.
+    """
+    runner = pipeline.get_dag_runner(config, profiler)
+    plan = runner.get_plan()
+    steps = [step for step in plan if step.action != dag.SKIP]
+    runner.print_plan(steps)
+    runner.run(plan)
+    return steps
+
+
+def watch(config: dict, interval: float = DEFAULT_INTERVAL, print_report: bool = True) -> None:
+    """
+    Bring pipeline outputs up to date and rebuild affected outputs whenever raw data files change (see rebuild).
+    Errors of a rebuild (e.g. an invalid export) are printed and watching continues. Stop with Ctrl+C.
+    """
+    patterns = get_watch_patterns(config)
+    snapshot = get_snapshot(patterns)
+    changed_paths = sorted(snapshot)
+    while True:
+        print(f"{len(changed_paths)} raw data files changed:", *[os.path.basename(path) for path in changed_paths], sep="\n  ")
+        profiler = profiling.Profiler(explain=config.get("explain_query_plans", False))
+        start = time.perf_counter()
+        try:
+            rebuild(config, profiler)
+            print(f"Rebuilt in {time.perf_counter() - start:.3f} s")
+            if print_report:
+                profiler.print_report()
+        except Exception:
+            traceback.print_exc()
+        print(f"Watching {', '.join(patterns)} (Ctrl+C to stop)")
+        snapshot, changed_paths = wait_for_changes(patterns, snapshot, interval)
@@ -0,0 +1,86 @@
+# standard
+import os
+import sys
+# external
+import polars as pl
+from polars import col
+from polars.testing import assert_frame_equal
+import pytest
+# local
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+import dimensions
+import main
+import pipeline
+import prepare_data
+
+
+#########################
+# Functions and classes #
+#########################
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SORT_FIELDS = ["DOMINANT_SPECIES", "OWNER", "TYPE", "YEAR", "AGE_GROUP"]
+
+
+@pytest.fixture(scope="module")
+def clean() -> dict[str, pl.DataFrame]:
+    """
+    Cleaned committed raw data of all tree species.
+    """
+    return pipeline.clean_raw_data(
+        os.path.join(ROOT_DIR, main.AGE_GROUP_RAW_PATHS),
+        os.path.join(ROOT_DIR, main.REGENERATION_CUTTING_RAW_PATH),
+        main.TRANSLATION_MAP,
+        main.AGE_GROUP_AGGREGATION_MAP
+    )
+
+
+def get_reference_areas(age_group: pl.DataFrame, regeneration_cutting: pl.DataFrame | None) -> pl.DataFrame:
+    """
+    Get areas with the step functions in sequence: add_unknown_data, aggregate_age_groups
+    and subtract_regeneration_cutting (if regeneration cutting data is given).
+    """
+    out = (
+        prepare_data.add_unknown_data(
+            age_group.filter(col("AGE_GROUP") != dimensions.UNKNOWN_AGE_GROUP),
+            age_group.filter(col("AGE_GROUP") == dimensions.UNKNOWN_AGE_GROUP)
+        )
+        .pipe(prepare_data.aggregate_age_groups, main.AGE_GROUP_AGGREGATION_MAP)
+    )
+    if regeneration_cutting is not None:
+        out = prepare_data.subtract_regeneration_cutting(
+            out,
+            regeneration_cutting,
+            main.REGENERATION_CUTTING_AGE_THRESHOLD,
+            dimensions.get_age_group_dimension(main.AGE_GROUP_AGGREGATION_MAP),
+            pipeline.get_slice_filter(pipeline.REGENERATION_CUTTING_SLICE)
+        )
+    return out.sort(SORT_FIELDS)
+
+
+@pytest.mark.parametrize("with_regeneration_cutting", [True, False])
+def test_prepare_areas_matches_step_functions(clean: dict[str, pl.DataFrame], with_regeneration_cutting: bool) -> None:
+    age_group = clean["age_group"]
+    regeneration_cutting = None
+    if with_regeneration_cutting:
+        regeneration_cutting_plot = pipeline.prepare_regeneration_cutting_plot_data(
+            clean["regeneration_cutting"],
+            age_group["YEAR"].min(),
+            age_group["YEAR"].max()
+        )
+        regeneration_cutting = pl.concat([regeneration_cutting_plot["protected"], regeneration_cutting_plot["production"]])
+
+    fused = prepare_data.prepare_areas(
+        age_group.lazy(),
+        main.AGE_GROUP_AGGREGATION_MAP,
+        dimensions.get_age_group_dimension(main.AGE_GROUP_AGGREGATION_MAP),
+        regeneration_cutting.lazy() if regeneration_cutting is not None else None,
+        main.REGENERATION_CUTTING_AGE_THRESHOLD,
+        pipeline.get_slice_filter(pipeline.REGENERATION_CUTTING_SLICE)
+    )
+    assert_frame_equal(
+        fused.collect().sort(SORT_FIELDS),
+        get_reference_areas(age_group, regeneration_cutting),
+        check_exact=True
+    )